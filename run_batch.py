@@ -63,11 +63,14 @@ def run_docker_container(process_num):
         f"-e=OPENAI_API_KEY={os.environ.get('OPENAI_API_KEY', '')}",
         f"-e=QDRANT_API_KEY={os.environ.get('QDRANT_API_KEY', '')}",
         f"-e=TELEMETRY_ENABLED={os.environ.get('TELEMETRY_ENABLED', 'false')}",
+        # The source data manifest is shared by all agents, and computed once
+        "-e=DATA_MANIFEST_CACHE_PATH=/home/shared_cache/data_manifest.json",
         "-e=RUN_MODE=script",
         # Volume mounts
         f"-v={os.path.abspath('data')}:/home/data",
         f"-v={os.path.abspath('scripts')}:/home/scripts",
         f"-v={os.path.abspath(f'agent_workspace/{process_num}')}:/home/agent_workspace",
+        f"-v={os.path.abspath('agent_workspace/shared_cache')}:/home/shared_cache",
         # Image name
         "catalystneuro_agent"
     ]
@@ -305,6 +308,7 @@ def main():
 
     # Create base agent_workspace directory if it doesn't exist
     Path("agent_workspace").mkdir(exist_ok=True)
+    Path("agent_workspace/shared_cache").mkdir(exist_ok=True)
 
     # Create and start the processes
     print(f"Starting {args.num_processes} agent containers...")
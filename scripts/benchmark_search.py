@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+# The benchmark never calls the real services, but importing the tools package requires these keys
+for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "QDRANT_API_KEY"):
+    os.environ.setdefault(key, "offline-benchmark")
+
+from qdrant_client import models
+
+from benchmarks.dataset import build_corpus, build_queries
+from benchmarks.fakes import FakeLiteLLM, LatencyQdrantClient, fake_embedding, install_fake_litellm
+
+
+COLLECTION_NAME = "neuroconv_benchmark"
+VECTOR_NAMES = ["content", "summary"]
+EMBEDDING_DIM = 64
+
+
+async def create_collection(client: LatencyQdrantClient) -> None:
+    """Create the benchmark collection and index the synthetic corpus with the fake embeddings."""
+    from tools.ingestion import write_version_marker
+
+    await client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config={
+            name: models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE)
+            for name in VECTOR_NAMES
+        },
+    )
+    corpus = build_corpus()
+    await client.upsert(
+        collection_name=COLLECTION_NAME,
+        points=[
+            models.PointStruct(
+                id=i,
+                vector={
+                    "content": fake_embedding(chunk["content"], EMBEDDING_DIM),
+                    "summary": fake_embedding(f"{chunk['source_file']} {chunk['content'][:80]}", EMBEDDING_DIM),
+                },
+                payload=chunk,
+            )
+            for i, chunk in enumerate(corpus)
+        ],
+    )
+    await write_version_marker(client, COLLECTION_NAME, {str(i) for i in range(len(corpus))})
+
+
+async def run_benchmark(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    from tools.semantic_search import search, search_batch
+    from tools.local_index import sync_collection, get_collection_version, LocalVectorIndex
+    from utils.metrics import MetricsRecorder, load_records, percentile, set_metrics, summarize
+    from utils.response_cache import SemanticResponseCache
+
+    fake_llm = FakeLiteLLM(
+        embedding_latency=args.embedding_latency,
+        completion_latency=args.completion_latency,
+        token_latency=args.token_latency,
+        dim=EMBEDDING_DIM,
+    )
+    install_fake_litellm(fake_llm)
+
+    qdrant_client = LatencyQdrantClient(latency=args.qdrant_latency)
+    await create_collection(qdrant_client)
+    if args.backend == "local":
+        await sync_collection(client=qdrant_client, collection_name=COLLECTION_NAME, output_dir=workdir / "index")
+        client = LocalVectorIndex(workdir / "index")
+    else:
+        client = qdrant_client
+    # Cached by the specialist tool along with the vector names, see NeuroconvSpecialistTool._fetch_schema
+    collection_versions = {COLLECTION_NAME: await get_collection_version(client, COLLECTION_NAME)}
+    qdrant_client.calls.clear()
+
+    metrics_path = workdir / "metrics.jsonl"
+    set_metrics(MetricsRecorder(path=metrics_path))
+    response_cache = SemanticResponseCache(path=workdir / "responses.sqlite3") if args.response_cache else None
+
+    queries = build_queries()[:args.queries]
+    search_kwargs = dict(
+        qdrant_url="",
+        collection_name=COLLECTION_NAME,
+        return_digest_summary=not args.no_summary,
+        client=client,
+        vector_names=VECTOR_NAMES,
+        collection_versions=collection_versions,
+        backend=args.backend,
+        local_index_path=str(workdir / "index"),
+        reranker=args.reranker,
+    )
+
+    latencies: List[float] = []
+    for _ in range(args.repeats):
+        if args.mode == "batch":
+            start_time = time.perf_counter()
+            await search_batch(queries=queries, **search_kwargs)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+        else:
+            for q in queries:
+                start_time = time.perf_counter()
+                await search(query=q["query"], context=q["context"], response_cache=response_cache, **search_kwargs)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+
+    n_queries = len(queries) * args.repeats
+    round_trips = {f"llm_{name}": count / n_queries for name, count in fake_llm.calls.items()}
+    round_trips.update({f"qdrant_{name}": count / n_queries for name, count in qdrant_client.calls.items()})
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "max_regression")},
+        "end_to_end_ms": {
+            "runs": len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "mean": sum(latencies) / len(latencies),
+            "per_query_mean": sum(latencies) / n_queries,
+        },
+        "round_trips_per_query": round_trips,
+        "total_round_trips_per_query": sum(round_trips.values()),
+        "tokens_per_query": {name: count / n_queries for name, count in fake_llm.tokens.items()},
+        "stages": summarize(load_records(metrics_path)),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    e2e = report["end_to_end_ms"]
+    print(f"End to end ({e2e['runs']} runs): p50 {e2e['p50']:.1f} ms, p95 {e2e['p95']:.1f} ms, "
+          f"mean {e2e['mean']:.1f} ms, mean per query {e2e['per_query_mean']:.1f} ms")
+    print(f"Round trips per query: {report['total_round_trips_per_query']:.2f} "
+          f"({', '.join(f'{k}={v:.2f}' for k, v in sorted(report['round_trips_per_query'].items()))})")
+    print(f"Tokens per query: {', '.join(f'{k}={v:.0f}' for k, v in sorted(report['tokens_per_query'].items()))}")
+    print(f"{'stage':<20}{'count':>8}{'p50_ms':>10}{'p95_ms':>10}{'mean_ms':>10}")
+    for name, stats in sorted(report["stages"].items(), key=lambda x: x[1]["p95_ms"], reverse=True):
+        print(f"{name:<20}{stats['count']:>8}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['mean_ms']:>10.1f}")
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Return the metrics that regressed by more than `max_regression` (relative) against a baseline report."""
+    checks = {
+        "end_to_end p50": (report["end_to_end_ms"]["p50"], baseline["end_to_end_ms"]["p50"]),
+        "end_to_end p95": (report["end_to_end_ms"]["p95"], baseline["end_to_end_ms"]["p95"]),
+        "round trips per query": (report["total_round_trips_per_query"], baseline["total_round_trips_per_query"]),
+    }
+    return [
+        f"{name}: {value:.2f} vs baseline {baseline_value:.2f}"
+        for name, (value, baseline_value) in checks.items()
+        if value > baseline_value * (1 + max_regression)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the semantic search pipeline offline, against a local in-memory Qdrant and a fake "
+                    "litellm backend with injected latency"
+    )
+    parser.add_argument("--mode", choices=["single", "batch"], default="single", help="search() per query or one search_batch()")
+    parser.add_argument("--backend", choices=["qdrant", "local"], default="qdrant", help="Vector search backend")
+    parser.add_argument("--reranker", choices=["embedding", "cross-encoder", "none"], default="embedding", help="Rerank stage")
+    parser.add_argument("--queries", type=int, default=8, help="Number of queries of the fixed query set to run")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of passes over the query set")
+    parser.add_argument("--no-summary", action="store_true", help="Skip the rerank and summary stages")
+    parser.add_argument("--embedding-cache", action="store_true", help="Enable the on-disk embedding cache")
+    parser.add_argument("--response-cache", action="store_true", help="Enable the semantic response cache")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embedding request")
+    parser.add_argument("--completion-latency", type=float, default=0.5, help="Seconds per completion request")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds per streamed completion chunk")
+    parser.add_argument("--qdrant-latency", type=float, default=0.03, help="Seconds per Qdrant request")
+    parser.add_argument("--output", type=str, default=None, help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Relative regression tolerated against the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="search_benchmark_") as tmp:
+        workdir = Path(tmp)
+        # Caches live in the temporary directory so that runs never share state
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "true" if args.embedding_cache else "false"
+        os.environ["EMBEDDING_CACHE_PATH"] = str(workdir / "embeddings.sqlite3")
+        # The fake backend never throttles, client-side rate limits would only add noise
+        os.environ.setdefault("LLM_RATE_LIMIT_RPM", "0")
+        os.environ.setdefault("EMBEDDING_RATE_LIMIT_RPM", "0")
+        report = asyncio.run(run_benchmark(args, workdir))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions against baseline:\n" + "\n".join(f"- {r}" for r in regressions))
+            sys.exit(1)
+        print("No regression against baseline")
@@ -0,0 +1,83 @@
+from typing import Any, Dict, List
+
+
+INTERFACES = [
+    ("SpikeGLXRecordingInterface", "ecephys", "SpikeGLX .bin and .meta files recorded with Neuropixels probes"),
+    ("OpenEphysRecordingInterface", "ecephys", "Open Ephys binary or legacy recordings"),
+    ("BlackrockRecordingInterface", "ecephys", "Blackrock .ns1-.ns6 continuous recordings"),
+    ("IntanRecordingInterface", "ecephys", "Intan .rhd and .rhs files"),
+    ("PhySortingInterface", "ecephys", "Phy spike sorting output folders"),
+    ("KiloSortSortingInterface", "ecephys", "Kilosort spike sorting output folders"),
+    ("ScanImageImagingInterface", "ophys", "ScanImage multi-plane TIFF stacks"),
+    ("Suite2pSegmentationInterface", "ophys", "Suite2p segmentation output"),
+    ("TiffImagingInterface", "ophys", "generic multi-page TIFF imaging data"),
+    ("DeepLabCutInterface", "behavior", "DeepLabCut pose estimation .h5 or .csv output"),
+    ("VideoInterface", "behavior", "behavior videos in .avi or .mp4 format"),
+    ("AudioInterface", "behavior", "audio recordings in .wav format"),
+]
+
+TEMPLATES = [
+    (
+        "docs",
+        "The {name} converts {description} to NWB. Install the {modality} extras with "
+        "`pip install neuroconv[{modality}]` and pass the file path to the interface.",
+    ),
+    (
+        "code",
+        "class {name}(BaseDataInterface):\n    \"\"\"Data interface for {description}.\"\"\"\n\n"
+        "    def __init__(self, file_path, verbose=True):\n        super().__init__(file_path=file_path)\n",
+    ),
+    (
+        "code",
+        "interface = {name}(file_path=file_path)\nmetadata = interface.get_metadata()\n"
+        "metadata['NWBFile'].update(session_start_time=session_start_time)\n"
+        "interface.run_conversion(nwbfile_path=nwbfile_path, metadata=metadata)",
+    ),
+    (
+        "docs",
+        "{name} metadata: the {modality} metadata extracted from {description} can be edited "
+        "before writing, e.g. electrode locations, device names or imaging plane descriptions.",
+    ),
+    (
+        "docs",
+        "To combine {name} with other streams, add it to an NWBConverter `data_interface_classes` "
+        "dictionary and align the timestamps of each stream with `set_aligned_starting_time`.",
+    ),
+]
+
+QUERIES = [
+    ("How to convert SpikeGLX data to NWB", "I have Neuropixels recordings from SpikeGLX"),
+    ("SpikeGLXRecordingInterface metadata", "I need to set electrode locations for a Neuropixels probe"),
+    ("Convert Phy sorting output", "The lab sorted the spikes with Kilosort and curated them in Phy"),
+    ("Add behavior video to NWB", "The session also has an .avi camera recording"),
+    ("DeepLabCutInterface pose estimation", "Pose estimation was run on the behavior videos"),
+    ("Suite2p segmentation to NWB", "Two-photon imaging processed with Suite2p"),
+    ("Align timestamps of multiple streams", "Ephys and behavior were recorded on different clocks"),
+    ("Open Ephys binary format", "Recordings from an Open Ephys acquisition board"),
+]
+
+
+def build_corpus() -> List[Dict[str, Any]]:
+    """Build a deterministic synthetic corpus of NeuroConv-like doc and code chunks.
+
+    Returns:
+        List of chunk payloads with `content`, `source_file` and `chunk_type` fields
+    """
+    chunks = []
+    for name, modality, description in INTERFACES:
+        for i, (chunk_type, template) in enumerate(TEMPLATES):
+            chunks.append(
+                {
+                    "content": template.format(name=name, modality=modality, description=description),
+                    "source_file": f"src/neuroconv/datainterfaces/{modality}/{name.lower()}.py"
+                    if chunk_type == "code"
+                    else f"docs/conversion_examples/{modality}/{name.lower()}_{i}.rst",
+                    "chunk_type": chunk_type,
+                }
+            )
+    return chunks
+
+
+def build_queries() -> List[Dict[str, str]]:
+    """Return the fixed benchmark query set as {"query", "context"} dictionaries."""
+    return [{"query": query, "context": context} for query, context in QUERIES]
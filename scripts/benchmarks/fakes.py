@@ -0,0 +1,150 @@
+import re
+import zlib
+import asyncio
+from types import SimpleNamespace
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+
+def count_words(text: str) -> int:
+    """Rough token count used by the fake backends."""
+    return len(WORD_PATTERN.findall(text))
+
+
+def fake_embedding(text: str, dim: int = 64) -> List[float]:
+    """Deterministic bag-of-words embedding: the normalized sum of one seeded random vector per word.
+
+    Texts sharing words get similar vectors, so retrieval over the fake embeddings behaves like
+    a (weak) semantic search and results are stable across runs and machines.
+    """
+    vector = np.zeros(dim, dtype=np.float64)
+    for word in WORD_PATTERN.findall(text.lower()):
+        vector += np.random.default_rng(zlib.crc32(word.encode())).standard_normal(dim)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class FakeLiteLLM:
+    """Stand-in for litellm's `aembedding` and `acompletion` with deterministic responses and injected latency.
+
+    Counts remote calls and tokens per call type, so runs can be compared on round trips as
+    well as latency.
+    """
+
+    def __init__(
+        self,
+        embedding_latency: float = 0.05,
+        completion_latency: float = 0.5,
+        token_latency: float = 0.0,
+        dim: int = 64,
+    ):
+        """
+        Args:
+            embedding_latency: Seconds per embedding request
+            completion_latency: Seconds per completion request, before the first token when streaming
+            token_latency: Seconds per streamed completion chunk
+            dim: Embedding dimension
+        """
+        self.embedding_latency = embedding_latency
+        self.completion_latency = completion_latency
+        self.token_latency = token_latency
+        self.dim = dim
+        self.calls: Counter = Counter()
+        self.tokens: Counter = Counter()
+
+    async def aembedding(self, model: str, input: List[str], **kwargs) -> Any:
+        self.calls["embedding"] += 1
+        self.tokens["embedding"] += sum(count_words(t) for t in input)
+        await asyncio.sleep(self.embedding_latency)
+        return SimpleNamespace(
+            data=[{"embedding": fake_embedding(t, self.dim)} for t in input],
+            usage=SimpleNamespace(prompt_tokens=sum(count_words(t) for t in input), completion_tokens=0, total_tokens=0),
+        )
+
+    def _respond(self, prompt: str) -> str:
+        if "alternative queries" in prompt:
+            query = re.search(r"Original Query: (.*)\nContext", prompt.split("User Input:")[-1]).group(1)
+            words = query.split()
+            return f"{' '.join(words[:4])} NeuroConv\nNWB conversion {' '.join(words[-3:])}"
+        n_results = prompt.count("\n- ")
+        return f"NeuroConv answer synthesized from {n_results} search results. " + "Use the interface. " * 40
+
+    async def acompletion(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs) -> Any:
+        prompt = "\n".join(m["content"] for m in messages)
+        content = self._respond(prompt)
+        usage = SimpleNamespace(
+            prompt_tokens=count_words(prompt),
+            completion_tokens=count_words(content),
+            total_tokens=count_words(prompt) + count_words(content),
+        )
+        self.calls["completion"] += 1
+        self.tokens["prompt"] += usage.prompt_tokens
+        self.tokens["completion"] += usage.completion_tokens
+        await asyncio.sleep(self.completion_latency)
+
+        if not stream:
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=usage,
+            )
+
+        async def chunks():
+            words = content.split(" ")
+            for i in range(0, len(words), 4):
+                await asyncio.sleep(self.token_latency)
+                delta = " ".join(words[i:i + 4]) + " "
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+
+        return chunks()
+
+
+class LatencyQdrantClient(AsyncQdrantClient):
+    """Local in-memory Qdrant with injected latency on every remote-call method used by the search pipeline."""
+
+    def __init__(self, latency: float = 0.03, **kwargs):
+        """
+        Args:
+            latency: Seconds added to each call
+            **kwargs: AsyncQdrantClient arguments, defaults to an in-memory instance
+        """
+        kwargs.setdefault("location", ":memory:")
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def _remote_call(self, method: str, *args, **kwargs) -> Any:
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        return await getattr(super(), method)(*args, **kwargs)
+
+    async def get_collection(self, *args, **kwargs):
+        return await self._remote_call("get_collection", *args, **kwargs)
+
+    async def search(self, *args, **kwargs):
+        return await self._remote_call("search", *args, **kwargs)
+
+    async def query_batch_points(self, *args, **kwargs):
+        return await self._remote_call("query_batch_points", *args, **kwargs)
+
+    async def scroll(self, *args, **kwargs):
+        return await self._remote_call("scroll", *args, **kwargs)
+
+    async def retrieve(self, *args, **kwargs):
+        return await self._remote_call("retrieve", *args, **kwargs)
+
+
+def install_fake_litellm(fake: FakeLiteLLM, modules: Optional[List[Any]] = None) -> None:
+    """Point the litellm functions imported by the search pipeline modules at a fake backend."""
+    from tools import semantic_search
+
+    for module in modules or [semantic_search]:
+        module.aembedding = fake.aembedding
+        module.acompletion = fake.acompletion
+    semantic_search.get_instructor_client.cache_clear()
@@ -0,0 +1,86 @@
+import os
+import json
+import asyncio
+import argparse
+from qdrant_client import AsyncQdrantClient
+
+from utils.logger import set_logger
+from tools.ingestion import DEFAULT_SOURCE_CACHE_DIR, NEUROCONV_REPO_URL, checkout_neuroconv, chunk_repository, ingest_chunks
+from tools.embedding_backends import DEFAULT_EMBEDDING_MODEL
+
+
+# Configure logging
+logger = set_logger(name=__name__)
+
+
+async def main(args: argparse.Namespace):
+    source_dir = args.source_dir or checkout_neuroconv(
+        args.version, cache_dir=args.source_cache_dir, repo_url=args.repo_url
+    )
+    chunks = await asyncio.to_thread(chunk_repository, source_dir, args.max_chars)
+    logger.info(f"Chunked {source_dir} into {len(chunks)} chunks")
+
+    client = AsyncQdrantClient(url=args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"), timeout=120.0)
+    try:
+        stats = await ingest_chunks(
+            client=client,
+            collection_name=args.collection,
+            chunks=chunks,
+            vector_names=args.vector_names.split(","),
+            embedding_model=args.embedding_model,
+            embedding_batch_size=args.embedding_batch_size,
+            max_concurrency=args.max_concurrency,
+            upsert_batch_size=args.upsert_batch_size,
+            delete_stale=args.delete_stale,
+            dry_run=args.dry_run,
+        )
+    finally:
+        await client.close()
+    print(json.dumps(stats.to_dict(), indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build or incrementally refresh the NeuroConv vector collection from the NeuroConv docs and source"
+    )
+    parser.add_argument("--version", type=str, default="0.7.3", help="NeuroConv release to ingest")
+    parser.add_argument(
+        "--repo-url",
+        type=str,
+        default=NEUROCONV_REPO_URL,
+        help="Repository to clone, e.g. https://github.com/NeurodataWithoutBorders/pynwb to build a pynwb collection "
+             "searched along with the NeuroConv one (use with --collection)",
+    )
+    parser.add_argument("--source-dir", type=str, default=None, help="Existing NeuroConv checkout, instead of cloning --version")
+    parser.add_argument("--source-cache-dir", type=str, default=DEFAULT_SOURCE_CACHE_DIR, help="Directory releases are cloned into")
+    parser.add_argument("--qdrant-url", type=str, required=True, help="Qdrant URL")
+    parser.add_argument(
+        "--collection",
+        type=str,
+        required=True,
+        help="Collection to create or update. The specialist tool searches the collection paired with its embedding "
+             "model (neuroconv for the default OpenAI model, neuroconv_all_minilm_l6_v2 for "
+             "local/sentence-transformers/all-MiniLM-L6-v2): build a new collection and point the tool to it "
+             "rather than updating the live one",
+    )
+    parser.add_argument("--vector-names", type=str, default="content,context", help="Comma-separated named vectors to embed")
+    parser.add_argument(
+        "--embedding-model",
+        type=str,
+        default=DEFAULT_EMBEDDING_MODEL,
+        help="Embedding model, a litellm model or local/<sentence-transformers model> to embed on CPU",
+    )
+    parser.add_argument("--max-chars", type=int, default=2000, help="Maximum number of characters per chunk")
+    parser.add_argument("--embedding-batch-size", type=int, default=256, help="Number of texts per embedding request")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Maximum number of requests in flight")
+    parser.add_argument("--upsert-batch-size", type=int, default=256, help="Number of points per upsert request")
+    parser.add_argument(
+        "--delete-stale",
+        action="store_true",
+        help="Delete the points of removed or changed chunks. Points written by another ingestion are stale too: "
+             "check their count with --dry-run first",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be embedded and deleted")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -17,11 +17,13 @@ from tools.file_system_tools import (
     WriteToFileTool,
     ReadFileTool,
     ReplaceInFileTool,
+    ApplyPatchTool,
     SearchFilesTool,
     ListFilesTool,
     DirectoryTreeTool,
 )
 from tools.cli_tools import ExecuteCommandInTerminalTool
+from tools.data_manifest_tool import DataManifestTool
 
 # Telemetry
 if os.getenv("TELEMETRY_ENABLED", "false").lower() == "true":
@@ -47,12 +49,14 @@ neuroconv_tool = NeuroconvSpecialistTool(
 write_to_file_tool = WriteToFileTool(work_dir=working_dir)
 read_file_tool = ReadFileTool(work_dir=working_dir)
 replace_in_file_tool = ReplaceInFileTool(work_dir=working_dir)
+apply_patch_tool = ApplyPatchTool(work_dir=working_dir)
 search_files_tool = SearchFilesTool(work_dir=working_dir)
 list_files_tool = ListFilesTool(work_dir=working_dir)
 directory_tree_tool = DirectoryTreeTool(work_dir=working_dir)
 execute_command_tool = ExecuteCommandInTerminalTool(allowed_dirs=[working_dir])
 create_nwb_repo_tool = CreateNWBRepoTool()
 nwb_inspector_tool = NWBInspectorTool()
+data_manifest_tool = DataManifestTool()
 
 # Agents
 logger.info("Initializing agents...")
@@ -64,10 +68,12 @@ nwb_specialist_agent = ToolCallingAgent(
         write_to_file_tool,
         read_file_tool,
         replace_in_file_tool,
+        apply_patch_tool,
         search_files_tool,
         list_files_tool,
         directory_tree_tool,
         execute_command_tool,
+        data_manifest_tool,
         neuroconv_tool,
         create_nwb_repo_tool,
         DuckDuckGoSearchTool(),
@@ -16,12 +16,14 @@ from tools.file_system_tools import (
     WriteToFileTool,
     ReadFileTool,
     ReplaceInFileTool,
+    ApplyPatchTool,
     SearchFilesTool,
     ListFilesTool,
     DirectoryTreeTool,
 )
 from tools.cli_tools import ExecuteCommandInTerminalTool
 from tools.memory_bank_tool import MemoryBankTool
+from tools.data_manifest_tool import DataManifestTool
 from ui.gradio_ui import GradioUI
 from utils.litellm_router import LiteLLMRouter
 
@@ -51,6 +53,7 @@ working_dir = "/home/agent_workspace"
 write_to_file_tool = WriteToFileTool(work_dir=working_dir)
 read_file_tool = ReadFileTool(work_dir=working_dir)
 replace_in_file_tool = ReplaceInFileTool(work_dir=working_dir)
+apply_patch_tool = ApplyPatchTool(work_dir=working_dir)
 search_files_tool = SearchFilesTool(work_dir=working_dir)
 list_files_tool = ListFilesTool(work_dir=working_dir)
 directory_tree_tool = DirectoryTreeTool(work_dir=working_dir)
@@ -58,6 +61,7 @@ execute_command_tool = ExecuteCommandInTerminalTool(allowed_dirs=[working_dir])
 
 create_nwb_repo_tool = CreateNWBRepoTool()
 nwb_inspector_tool = NWBInspectorTool()
+data_manifest_tool = DataManifestTool()
 neuroconv_specialist_tool = NeuroconvSpecialistTool(
     return_digest_summary=False,
     llm_model="openrouter/openai/o3-mini",
@@ -155,10 +159,12 @@ agent = CodeAgent(
         write_to_file_tool,
         read_file_tool,
         replace_in_file_tool,
+        apply_patch_tool,
         search_files_tool,
         list_files_tool,
         directory_tree_tool,
         execute_command_tool,
+        data_manifest_tool,
         create_nwb_repo_tool,
         nwb_inspector_tool,
         neuroconv_specialist_tool,
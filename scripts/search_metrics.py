@@ -0,0 +1,43 @@
+import os
+import time
+import argparse
+
+from utils.metrics import DEFAULT_METRICS_PATH, load_records, summarize
+
+
+def print_summary(summary: dict) -> None:
+    columns = ["count", "errors", "p50_ms", "p95_ms", "mean_ms"]
+    print(f"{'stage':<24}" + "".join(f"{c:>10}" for c in columns) + "  counters (mean per run)")
+    for name, stats in sorted(summary.items(), key=lambda x: x[1]["p95_ms"], reverse=True):
+        counters = ", ".join(
+            f"{key[len('mean_'):]}={value:.1f}"
+            for key, value in stats.items()
+            if key.startswith("mean_") and key != "mean_ms"
+        )
+        print(
+            f"{name:<24}"
+            + f"{stats['count']:>10}{stats['errors']:>10}"
+            + "".join(f"{stats[c]:>10.1f}" for c in columns[2:])
+            + f"  {counters}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarize the per-stage latency and counters of the semantic search pipeline"
+    )
+    parser.add_argument(
+        "--path",
+        type=str,
+        default=os.getenv("SEARCH_METRICS_PATH", DEFAULT_METRICS_PATH),
+        help="JSONL metrics file",
+    )
+    parser.add_argument("--last-hours", type=float, default=None, help="Only summarize the records of the last N hours")
+    args = parser.parse_args()
+
+    since = time.time() - args.last_hours * 3600 if args.last_hours is not None else None
+    records = load_records(args.path, since=since)
+    if not records:
+        print(f"No records in {args.path}")
+    else:
+        print_summary(summarize(records))
@@ -0,0 +1,56 @@
+import os
+import asyncio
+import argparse
+from qdrant_client import AsyncQdrantClient
+
+from utils.logger import set_logger
+from tools.local_index import DEFAULT_LOCAL_INDEX_PATH, sync_collection
+from tools.neuroconv_config import COLLECTION_NAME, QDRANT_URL
+from tools.embedding_backends import DEFAULT_EMBEDDING_MODEL, collection_for_model
+
+
+# Configure logging
+logger = set_logger(name=__name__)
+
+
+async def main(qdrant_url: str, collection_name: str, output_dir: str, batch_size: int):
+    client = AsyncQdrantClient(url=qdrant_url, api_key=os.getenv("QDRANT_API_KEY"), timeout=120.0)
+    try:
+        await sync_collection(
+            client=client,
+            collection_name=collection_name,
+            output_dir=output_dir,
+            batch_size=batch_size,
+        )
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Snapshot a Qdrant collection into a local index used by the NeuroConv specialist tool"
+    )
+    parser.add_argument("--qdrant-url", type=str, default=QDRANT_URL, help="Qdrant URL")
+    parser.add_argument(
+        "--embedding-model",
+        type=str,
+        default=os.getenv("NEUROCONV_SPECIALIST_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+        help="Query embedding model of the specialist tool, selecting the collection indexed with it",
+    )
+    parser.add_argument(
+        "--collection",
+        type=str,
+        default=None,
+        help="Collection name (default: the NeuroConv collection of the embedding model)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX_PATH),
+        help="Directory of the local index",
+    )
+    parser.add_argument("--batch-size", type=int, default=256, help="Number of points fetched per request")
+    args = parser.parse_args()
+
+    collection_name = args.collection or collection_for_model(COLLECTION_NAME, args.embedding_model)
+    asyncio.run(main(args.qdrant_url, collection_name, args.output_dir, args.batch_size))
@@ -3,6 +3,7 @@ from .file_system_tools import (
     WriteToFileTool,
     ReadFileTool,
     ReplaceInFileTool,
+    ApplyPatchTool,
     SearchFilesTool,
     ListFilesTool,
     DeleteFileTool,
@@ -12,12 +13,14 @@ from .git_repo_tools import CreateNWBRepoTool
 from .neuroconv_specialist_tool import NeuroconvSpecialistTool
 from .nwbinspector_tool import NWBInspectorTool
 from .memory_bank_tool import MemoryBankTool
+from .data_manifest_tool import DataManifestTool
 
 __all__ = [
     "ExecuteCommandInTerminalTool",
     "WriteToFileTool",
     "ReadFileTool",
     "ReplaceInFileTool",
+    "ApplyPatchTool",
     "SearchFilesTool",
     "ListFilesTool",
     "DeleteFileTool",
@@ -26,4 +29,5 @@ __all__ = [
     "NeuroconvSpecialistTool",
     "NWBInspectorTool",
     "MemoryBankTool",
+    "DataManifestTool",
 ]
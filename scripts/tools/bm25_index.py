@@ -0,0 +1,245 @@
+import re
+import math
+import time
+import asyncio
+from pathlib import Path
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from qdrant_client import AsyncQdrantClient
+
+from .local_index import VERSION_MARKER_ID, LocalVectorIndex, get_collection_version, load_local_index
+from .search_filters import PayloadFilter
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+CAMEL_CASE_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize text for sparse search.
+
+    Each word is kept whole (lowercased) so exact API names match, and identifiers are also
+    split into their CamelCase/snake_case parts so partial names match too, e.g.
+    `SpikeGLXRecordingInterface` -> spikeglxrecordinginterface, spike, glx, recording, interface.
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        tokens.append(word.lower())
+        parts = [p.lower() for piece in word.split("_") for p in CAMEL_CASE_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def extract_identifiers(text: str) -> List[str]:
+    """Extract code identifiers (CamelCase or snake_case words) from free text."""
+    identifiers = []
+    for word in WORD_PATTERN.findall(text):
+        is_camel_case = any(c.isupper() for c in word[1:]) and any(c.islower() for c in word)
+        is_snake_case = "_" in word.strip("_")
+        if is_camel_case or is_snake_case:
+            identifiers.append(word)
+    return list(dict.fromkeys(identifiers))
+
+
+class BM25Index:
+    """Inverted BM25 index over chunk payloads."""
+
+    def __init__(
+        self,
+        ids: List[str],
+        payloads: List[Dict[str, Any]],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        """
+        Build the index.
+
+        Args:
+            ids: Point IDs
+            payloads: Point payloads, with at least a `content` field
+            k1: BM25 term frequency saturation parameter
+            b: BM25 document length normalization parameter
+        """
+        self.ids = ids
+        self.payloads = payloads
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        for doc_idx, payload in enumerate(payloads):
+            text = f"{payload.get('content', '')} {payload.get('source_file', '')}"
+            term_counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings[term].append((doc_idx, count))
+
+        n_docs = len(payloads)
+        self.avg_doc_length = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query: str, limit: int = 10, payload_filter: Optional[PayloadFilter] = None) -> List[Dict[str, Any]]:
+        """
+        Score documents against a query with BM25.
+
+        Args:
+            query: Query text or space-separated keywords
+            limit: Maximum number of results
+            payload_filter: Optional restriction to chunk types and source file prefixes
+
+        Returns:
+            List of search results, in the same format as `semantic_search.search_vectors`
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_idx, tf in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_idx] / (self.avg_doc_length or 1.0)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        if payload_filter is not None:
+            scores = {i: score for i, score in scores.items() if payload_filter.matches(self.payloads[i])}
+        top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+        return [
+            {
+                "id": self.ids[doc_idx],
+                "score": score,
+                "content": self.payloads[doc_idx].get("content", ""),
+                "file": self.payloads[doc_idx].get("source_file", ""),
+                "type": self.payloads[doc_idx].get("chunk_type", ""),
+                "context": self.payloads[doc_idx].get("context"),
+            }
+            for doc_idx, score in top
+        ]
+
+
+async def fetch_payloads(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    batch_size: int = 512,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Scroll all point IDs and payloads (without vectors) of a Qdrant collection."""
+    ids: List[str] = []
+    payloads: List[Dict[str, Any]] = []
+    offset = None
+    while True:
+        records, offset = await client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        records = [r for r in records if str(r.id) != VERSION_MARKER_ID]
+        ids.extend(str(r.id) for r in records)
+        payloads.extend(r.payload or {} for r in records)
+        if offset is None:
+            break
+    return ids, payloads
+
+
+# Seconds during which a built index is served without checking the version of its collection
+VERSION_CHECK_INTERVAL = 60.0
+
+# Collection name -> (collection version, time of the last version check, index)
+_bm25_indexes: Dict[str, Tuple[str, float, BM25Index]] = {}
+# (event loop, collection name) -> lock of the index build, as asyncio locks are bound to a loop
+_bm25_locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+
+
+async def get_bm25_index(
+    client: Any,
+    collection_name: str,
+    local_index_path: Optional[str] = None,
+) -> BM25Index:
+    """
+    Return the BM25 index of a collection, rebuilt when the collection changes.
+
+    The index is built from the local mirror when one is in use or exists at `local_index_path`,
+    otherwise from the payloads of the remote collection. The collection version (see
+    `local_index.get_collection_version`) is checked at most every VERSION_CHECK_INTERVAL seconds,
+    and concurrent calls wait for a single build.
+
+    Args:
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+        local_index_path: Directory of the local index, if any
+
+    Returns:
+        The BM25 index
+    """
+    cached = _bm25_indexes.get(collection_name)
+    if cached is not None and time.monotonic() - cached[1] < VERSION_CHECK_INTERVAL:
+        return cached[2]
+
+    lock = _bm25_locks.setdefault((id(asyncio.get_running_loop()), collection_name), asyncio.Lock())
+    async with lock:
+        cached = _bm25_indexes.get(collection_name)
+        if cached is not None and time.monotonic() - cached[1] < VERSION_CHECK_INTERVAL:
+            return cached[2]
+
+        if isinstance(client, LocalVectorIndex):
+            local_index = client
+        elif local_index_path and (Path(local_index_path) / "manifest.json").exists():
+            local_index = load_local_index(local_index_path)
+        else:
+            local_index = None
+        if local_index is None or local_index.collection_name != collection_name:
+            local_index = None
+
+        version = await get_collection_version(local_index or client, collection_name)
+        if cached is not None and cached[0] == version:
+            _bm25_indexes[collection_name] = (version, time.monotonic(), cached[2])
+            return cached[2]
+
+        if local_index is not None:
+            ids, payloads = local_index.ids, local_index.payloads
+        else:
+            ids, payloads = await fetch_payloads(client=client, collection_name=collection_name)
+
+        index = await asyncio.to_thread(BM25Index, ids, payloads)
+        logger.info(f"Built BM25 index for collection {collection_name} ({version}) with {len(ids)} chunks")
+        _bm25_indexes[collection_name] = (version, time.monotonic(), index)
+        return index
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Any]],
+    key: Callable[[Any], Any] = lambda r: r.id,
+    k: int = 60,
+) -> List[Tuple[Any, float]]:
+    """
+    Fuse several ranked lists with reciprocal rank fusion.
+
+    Args:
+        rankings: Ranked lists of items, best first
+        key: Function returning the identity of an item across lists
+        k: RRF constant dampening the weight of top ranks
+
+    Returns:
+        List of (item, fused score) sorted by fused score. For items present in several lists,
+        the item from the first list it appears in is kept.
+    """
+    fused_scores: Dict[Any, float] = defaultdict(float)
+    items: Dict[Any, Any] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            item_key = key(item)
+            fused_scores[item_key] += 1.0 / (k + rank + 1)
+            items.setdefault(item_key, item)
+    return sorted(
+        ((items[item_key], score) for item_key, score in fused_scores.items()),
+        key=lambda x: x[1],
+        reverse=True,
+    )
@@ -0,0 +1,134 @@
+import re
+import zlib
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Set, Tuple, TYPE_CHECKING
+
+from litellm import token_counter
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+if TYPE_CHECKING:
+    from .semantic_search import SearchResult
+
+
+SHINGLE_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@dataclass
+class PackingStats:
+    """What the context packing stage kept and cut for one prompt."""
+
+    input_results: int = 0
+    duplicates_removed: int = 0
+    dropped_for_budget: int = 0
+    output_results: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def shingles(text: str, k: int = 5) -> Set[int]:
+    """Return the set of hashed k-word shingles of a text."""
+    words = SHINGLE_TOKEN_PATTERN.findall(text.lower())
+    if len(words) <= k:
+        return {zlib.crc32(" ".join(words).encode())}
+    return {zlib.crc32(" ".join(words[i:i + k]).encode()) for i in range(len(words) - k + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def containment(a: Set[int], b: Set[int]) -> float:
+    """Fraction of the smaller shingle set contained in the other one."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count tokens with the target model's tokenizer, falling back to a 4 characters per token estimate."""
+    try:
+        return token_counter(model=model, text=text)
+    except Exception:
+        return len(text) // 4 + 1
+
+
+def pack_context(
+    results: List["SearchResult"],
+    model: str,
+    max_tokens: int = 6000,
+    duplicate_threshold: float = 0.8,
+    mmr_lambda: float = 0.7,
+) -> Tuple[List["SearchResult"], PackingStats]:
+    """Select the results to send to an LLM prompt.
+
+    1. Near-duplicate removal: a result whose word shingles are mostly contained in a
+       higher-scored result (e.g. an overlapping chunk of the same source file) is dropped.
+    2. Maximal marginal relevance: results are picked greedily by
+       `mmr_lambda * relevance - (1 - mmr_lambda) * max similarity to the picked ones`.
+    3. Token budget: results are added in MMR order while they fit in `max_tokens`, counted
+       with the target model's tokenizer.
+
+    Args:
+        results: Search results, best first
+        model: Model the packed results are sent to, used to count tokens
+        max_tokens: Token budget for the packed result contents
+        duplicate_threshold: Shingle containment above which a result is a near duplicate
+        mmr_lambda: Trade-off between relevance (1.0) and diversity (0.0)
+
+    Returns:
+        Tuple of (packed results in MMR order, packing stats)
+    """
+    stats = PackingStats(input_results=len(results))
+    if not results:
+        return [], stats
+
+    ordered = sorted(results, key=lambda r: r.score, reverse=True)
+    shingle_sets = [shingles(r.content) for r in ordered]
+    token_counts = [count_tokens(r.content, model) for r in ordered]
+    stats.input_tokens = sum(token_counts)
+
+    # Near-duplicate removal, keeping the higher-scored result of each pair
+    candidates: List[int] = []
+    for i in range(len(ordered)):
+        if any(containment(shingle_sets[i], shingle_sets[j]) >= duplicate_threshold for j in candidates):
+            stats.duplicates_removed += 1
+            continue
+        candidates.append(i)
+
+    # Normalize scores to [0, 1] so they are comparable with shingle similarities
+    scores = [ordered[i].score for i in candidates]
+    min_score, max_score = min(scores), max(scores)
+    relevance = {
+        i: (ordered[i].score - min_score) / (max_score - min_score) if max_score > min_score else 1.0
+        for i in candidates
+    }
+
+    # MMR selection under the token budget
+    selected: List[int] = []
+    remaining = list(candidates)
+    used_tokens = 0
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: mmr_lambda * relevance[i]
+            - (1 - mmr_lambda) * max((jaccard(shingle_sets[i], shingle_sets[j]) for j in selected), default=0.0),
+        )
+        remaining.remove(best)
+        if used_tokens + token_counts[best] > max_tokens:
+            stats.dropped_for_budget += 1
+            continue
+        selected.append(best)
+        used_tokens += token_counts[best]
+
+    stats.output_results = len(selected)
+    stats.output_tokens = used_tokens
+    logger.info(f"Context packing stats: {stats.to_dict()}")
+    return [ordered[i] for i in selected], stats
@@ -0,0 +1,491 @@
+import os
+import ast
+import json
+import struct
+import hashlib
+from dataclasses import asdict, dataclass, field
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from .file_reader import format_size
+from .file_search import IgnoreRules
+from .patching import atomic_write
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+# Bump when the detection rules change, to invalidate the cached manifests
+MANIFEST_VERSION = 1
+DEFAULT_DATA_DIR = "/home/data"
+DEFAULT_CACHE_PATH = "/home/agent_workspace/cache/data_manifest.json"
+HEADER_BYTES = 4096
+# ScanImage writes its metadata in the first IFDs of its TIFF files
+TIFF_SNIFF_BYTES = 64 * 1024
+MAX_DETAILS_CHARS = 200
+MAX_METADATA_EXCERPT_CHARS = 600
+
+# Format -> (description, candidate NeuroConv interfaces)
+FORMATS: Dict[str, Tuple[str, List[str]]] = {
+    "spikeglx_ap": ("SpikeGLX AP band", ["SpikeGLXRecordingInterface", "SpikeGLXConverterPipe"]),
+    "spikeglx_lf": ("SpikeGLX LF band", ["SpikeGLXRecordingInterface", "SpikeGLXConverterPipe"]),
+    "spikeglx_nidq": ("SpikeGLX NIDQ", ["SpikeGLXNIDQInterface", "SpikeGLXConverterPipe"]),
+    "intan": ("Intan recording", ["IntanRecordingInterface"]),
+    "openephys_binary": ("Open Ephys binary", ["OpenEphysRecordingInterface", "OpenEphysBinaryRecordingInterface"]),
+    "openephys_legacy": ("Open Ephys legacy", ["OpenEphysRecordingInterface", "OpenEphysLegacyRecordingInterface"]),
+    "neuralynx": ("Neuralynx continuous", ["NeuralynxRecordingInterface"]),
+    "blackrock_ns": ("Blackrock continuous", ["BlackrockRecordingInterface"]),
+    "blackrock_nev": ("Blackrock events and spikes", ["BlackrockSortingInterface"]),
+    "plexon": ("Plexon", ["PlexonRecordingInterface", "PlexonSortingInterface"]),
+    "plexon2": ("Plexon2", ["Plexon2RecordingInterface"]),
+    "abf": ("Axon ABF", ["AbfInterface"]),
+    "scanimage_tiff": ("ScanImage TIFF", ["ScanImageImagingInterface"]),
+    "bruker_tiff": ("Bruker TIFF series", ["BrukerTiffSinglePlaneImagingInterface", "BrukerTiffMultiPlaneImagingInterface"]),
+    "tiff": ("TIFF", ["TiffImagingInterface"]),
+    "video": ("Video", ["ExternalVideoInterface"]),
+    "deeplabcut": ("DeepLabCut pose estimation", ["DeepLabCutInterface"]),
+    "phy": ("Phy/Kilosort sorting output", ["PhySortingInterface", "KiloSortSortingInterface"]),
+    "suite2p": ("Suite2p segmentation", ["Suite2pSegmentationInterface"]),
+    "intervals_table": ("Table of time intervals", ["CsvTimeIntervalsInterface", "ExcelTimeIntervalsInterface"]),
+    "table": ("Table", []),
+    "nwb": ("NWB file", []),
+    "hdf5": ("HDF5", []),
+    "mat": ("MATLAB", []),
+    "npy": ("NumPy array", []),
+    "raw_binary": ("Raw binary", []),
+    "json": ("JSON", []),
+    "yaml": ("YAML", []),
+    "text": ("Text", []),
+    "unknown": ("Unknown", []),
+}
+
+EXTENSION_FORMATS = {
+    ".rhd": "intan", ".rhs": "intan",
+    ".continuous": "openephys_legacy",
+    ".ncs": "neuralynx",
+    ".ns1": "blackrock_ns", ".ns2": "blackrock_ns", ".ns3": "blackrock_ns",
+    ".ns4": "blackrock_ns", ".ns5": "blackrock_ns", ".ns6": "blackrock_ns",
+    ".nev": "blackrock_nev",
+    ".plx": "plexon", ".pl2": "plexon2",
+    ".abf": "abf",
+    ".tif": "tiff", ".tiff": "tiff",
+    ".avi": "video", ".mp4": "video", ".mov": "video", ".mkv": "video", ".wmv": "video",
+    ".nwb": "nwb",
+    ".h5": "hdf5", ".hdf5": "hdf5",
+    ".mat": "mat",
+    ".npy": "npy",
+    ".bin": "raw_binary", ".dat": "raw_binary", ".raw": "raw_binary",
+    ".csv": "table", ".tsv": "table", ".xlsx": "table", ".xls": "table",
+    ".json": "json",
+    ".yaml": "yaml", ".yml": "yaml",
+    ".txt": "text", ".md": "text", ".log": "text", ".xml": "text", ".py": "text",
+}
+# Sidecar files, described by the data file they belong to
+SIDECAR_SUFFIXES = (".meta",)
+METADATA_FILE_NAMES = ("metadata.yaml", "metadata.yml")
+
+
+@dataclass
+class FileGroup:
+    """Files of a session directory sharing a format, described by their first file."""
+
+    directory: str
+    example: str
+    format: str
+    count: int = 1
+    size: int = 0
+    details: str = ""
+
+
+@dataclass
+class SessionManifest:
+    protocol: str
+    session: str
+    size: int = 0
+    files: int = 0
+    groups: List[FileGroup] = field(default_factory=list)
+    metadata: Optional[str] = None
+    metadata_keys: List[str] = field(default_factory=list)
+
+
+def _read_head(path: str, size: int = HEADER_BYTES) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(size)
+
+
+def classify(name: str) -> str:
+    """Format of a file from its name only."""
+    lower = name.lower()
+    if lower.endswith(".ap.bin"):
+        return "spikeglx_ap"
+    if lower.endswith(".lf.bin"):
+        return "spikeglx_lf"
+    if lower.endswith(".nidq.bin"):
+        return "spikeglx_nidq"
+    if lower == "structure.oebin":
+        return "openephys_binary"
+    if "dlc" in lower and lower.endswith((".h5", ".csv", ".pickle")):
+        return "deeplabcut"
+    return EXTENSION_FORMATS.get(os.path.splitext(lower)[1], "unknown")
+
+
+def _parse_spikeglx_meta(bin_path: str) -> str:
+    meta_path = bin_path[:-len(".bin")] + ".meta"
+    if not os.path.isfile(meta_path):
+        return "no .meta sidecar found"
+    meta = {}
+    with open(meta_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            key, _, value = line.strip().lstrip("~").partition("=")
+            meta[key] = value
+    rate = meta.get("imSampRate") or meta.get("niSampRate")
+    details = [
+        f"{meta.get('nSavedChans', '?')} channels",
+        f"{float(rate):.0f} Hz" if rate else None,
+        f"{float(meta['fileTimeSecs']):.1f} s" if meta.get("fileTimeSecs") else None,
+        f"probe type {meta.get('imDatPrb_type') or meta.get('imProbeOpt')}" if meta.get("imDatPrb_type") or meta.get("imProbeOpt") else None,
+    ]
+    return ", ".join(d for d in details if d)
+
+
+def _sniff_intan(path: str) -> str:
+    magic, major, minor, rate = struct.unpack("<Ihhf", _read_head(path, 12))
+    kind = {0xC6912702: "RHD", 0xD69127AC: "RHS"}.get(magic)
+    if kind is None:
+        return "unexpected header, not an Intan file?"
+    return f"Intan {kind} v{major}.{minor}, {rate:.0f} Hz"
+
+
+def _sniff_npy(path: str) -> str:
+    head = _read_head(path, HEADER_BYTES)
+    if not head.startswith(b"\x93NUMPY"):
+        return "unexpected header, not a .npy file?"
+    if head[6] == 1:
+        header_length, offset = struct.unpack("<H", head[8:10])[0], 10
+    else:
+        header_length, offset = struct.unpack("<I", head[8:12])[0], 12
+    header = ast.literal_eval(head[offset:offset + header_length].decode("latin1"))
+    return f"shape {tuple(header['shape'])}, dtype {header['descr']}"
+
+
+def _sniff_table(path: str) -> Tuple[str, Optional[str]]:
+    if path.lower().endswith((".xlsx", ".xls")):
+        return "spreadsheet", None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        header = f.readline(HEADER_BYTES).strip()
+    columns = [c.strip().strip('"') for c in header.replace("\t", ",").split(",")]
+    lowered = {c.lower() for c in columns}
+    is_intervals = "start_time" in lowered and ("stop_time" in lowered or "end_time" in lowered)
+    return f"columns: {', '.join(columns)}", "intervals_table" if is_intervals else None
+
+
+def _sniff_tiff(path: str) -> Tuple[str, Optional[str]]:
+    head = _read_head(path, TIFF_SNIFF_BYTES)
+    kind = {b"II*\x00": "TIFF", b"MM\x00*": "TIFF (big-endian)", b"II+\x00": "BigTIFF", b"MM\x00+": "BigTIFF"}.get(head[:4])
+    if kind is None:
+        return "unexpected header, not a TIFF file?", None
+    if b"SI." in head or b"scanimage" in head.lower() or b"state.configPath" in head:
+        return f"{kind} with ScanImage metadata", "scanimage_tiff"
+    return kind, None
+
+
+def _sniff_structured(path: str, loader) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = loader(f)
+    if isinstance(content, dict):
+        return f"keys: {', '.join(map(str, content))}"
+    return type(content).__name__
+
+
+def sniff(path: str, format: str) -> Tuple[str, str]:
+    """
+    Describe a file from its header or sidecar file only, refining its format when the header tells more.
+
+    Args:
+        path: File path
+        format: Format guessed from the file name, see `classify`
+
+    Returns:
+        The format and a short description
+    """
+    if format in ("spikeglx_ap", "spikeglx_lf", "spikeglx_nidq"):
+        return format, _parse_spikeglx_meta(path)
+    if format == "intan":
+        return format, _sniff_intan(path)
+    if format == "npy":
+        return format, _sniff_npy(path)
+    if format == "tiff":
+        details, refined = _sniff_tiff(path)
+        return refined or format, details
+    if format in ("table", "deeplabcut") and not path.lower().endswith((".h5", ".pickle")):
+        details, refined = _sniff_table(path)
+        return (refined if format == "table" and refined else format), details
+    if format == "openephys_binary":
+        with open(path, "r", encoding="utf-8") as f:
+            structure = json.load(f)
+        streams = [
+            f"{s.get('folder_name', '?').rstrip('/')} ({s.get('num_channels', '?')} channels, {s.get('sample_rate', '?')} Hz)"
+            for s in structure.get("continuous", [])
+        ]
+        return format, f"continuous streams: {', '.join(streams)}"
+    if format == "neuralynx":
+        for line in _read_head(path, 16 * 1024).decode("latin1").splitlines():
+            if "SamplingFrequency" in line:
+                return format, line.strip("-# \x00")
+        return format, ""
+    if format == "json":
+        return format, _sniff_structured(path, json.load)
+    if format == "yaml":
+        return format, _sniff_structured(path, yaml.safe_load)
+
+    head = _read_head(path, 1024)
+    if head.startswith(b"\x89HDF\r\n\x1a\n") or head[512:520] == b"\x89HDF\r\n\x1a\n":
+        return format, "HDF5 container"
+    if head.startswith(b"MATLAB"):
+        return format, head[:116].decode("latin1").split(",")[0].strip()
+    if head.startswith((b"NEURALCD", b"NEURALSG", b"NEURALEV", b"BRSMPGRP")):
+        return format, f"Blackrock {head[:8].decode()} header"
+    if head.startswith((b"ABF ", b"ABF2")):
+        return format, f"{head[:4].decode().strip()} header"
+    if head.startswith(b"PLEX"):
+        return format, "Plexon PLX header"
+    if head[4:8] == b"ftyp" or (head.startswith(b"RIFF") and head[8:12] == b"AVI "):
+        return format, "video container"
+    if format == "unknown":
+        return format, f"magic bytes {head[:8].hex(' ')}" if head else "empty file"
+    return format, ""
+
+
+def _directory_format(names: List[str]) -> Optional[str]:
+    """Format of a whole directory, e.g. the output of a spike sorter."""
+    lowered = {n.lower() for n in names}
+    if {"spike_times.npy", "params.py"} <= lowered:
+        return "phy"
+    if {"stat.npy", "ops.npy"} <= lowered:
+        return "suite2p"
+    if any(n.endswith(".env") for n in lowered) and any(n.endswith(".xml") for n in lowered):
+        return "bruker_tiff"
+    return None
+
+
+def directory_signature(directory: str) -> str:
+    """Hash of the mtimes of a directory and of all its subdirectories, which change when files are added, removed or renamed."""
+    digest = hashlib.sha256(str(MANIFEST_VERSION).encode())
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            digest.update(f"{os.path.relpath(current, directory)}:{os.stat(current).st_mtime_ns}\n".encode())
+            with os.scandir(current) as it:
+                stack.extend(sorted(e.path for e in it if e.is_dir(follow_symlinks=False)))
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def scan_session(protocol: str, session: str, directory: str) -> SessionManifest:
+    """
+    Describe the files of a session directory. Files are grouped per directory and format, and
+    only the first file of each group is sniffed: 20000 TIFF frames cost one header read.
+
+    Args:
+        protocol: Protocol name
+        session: Session name
+        directory: Session directory
+
+    Returns:
+        The session manifest
+    """
+    manifest = SessionManifest(protocol=protocol, session=session)
+    groups: Dict[Tuple[str, str], FileGroup] = {}
+    stack = [(directory, IgnoreRules.default(directory).extended(directory))]
+    while stack:
+        current, rules = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Failed to scan directory {current}: {str(e)}")
+            continue
+        relative_dir = os.path.relpath(current, directory)
+        directory_format = _directory_format([e.name for e in entries])
+        for entry in entries:
+            if entry.name.startswith(".") or rules.is_ignored(entry.path, is_dir=entry.is_dir(follow_symlinks=False)):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append((entry.path, rules.extended(entry.path)))
+                continue
+            size = entry.stat().st_size
+            manifest.size += size
+            manifest.files += 1
+            if entry.name.lower() in METADATA_FILE_NAMES and current == directory:
+                try:
+                    with open(entry.path, "r", encoding="utf-8", errors="replace") as f:
+                        content = f.read()
+                    metadata = yaml.safe_load(content)
+                    manifest.metadata_keys = list(metadata) if isinstance(metadata, dict) else []
+                    manifest.metadata = content[:MAX_METADATA_EXCERPT_CHARS]
+                except Exception as e:
+                    manifest.metadata = f"failed to parse: {str(e)}"
+                continue
+            if entry.name.lower().endswith(SIDECAR_SUFFIXES):
+                continue
+            format = directory_format or classify(entry.name)
+            key = (relative_dir, format if directory_format else f"{format}{os.path.splitext(entry.name)[1].lower()}")
+            group = groups.get(key)
+            if group is not None:
+                group.count += 1
+                group.size += size
+                continue
+            try:
+                refined, details = (format, "") if directory_format else sniff(entry.path, format)
+            except Exception as e:
+                refined, details = format, f"failed to read header: {str(e)}"
+            groups[key] = FileGroup(
+                directory=relative_dir,
+                example=entry.name,
+                format=refined,
+                size=size,
+                details=details[:MAX_DETAILS_CHARS],
+            )
+    manifest.groups = list(groups.values())
+    return manifest
+
+
+def find_sessions(data_dir: str) -> List[Tuple[str, str, str]]:
+    """
+    Sessions of the `<protocol>/<session>/` layout of the source data. A protocol directory
+    without subdirectories is a single session, named '.'.
+
+    Returns:
+        List of (protocol, session, directory)
+    """
+    def subdirectories(directory: str) -> List[os.DirEntry]:
+        with os.scandir(directory) as it:
+            return sorted(
+                (e for e in it if e.is_dir(follow_symlinks=False) and not e.name.startswith(".")),
+                key=lambda e: e.name,
+            )
+
+    sessions = []
+    for protocol in subdirectories(data_dir):
+        children = subdirectories(protocol.path)
+        if not children:
+            sessions.append((protocol.name, ".", protocol.path))
+        sessions.extend((protocol.name, child.name, child.path) for child in children)
+    return sessions
+
+
+def _load_cache(cache_path: str) -> Dict[str, dict]:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_manifest(
+    data_dir: str = DEFAULT_DATA_DIR,
+    cache_path: Optional[str] = None,
+    max_workers: int = 8,
+    refresh: bool = False,
+) -> Tuple[List[SessionManifest], int]:
+    """
+    Scan the sessions of the source data in parallel, reusing the cached manifest of each session
+    whose directory mtimes did not change.
+
+    Args:
+        data_dir: Source data directory
+        cache_path: JSON cache file, None to disable the cache
+        max_workers: Number of sessions scanned concurrently
+        refresh: Whether to ignore the cache
+
+    Returns:
+        The session manifests, and the number of sessions served from the cache
+    """
+    data_dir = os.path.abspath(data_dir)
+    cache = {} if cache_path is None or refresh else _load_cache(cache_path)
+    sessions = find_sessions(data_dir)
+
+    def scan(session: Tuple[str, str, str]) -> Tuple[str, str, SessionManifest, bool]:
+        protocol, name, directory = session
+        signature = directory_signature(directory)
+        cached = cache.get(directory)
+        if cached is not None and cached.get("signature") == signature:
+            manifest = cached["manifest"]
+            manifest["groups"] = [FileGroup(**g) for g in manifest["groups"]]
+            return directory, signature, SessionManifest(**manifest), True
+        return directory, signature, scan_session(protocol, name, directory), False
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-manifest") as executor:
+        results = list(executor.map(scan, sessions))
+
+    cache_hits = sum(1 for *_, hit in results if hit)
+    if cache_path is not None and cache_hits < len(results):
+        new_cache = {directory: {"signature": signature, "manifest": asdict(m)} for directory, signature, m, _ in results}
+        try:
+            atomic_write(cache_path, json.dumps(new_cache))
+        except OSError as e:
+            logger.warning(f"Failed to write the data manifest cache {cache_path}: {str(e)}")
+    return [m for _, _, m, _ in results], cache_hits
+
+
+def format_manifest(data_dir: str, sessions: List[SessionManifest], max_sessions_listed: int = 20) -> str:
+    """Compact text manifest: per protocol, its sessions, the formats found with their candidate NeuroConv interfaces, and the session metadata."""
+    protocols: Dict[str, List[SessionManifest]] = defaultdict(list)
+    for session in sessions:
+        protocols[session.protocol].append(session)
+
+    total_size = sum(s.size for s in sessions)
+    lines = [f"Source data in {data_dir}: {len(protocols)} protocols, {len(sessions)} sessions, {format_size(total_size)}"]
+    for protocol, protocol_sessions in protocols.items():
+        names = [s.session for s in protocol_sessions]
+        listed = ", ".join(names[:max_sessions_listed]) + (f", ... ({len(names)} total)" if len(names) > max_sessions_listed else "")
+        lines.append("")
+        lines.append(f"{protocol}/ ({len(protocol_sessions)} sessions, {format_size(sum(s.size for s in protocol_sessions))})")
+        lines.append(f"  sessions: {listed}")
+
+        # Format -> sessions, files, size, and the example of the first session
+        formats: Dict[str, dict] = {}
+        for session in protocol_sessions:
+            for group in session.groups:
+                summary = formats.setdefault(
+                    group.format,
+                    {"sessions": set(), "files": 0, "size": 0, "example": (session.session, group)},
+                )
+                summary["sessions"].add(session.session)
+                summary["files"] += group.count
+                summary["size"] += group.size
+        lines.append("  formats:")
+        for format, summary in sorted(formats.items(), key=lambda f: -f[1]["size"]):
+            description, interfaces = FORMATS.get(format, FORMATS["unknown"])
+            candidates = " or ".join(interfaces) if interfaces else "no standard interface"
+            if format == "nwb":
+                candidates = "already NWB"
+            lines.append(
+                f"  - {description}: {len(summary['sessions'])}/{len(protocol_sessions)} sessions, "
+                f"{summary['files']} files, {format_size(summary['size'])} -> {candidates}"
+            )
+            session_name, group = summary["example"]
+            example = os.path.normpath(os.path.join(session_name, group.directory, group.example))
+            more = f" (+{group.count - 1} similar)" if group.count > 1 else ""
+            lines.append(f"      e.g. {example}{more}{': ' + group.details if group.details else ''}")
+
+        keys = sorted({k for s in protocol_sessions for k in s.metadata_keys})
+        with_metadata = [s for s in protocol_sessions if s.metadata is not None]
+        if with_metadata:
+            lines.append(f"  metadata.yaml in {len(with_metadata)}/{len(protocol_sessions)} sessions, keys: {', '.join(keys)}")
+            excerpt = with_metadata[0].metadata.rstrip().replace("\n", "\n      ")
+            lines.append(f"    {with_metadata[0].session}/metadata.yaml:\n      {excerpt}")
+        else:
+            lines.append("  no metadata.yaml")
+    return "\n".join(lines)
+
+
+def get_cache_path() -> Optional[str]:
+    """Manifest cache path, from DATA_MANIFEST_CACHE_PATH ("" disables the cache)."""
+    return os.getenv("DATA_MANIFEST_CACHE_PATH", DEFAULT_CACHE_PATH) or None
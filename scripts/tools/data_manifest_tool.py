@@ -0,0 +1,66 @@
+import os
+import time
+from typing import Optional
+from smolagents import Tool
+
+from .data_manifest import DEFAULT_DATA_DIR, build_manifest, format_manifest, get_cache_path
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+class DataManifestTool(Tool):
+    name = "source_data_manifest"
+    description = """
+    Request a compact manifest of the source data: its protocols and sessions, the file formats found in them with
+    their sizes and header details (channels, sampling rates, durations, array shapes, table columns...), the
+    candidate NeuroConv DataInterfaces for each format, and the metadata.yaml of the sessions.
+    This is the fastest way to start investigating the source data: it only reads file headers and sidecar files,
+    scans the sessions in parallel, and is cached until files are added, removed or renamed.
+    Use read_file, list_files or directory_tree afterwards to look into specific files.
+    """
+    inputs = {
+        "data_dir": {
+            "type": "string",
+            "description": f"Optional source data directory (default {DEFAULT_DATA_DIR}), organized as <protocol>/<session>/<files>.",
+            "nullable": True,
+        },
+        "refresh": {
+            "type": "boolean",
+            "description": "Optional, whether to rescan all sessions instead of using the cached manifest.",
+            "nullable": True,
+        },
+    }
+    output_type = "string"
+
+    def __init__(self, max_workers: int = 8):
+        super().__init__()
+        self.max_workers = max_workers
+
+    def forward(self, data_dir: Optional[str] = None, refresh: Optional[bool] = False) -> str:
+        try:
+            data_dir = os.path.abspath(data_dir or DEFAULT_DATA_DIR)
+
+            if not os.path.isdir(data_dir):
+                raise NotADirectoryError(f"Not a directory: {data_dir}")
+
+            start_time = time.perf_counter()
+            sessions, cache_hits = build_manifest(
+                data_dir=data_dir,
+                cache_path=get_cache_path(),
+                max_workers=self.max_workers,
+                refresh=bool(refresh),
+            )
+            if not sessions:
+                return f"No protocol directories found in {data_dir}"
+
+            logger.info(
+                f"Built the manifest of {len(sessions)} sessions in {data_dir} in "
+                f"{time.perf_counter() - start_time:.3f}s ({cache_hits} from cache)"
+            )
+            return format_manifest(data_dir, sessions)
+
+        except Exception as e:
+            logger.error(f"Failed to build the manifest of {data_dir}: {str(e)}")
+            return f"Failed to build the manifest of {data_dir}: {str(e)}"
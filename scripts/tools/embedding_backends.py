@@ -0,0 +1,93 @@
+import re
+import asyncio
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_EMBEDDING_MODEL = "openai/text-embedding-ada-002"
+DEFAULT_LOCAL_EMBEDDING_MODEL = "local/sentence-transformers/all-MiniLM-L6-v2"
+LOCAL_MODEL_PREFIX = "local/"
+
+
+def is_local_model(model: str) -> bool:
+    """Whether an embedding model runs in-process (`local/<sentence-transformers model>`) instead of through litellm."""
+    return model.startswith(LOCAL_MODEL_PREFIX)
+
+
+def collection_for_model(collection_name: str, model: str) -> str:
+    """Name of the collection indexed with an embedding model.
+
+    The remote default model uses the base collection. Each local model gets its own collection,
+    suffixed with the model name, since vectors of different models are not comparable.
+    e.g. ("neuroconv", "local/sentence-transformers/all-MiniLM-L6-v2") -> "neuroconv_all_minilm_l6_v2"
+    """
+    if not is_local_model(model):
+        return collection_name
+    alias = re.sub(r"[^a-z0-9]+", "_", model.rsplit("/", 1)[-1].lower()).strip("_")
+    return f"{collection_name}_{alias}"
+
+
+class LocalEmbeddingBackend:
+    """Sentence-transformers embedding model running on CPU in a dedicated thread pool.
+
+    A single worker thread by default: the model already uses several cores per batch, and
+    concurrent encodes would only compete for them.
+    """
+
+    def __init__(self, model: str, batch_size: int = 64, max_workers: int = 1, backend: str = "torch"):
+        """
+        Args:
+            model: Model name, with or without the `local/` prefix
+            batch_size: Number of texts encoded per forward pass
+            max_workers: Number of threads encoding concurrently
+            backend: sentence-transformers backend, "torch" or "onnx"
+        """
+        self.model_name = model[len(LOCAL_MODEL_PREFIX):] if is_local_model(model) else model
+        self.batch_size = batch_size
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="local-embedding")
+        self._model = None
+
+    def load(self):
+        """Load the model, downloading it on first use."""
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ModuleNotFoundError:
+                raise ModuleNotFoundError(
+                    "Please install 'sentence-transformers' to use local embedding models: "
+                    "`pip install sentence-transformers`"
+                )
+            kwargs = {"backend": self.backend} if self.backend != "torch" else {}
+            logger.info(f"Loading local embedding model {self.model_name}")
+            self._model = SentenceTransformer(self.model_name, device="cpu", **kwargs)
+        return self._model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.load().encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return embeddings.tolist()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, texts)
+
+    async def warm_up(self) -> None:
+        """Load the model in the thread pool, so the first query does not pay for it."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+
+
+@lru_cache(maxsize=4)
+def get_local_embedding_backend(model: str) -> LocalEmbeddingBackend:
+    """Return the process-wide backend of a local embedding model."""
+    return LocalEmbeddingBackend(model)
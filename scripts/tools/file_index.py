@@ -0,0 +1,633 @@
+import os
+import stat as stat_module
+import time
+import threading
+from dataclasses import dataclass
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import re._parser as sre_parse
+    from re._constants import LITERAL
+except ImportError:
+    import sre_parse
+    from sre_constants import LITERAL
+
+from utils.inotify import Inotify, IN_Q_OVERFLOW
+from .file_search import (
+    IGNORE_FILE_NAMES,
+    IgnoreRules,
+    expand_braces,
+    has_binary_extension,
+    is_binary_file,
+    matches_file_pattern,
+)
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_INDEX_ROOTS = ["/home/agent_workspace", "/home/data"]
+# Text files larger than this are not trigram-indexed, and are always search candidates
+DEFAULT_MAX_INDEXED_TEXT_SIZE = 512 * 1024
+# Memory cap of the trigram posting lists, 4 bytes per (trigram, file) pair
+DEFAULT_MAX_POSTINGS_BYTES = 256 * 1024 * 1024
+# Posting lists are not compacted for fewer stale entries than this
+MIN_COMPACTED_ENTRIES = 100_000
+# Directories modified this recently may change again within the same mtime tick (1s or 2s on some
+# file systems) without changing their mtime: they are listed again by the next poll
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+@dataclass
+class FileEntry:
+    path: str
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+    # Matched by the ignore rules: listed, but not descended into nor searched
+    ignored: bool = False
+
+
+@dataclass
+class FileContents:
+    """What the index keeps of the contents of a file, read outside of its lock by `read_contents`."""
+
+    mtime: float
+    size: int
+    # Same mtime and size as the known entry: the file was not read
+    unchanged: bool = False
+    binary: bool = False
+    # None for unchanged files and for text files too large to be trigram-indexed
+    trigrams: Optional[Set[str]] = None
+
+
+def trigrams(text: str) -> Set[str]:
+    """Lowercased trigrams of a text, lowercased so that case-insensitive searches can be prefiltered too."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def read_contents(path: str, max_size: int, known: Optional[FileEntry] = None) -> Optional[FileContents]:
+    """
+    Stat a file and, unless it matches its known entry, read its trigrams.
+
+    Args:
+        path: File path
+        max_size: Text files larger than this number of bytes are not read
+        known: Optional entry of the file in the index
+
+    Returns:
+        The file contents, None if the file cannot be read
+    """
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+        contents = FileContents(mtime=stat.st_mtime, size=stat.st_size)
+        if known is not None and (known.mtime, known.size) == (contents.mtime, contents.size):
+            contents.unchanged = True
+        elif is_binary_file(path):
+            contents.binary = True
+        elif contents.size <= max_size:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                contents.trigrams = trigrams(f.read())
+    except OSError:
+        return None
+    return contents
+
+
+def required_literals(regex: str) -> List[str]:
+    """
+    Literal strings every match of a regex contains, used to prefilter files with the trigram index.
+
+    Only the top-level sequence of the pattern is analyzed: runs of consecutive literal characters
+    of at least 3 characters. Patterns with top-level alternations give no literal.
+
+    Args:
+        regex: Regular expression
+
+    Returns:
+        List of required literal strings, empty when the pattern cannot be prefiltered
+    """
+    try:
+        parsed = sre_parse.parse(regex)
+    except Exception:
+        return []
+    runs, current = [], []
+    for op, av in parsed:
+        if op is LITERAL:
+            current.append(chr(av))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return [run for run in runs if len(run) >= 3]
+
+
+class FileIndex:
+    """In-process index of directory trees: the entries (path, size, mtime) of every directory and
+    a trigram index of the contents of the small text files.
+
+    The index is built lazily: the subtree of a directory is indexed on the first query about it,
+    and the contents of its text files are read on the first search covering them, which reads
+    them anyway. It is updated incrementally before each query: with inotify, only the
+    directories that reported changes are rescanned. Without inotify (or when the watch limit is
+    reached), the mtime of every directory is checked at most every `poll_interval` seconds, and
+    only the changed directories are rescanned. As modifying a file does not change the mtime of
+    its directory, searches then also check the mtime of the indexed files they cover.
+    Ignored directories (see `file_search.IgnoreRules`) are listed but not indexed.
+
+    File contents are read outside of the index lock, so a first search over a large tree does
+    not block the queries of other tools.
+
+    Trigrams are stored once, as posting lists of file IDs. Removed files only drop their ID, and
+    the posting lists are compacted when most of their entries belong to removed files.
+    """
+
+    def __init__(
+        self,
+        roots: List[str],
+        max_indexed_text_size: int = DEFAULT_MAX_INDEXED_TEXT_SIZE,
+        max_postings_bytes: int = DEFAULT_MAX_POSTINGS_BYTES,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True,
+    ):
+        """
+        Args:
+            roots: Directories to index
+            max_indexed_text_size: Text files larger than this number of bytes are not trigram-indexed
+            max_postings_bytes: Memory cap of the posting lists, above which files are not trigram-indexed
+            poll_interval: Minimum number of seconds between two checks of the directories, when not using inotify
+            use_inotify: Whether to watch the directories with inotify instead of polling
+        """
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.max_indexed_text_size = max_indexed_text_size
+        self.max_postings_bytes = max_postings_bytes
+        self.poll_interval = poll_interval
+        self.entries: Dict[str, FileEntry] = {}
+        self.children: Dict[str, Set[str]] = {}
+        self.rules: Dict[str, IgnoreRules] = {}
+        self.binary: Set[str] = set()
+        self.unindexed_text: Set[str] = set()
+        # Trigram -> IDs of the files containing it, in increasing order
+        self.postings: Dict[str, array] = {}
+        # Path -> (file ID, number of trigrams) of the trigram-indexed files
+        self.file_ids: Dict[str, Tuple[int, int]] = {}
+        self._next_file_id = 0
+        self._posting_entries = 0
+        # Entries of the posting lists belonging to removed files
+        self._stale_entries = 0
+        # Regular files whose contents were not read yet
+        self._unread: Set[str] = set()
+        # Directories whose subtrees are indexed
+        self._subtrees: Set[str] = set()
+        self._postings_full = False
+        self._lock = threading.RLock()
+        self._last_poll = 0.0
+        self._dirty: Set[str] = set()
+        # Directory -> mtime when it was last listed, None when it may change without changing it
+        self._dir_mtimes: Dict[str, Optional[int]] = {}
+        self._watch_dirs: Dict[str, int] = {}
+        self._inotify: Optional[Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                logger.info(f"inotify unavailable, polling the file index: {str(e)}")
+
+    def covers(self, path: str) -> bool:
+        """Whether a directory is indexed, i.e. is one of the roots or a non-ignored directory below one."""
+        path = os.path.abspath(path)
+        if self._root_of(path) is None:
+            return False
+        self.refresh(path)
+        return path in self.children
+
+    # Updates
+
+    def refresh(self, directory: Optional[str] = None) -> None:
+        """
+        Bring the index up to date with the file system.
+
+        Args:
+            directory: Optional directory about to be queried, whose subtree is indexed if it is not yet
+        """
+        with self._lock:
+            if self._inotify is not None:
+                for event in self._inotify.read_events():
+                    if event.mask & IN_Q_OVERFLOW:
+                        self._dirty.update(self.children)
+                        continue
+                    directory_changed = self._inotify.watches.get(event.wd)
+                    if directory_changed is not None:
+                        self._dirty.add(directory_changed)
+            elif time.monotonic() - self._last_poll >= self.poll_interval:
+                self._dirty.update(d for d in self.children if self._directory_changed(d))
+                self._last_poll = time.monotonic()
+
+            # Parents first, so that removed subtrees are dropped before being rescanned
+            for dirty in sorted(self._dirty, key=len):
+                if dirty in self.children:
+                    self._rescan_directory(dirty)
+            self._dirty.clear()
+
+            if self._stale_entries > max(self._posting_entries - self._stale_entries, MIN_COMPACTED_ENTRIES):
+                self._compact_postings()
+            if directory is not None:
+                self._index_subtree(os.path.abspath(directory))
+
+    def _root_of(self, path: str) -> Optional[str]:
+        return next((root for root in self.roots if path == root or path.startswith(root + os.sep)), None)
+
+    def _index_subtree(self, directory: str) -> None:
+        """Index the subtree of a directory below a root, unless it is ignored or already indexed."""
+        root = self._root_of(directory)
+        if root is None or directory in self.children or not os.path.isdir(directory):
+            return
+        # Not listed yet by the rescan of an indexed ancestor: left to the next rescan
+        if any(directory.startswith(subtree + os.sep) for subtree in self._subtrees):
+            return
+
+        rules = IgnoreRules.default(root).extended(root)
+        current = root
+        for name in os.path.relpath(directory, root).split(os.sep) if directory != root else []:
+            current = os.path.join(current, name)
+            if rules.is_ignored(current, is_dir=True):
+                return
+            rules = rules.extended(current)
+
+        # Subtrees already indexed below the directory are indexed again as part of it
+        for subtree in [s for s in self._subtrees if s.startswith(directory + os.sep)]:
+            self._remove_entry(subtree)
+            self.children.get(os.path.dirname(subtree), set()).discard(os.path.basename(subtree))
+
+        start_time = time.perf_counter()
+        n_entries = len(self.entries)
+        self._add_directory(directory, rules)
+        self._subtrees.add(directory)
+        self._last_poll = time.monotonic()
+        logger.info(
+            f"Indexed {len(self.entries) - n_entries} entries of {directory} in {time.perf_counter() - start_time:.2f}s "
+            f"(inotify={self._inotify is not None})"
+        )
+
+    def _record_mtime(self, directory: str) -> None:
+        """Record the mtime of a directory, before listing it."""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is not None and time.time_ns() - mtime_ns < MTIME_GRANULARITY_NS:
+            mtime_ns = None
+        self._dir_mtimes[directory] = mtime_ns
+
+    def _directory_changed(self, directory: str) -> bool:
+        """Whether the entries or the ignore files of a directory may have changed since it was listed."""
+        try:
+            if os.stat(directory).st_mtime_ns != self._dir_mtimes.get(directory):
+                return True
+            for name in IGNORE_FILE_NAMES:
+                entry = self.entries.get(os.path.join(directory, name))
+                if entry is not None and os.stat(entry.path).st_mtime != entry.mtime:
+                    return True
+        except OSError:
+            return True
+        return False
+
+    def _watch(self, directory: str) -> None:
+        if self._inotify is None or directory in self._watch_dirs:
+            return
+        try:
+            self._watch_dirs[directory] = self._inotify.add_watch(directory)
+        except OSError as e:
+            # e.g. fs.inotify.max_user_watches reached: fall back to polling everything
+            logger.warning(f"Falling back to polling the file index: {str(e)}")
+            self._inotify.close()
+            self._inotify = None
+            self._watch_dirs.clear()
+
+    def _add_directory(self, directory: str, rules: IgnoreRules) -> None:
+        """Index a directory and its subtree."""
+        self.children[directory] = set()
+        self.rules[directory] = rules
+        self._watch(directory)
+        self._record_mtime(directory)
+        try:
+            with os.scandir(directory) as it:
+                dir_entries = list(it)
+        except OSError as e:
+            logger.warning(f"Failed to index directory {directory}: {str(e)}")
+            return
+        for dir_entry in dir_entries:
+            self._add_entry(directory, dir_entry.path, rules)
+
+    def _add_entry(self, directory: str, path: str, rules: IgnoreRules) -> None:
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError:
+            return
+        is_dir = stat_module.S_ISDIR(stat.st_mode)
+        name = os.path.basename(path)
+        entry = FileEntry(
+            path=path,
+            name=name,
+            is_dir=is_dir,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            ignored=rules.is_ignored(path, is_dir=is_dir),
+        )
+        self.entries[path] = entry
+        self.children[directory].add(name)
+        if entry.ignored:
+            return
+        if is_dir:
+            self._add_directory(path, rules.extended(path))
+        elif stat_module.S_ISREG(stat.st_mode):
+            if has_binary_extension(path):
+                self.binary.add(path)
+            else:
+                self._unread.add(path)
+
+    def _add_contents(self, path: str, contents: FileContents) -> None:
+        """Add the contents of an unread file, read by `read_contents`, to the index."""
+        self._unread.discard(path)
+        if contents.binary:
+            self.binary.add(path)
+            return
+        if contents.trigrams is None or not self._has_postings_room():
+            self.unindexed_text.add(path)
+            return
+        file_id = self._next_file_id
+        self._next_file_id += 1
+        self.file_ids[path] = (file_id, len(contents.trigrams))
+        for trigram in contents.trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array("I")
+            posting.append(file_id)
+        self._posting_entries += len(contents.trigrams)
+
+    def _has_postings_room(self) -> bool:
+        """Whether the posting lists are below their memory cap, compacting them if needed."""
+        itemsize = array("I").itemsize
+        if self._posting_entries * itemsize < self.max_postings_bytes:
+            return True
+        if self._stale_entries:
+            self._compact_postings()
+            if self._posting_entries * itemsize < self.max_postings_bytes:
+                return True
+        if not self._postings_full:
+            logger.warning(
+                f"File index posting lists reached {self.max_postings_bytes // (1024 * 1024)} MB, "
+                "new text files are searched without trigram prefiltering"
+            )
+            self._postings_full = True
+        return False
+
+    def _compact_postings(self) -> None:
+        """Drop the IDs of removed files from the posting lists."""
+        live = {file_id for file_id, _ in self.file_ids.values()}
+        for trigram in list(self.postings):
+            posting = array("I", (file_id for file_id in self.postings[trigram] if file_id in live))
+            if posting:
+                self.postings[trigram] = posting
+            else:
+                del self.postings[trigram]
+        self._posting_entries -= self._stale_entries
+        self._stale_entries = 0
+
+    def _remove_entry(self, path: str) -> None:
+        """Drop an entry and, for a directory, its whole subtree."""
+        entry = self.entries.pop(path, None)
+        if entry is None and path not in self.children:
+            return
+        if path in self.children:
+            for name in self.children.pop(path):
+                self._remove_entry(os.path.join(path, name))
+            self.rules.pop(path, None)
+            self._watch_dirs.pop(path, None)
+            self._dir_mtimes.pop(path, None)
+            self._subtrees.discard(path)
+        self.binary.discard(path)
+        self.unindexed_text.discard(path)
+        self._unread.discard(path)
+        indexed = self.file_ids.pop(path, None)
+        if indexed is not None:
+            self._stale_entries += indexed[1]
+
+    def _rescan_directory(self, directory: str) -> None:
+        """Update the entries of a directory: added, removed and modified ones."""
+        if not os.path.isdir(directory):
+            parent = os.path.dirname(directory)
+            self._remove_entry(directory)
+            self.children.get(parent, set()).discard(os.path.basename(directory))
+            return
+        self._record_mtime(directory)
+        try:
+            names = set(os.listdir(directory))
+        except OSError as e:
+            logger.warning(f"Failed to rescan directory {directory}: {str(e)}")
+            return
+
+        # A changed ignore file changes the rules of the whole subtree: reindex it
+        for name in IGNORE_FILE_NAMES:
+            path = os.path.join(directory, name)
+            entry = self.entries.get(path)
+            changed = entry is None and name in names
+            if entry is not None:
+                try:
+                    changed = name not in names or os.stat(path).st_mtime != entry.mtime
+                except OSError:
+                    changed = True
+            if changed:
+                rules = self.rules[directory]
+                for child in list(self.children[directory]):
+                    self._remove_entry(os.path.join(directory, child))
+                base_rules = IgnoreRules([p for p in rules.patterns if p[0] != directory])
+                self._add_directory(directory, base_rules.extended(directory))
+                return
+
+        rules = self.rules[directory]
+        known = self.children[directory]
+        for name in known - names:
+            self._remove_entry(os.path.join(directory, name))
+        known &= names
+        for name in names:
+            path = os.path.join(directory, name)
+            entry = self.entries.get(path)
+            if entry is None:
+                self._add_entry(directory, path, rules)
+                continue
+            try:
+                stat = os.stat(path, follow_symlinks=False)
+            except OSError:
+                self._remove_entry(path)
+                known.discard(name)
+                continue
+            is_dir = stat_module.S_ISDIR(stat.st_mode)
+            # Subdirectories report their own changes, only a change of type matters here
+            if is_dir == entry.is_dir and (is_dir or (stat.st_mtime == entry.mtime and stat.st_size == entry.size)):
+                continue
+            self._remove_entry(path)
+            self._add_entry(directory, path, rules)
+
+    # Queries
+
+    def list_directory(self, directory: str) -> List[FileEntry]:
+        """Entries of an indexed directory, sorted by name."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            self.refresh(directory)
+            return [self.entries[os.path.join(directory, name)] for name in sorted(self.children[directory])]
+
+    def walk(self, directory: str, include_ignored: bool = False) -> Iterator[FileEntry]:
+        """Entries below an indexed directory, depth-first in sorted order, without descending into ignored directories."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            self.refresh(directory)
+            entries = []
+            stack = [directory]
+            while stack:
+                current = stack.pop()
+                subdirectories = []
+                for name in sorted(self.children.get(current, ())):
+                    entry = self.entries[os.path.join(current, name)]
+                    if entry.ignored and not include_ignored:
+                        continue
+                    entries.append(entry)
+                    if entry.is_dir and not entry.ignored:
+                        subdirectories.append(entry.path)
+                stack.extend(reversed(subdirectories))
+        yield from entries
+
+    def search_candidates(
+        self,
+        directory: str,
+        regex: str,
+        file_pattern: Optional[str] = None,
+        include_hidden: bool = False,
+        max_workers: int = 8,
+    ) -> List[str]:
+        """
+        Text files below an indexed directory that may contain a match of a regex.
+
+        Files whose trigrams do not contain all the trigrams of the regex required literals are
+        excluded without being read. Binary files and ignored paths are excluded. Files not read
+        since they were indexed or modified are read first, by a thread pool and without holding
+        the index lock.
+
+        Args:
+            directory: Indexed directory
+            regex: Regular expression
+            file_pattern: Optional glob pattern of the files, with `{a,b}` alternatives, matched against
+                the path relative to `directory` if it contains a `/`
+            include_hidden: Whether to include the files and directories starting with a dot
+            max_workers: Number of files read concurrently
+
+        Returns:
+            Candidate file paths, in walk order (files of a directory before its subdirectories)
+        """
+        patterns = expand_braces(file_pattern) if file_pattern else None
+        directory = os.path.abspath(directory)
+        with self._lock:
+            self.refresh(directory)
+            polling = self._inotify is None
+            files = []
+            # Unread files, and when polling the indexed files, which may have been modified since
+            to_read: List[Tuple[str, Optional[FileEntry]]] = []
+            stack = [directory]
+            while stack:
+                current = stack.pop()
+                subdirectories = []
+                for name in sorted(self.children.get(current, ())):
+                    if not include_hidden and name.startswith("."):
+                        continue
+                    path = os.path.join(current, name)
+                    entry = self.entries[path]
+                    if entry.ignored:
+                        continue
+                    if entry.is_dir:
+                        subdirectories.append(path)
+                        continue
+                    if path in self.binary or (patterns is not None and not matches_file_pattern(path, directory, patterns)):
+                        continue
+                    if path in self._unread:
+                        to_read.append((path, None))
+                    elif polling and path in self.file_ids:
+                        to_read.append((path, entry))
+                    files.append(path)
+                stack.extend(reversed(subdirectories))
+
+        if to_read:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-index") as executor:
+                read = list(executor.map(
+                    lambda item: read_contents(item[0], self.max_indexed_text_size, known=item[1]), to_read
+                ))
+        else:
+            read = []
+
+        with self._lock:
+            for (path, _), contents in zip(to_read, read):
+                if contents is None or contents.unchanged:
+                    continue
+                entry = self.entries.get(path)
+                if entry is None:
+                    continue
+                if (entry.mtime, entry.size) != (contents.mtime, contents.size):
+                    # Modified since it was indexed: index it again, with the contents just read
+                    parent = os.path.dirname(path)
+                    self._remove_entry(path)
+                    self._add_entry(parent, path, self.rules[parent])
+                    entry = self.entries.get(path)
+                    if entry is None or (entry.mtime, entry.size) != (contents.mtime, contents.size):
+                        continue
+                # Not added yet, e.g. by a concurrent search
+                if path in self._unread:
+                    self._add_contents(path, contents)
+            files = [path for path in files if path in self.entries and path not in self.binary]
+
+            # Intersect the posting lists of the required trigrams, shortest first
+            required: Optional[Set[int]] = None
+            literal_trigrams = {trigram for literal in required_literals(regex) for trigram in trigrams(literal)}
+            if literal_trigrams:
+                postings = [self.postings.get(trigram, array("I")) for trigram in literal_trigrams]
+                postings.sort(key=len)
+                required = set(postings[0])
+                for posting in postings[1:]:
+                    if not required:
+                        break
+                    required.intersection_update(posting)
+                # Files that could not be read are kept, and reported by the search itself
+                return [
+                    path for path in files
+                    if path in self.unindexed_text
+                    or path in self._unread
+                    or (path in self.file_ids and self.file_ids[path][0] in required)
+                ]
+        return files
+
+
+_file_index: Optional[FileIndex] = None
+_file_index_lock = threading.Lock()
+
+
+def get_file_index() -> Optional[FileIndex]:
+    """Return the process-wide file index shared by the file system tools, None if disabled.
+
+    - FILE_INDEX_ENABLED: "false" to disable the index, the tools then walk the file system on each call
+    - FILE_INDEX_ROOTS: colon-separated directories to index (default /home/agent_workspace:/home/data)
+    - FILE_INDEX_MAX_POSTINGS_MB: memory cap of the trigram index (default 256)
+    """
+    global _file_index
+    if os.getenv("FILE_INDEX_ENABLED", "true").lower() != "true":
+        return None
+    with _file_index_lock:
+        if _file_index is None:
+            roots = os.getenv("FILE_INDEX_ROOTS", ":".join(DEFAULT_INDEX_ROOTS)).split(":")
+            max_postings_mb = int(os.getenv("FILE_INDEX_MAX_POSTINGS_MB", str(DEFAULT_MAX_POSTINGS_BYTES // (1024 * 1024))))
+            _file_index = FileIndex(roots=[r for r in roots if r], max_postings_bytes=max_postings_mb * 1024 * 1024)
+        return _file_index
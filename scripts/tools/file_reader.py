@@ -0,0 +1,333 @@
+import os
+import mmap
+import bisect
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .file_search import has_binary_extension, is_binary_file
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+# Files larger than this are previewed (head and tail) instead of returned whole
+DEFAULT_MAX_READ_SIZE = 256 * 1024
+# Maximum number of bytes returned by a ranged read
+DEFAULT_MAX_RANGE_SIZE = 256 * 1024
+DEFAULT_PREVIEW_LINES = 50
+# Maximum number of bytes of each of the head and tail of a preview, e.g. for minified files
+PREVIEW_MAX_BYTES = 8 * 1024
+# Maximum number of bytes of a hex dump of a binary file
+MAX_HEXDUMP_SIZE = 4096
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# Granularity of the newline counts of the line index
+LINE_INDEX_CHUNK_SIZE = 64 * 1024
+MAX_CACHED_LINE_INDEXES = 32
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+@dataclass
+class LineIndex:
+    """Number of newlines before each chunk of a file, to find the byte offset of a line without
+    scanning the file from the start."""
+
+    size: int
+    mtime_ns: int
+    newlines_before: List[int] = field(default_factory=list)
+    newlines: int = 0
+    ends_with_newline: bool = True
+
+    @classmethod
+    def build(cls, buffer: Buffer, size: int, mtime_ns: int) -> "LineIndex":
+        index = cls(size=size, mtime_ns=mtime_ns)
+        for start in range(0, size, LINE_INDEX_CHUNK_SIZE):
+            index.newlines_before.append(index.newlines)
+            index.newlines += buffer[start:start + LINE_INDEX_CHUNK_SIZE].count(b"\n")
+        index.ends_with_newline = size == 0 or buffer[size - 1:size] == b"\n"
+        return index
+
+    @property
+    def total_lines(self) -> int:
+        return self.newlines + (0 if self.ends_with_newline else 1)
+
+    def line_offset(self, buffer: Buffer, line: int) -> int:
+        """Byte offset of the start of a line, 0-based. Lines past the end start at the end of the file."""
+        if line <= 0:
+            return 0
+        if line > self.newlines:
+            return self.size
+        # Last chunk starting with fewer than `line` newlines before it
+        chunk = bisect.bisect_left(self.newlines_before, line) - 1
+        position = chunk * LINE_INDEX_CHUNK_SIZE
+        for _ in range(line - self.newlines_before[chunk]):
+            position = buffer.find(b"\n", position) + 1
+        return position
+
+
+_line_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def get_line_index(path: str, buffer: Buffer) -> LineIndex:
+    """Return the line index of a file, cached until the file size or mtime change."""
+    stat = os.stat(path)
+    with _line_indexes_lock:
+        index = _line_indexes.get(path)
+        if index is not None and index.size == stat.st_size and index.mtime_ns == stat.st_mtime_ns:
+            _line_indexes.move_to_end(path)
+            return index
+    index = LineIndex.build(buffer, size=len(buffer), mtime_ns=stat.st_mtime_ns)
+    with _line_indexes_lock:
+        _line_indexes[path] = index
+        while len(_line_indexes) > MAX_CACHED_LINE_INDEXES:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+@contextmanager
+def open_buffer(path: str) -> Iterator[Buffer]:
+    """Bytes of a file, memory-mapped for large files so that only the accessed pages are read."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size < MMAP_THRESHOLD:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+@dataclass
+class ReadResult:
+    """Part of a file returned by a read, with its position in the file."""
+
+    path: str
+    text: str
+    unit: str
+    start: int
+    end: int
+    total: int
+    size: int
+    truncated: bool = False
+    binary: bool = False
+
+    def format(self) -> str:
+        if self.start == 0 and self.end == self.total and not self.truncated:
+            return self.text
+        if self.start >= self.end:
+            return f"[{self.path}: nothing to read at this offset, the file has {self.total} {self.unit}]"
+        if self.unit == "lines":
+            position, next_offset = f"lines {self.start + 1}-{self.end} of {self.total}", self.end + 1
+        else:
+            position, next_offset = f"bytes {self.start}-{self.end} of {self.total}", self.end
+        note = f"[{self.path}: {position} ({format_size(self.size)})"
+        if self.truncated:
+            note += f", cut at the size cap: continue with offset={next_offset}"
+        separator = "" if self.text.endswith("\n") else "\n"
+        return f"{self.text}{separator}{note}]"
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def hexdump(data: bytes, start: int = 0) -> str:
+    lines = []
+    for i in range(0, len(data), 16):
+        row = data[i:i + 16]
+        printable = "".join(chr(b) if 32 <= b < 127 else "." for b in row)
+        lines.append(f"{start + i:08x}  {row.hex(' '):<47}  {printable}")
+    return "\n".join(lines)
+
+
+def _line_range(
+    buffer: Buffer,
+    index: LineIndex,
+    start_line: int,
+    end_line: int,
+    max_bytes: int,
+) -> Tuple[str, int, bool]:
+    """Text of lines [start_line, end_line), cut at a line boundary after `max_bytes` bytes.
+
+    Returns:
+        The text, the line after the last returned line and whether the range was cut
+    """
+    start = index.line_offset(buffer, start_line)
+    end = index.line_offset(buffer, end_line)
+    truncated = end - start > max_bytes
+    if truncated:
+        end = start + max_bytes
+        # Keep whole lines, unless a single line is larger than max_bytes
+        last_newline = buffer.rfind(b"\n", start, end)
+        if last_newline >= 0:
+            end = last_newline + 1
+        end_line = start_line + buffer[start:end].count(b"\n")
+    return bytes(buffer[start:end]).decode("utf-8", errors="replace"), end_line, truncated
+
+
+def _last_lines(
+    buffer: Buffer,
+    index: LineIndex,
+    start_line: int,
+    end_line: int,
+    max_bytes: int,
+) -> Tuple[str, int, bool]:
+    """Text of the last lines of [start_line, end_line), at most `max_bytes` bytes, cut at a line boundary.
+
+    Returns:
+        The text, the first returned line and whether it is the end of a line larger than `max_bytes`
+    """
+    start = index.line_offset(buffer, start_line)
+    end = index.line_offset(buffer, end_line)
+    if end - start <= max_bytes:
+        return bytes(buffer[start:end]).decode("utf-8", errors="replace"), start_line, False
+    start = end - max_bytes
+    # Keep whole lines, unless the last line is larger than max_bytes
+    newline = buffer.find(b"\n", start, end - 1)
+    cut = newline < 0
+    if not cut:
+        start = newline + 1
+    # The last line is counted even without a trailing newline
+    first_line = end_line - buffer[start:end - 1].count(b"\n") - 1
+    return bytes(buffer[start:end]).decode("utf-8", errors="replace"), first_line, cut
+
+
+def _lines_label(first_line: int, last_line: int) -> str:
+    """`lines a-b` label of 1-based lines, `line a` for a single line."""
+    return f"line {first_line}" if first_line == last_line else f"lines {first_line}-{last_line}"
+
+
+def read_lines(
+    path: str,
+    offset: int = 1,
+    limit: Optional[int] = None,
+    max_bytes: int = DEFAULT_MAX_RANGE_SIZE,
+) -> ReadResult:
+    """
+    Read a range of lines of a text file, seeking with its line index instead of reading the lines before.
+
+    Args:
+        path: File path
+        offset: First line to read, 1-based. Negative offsets count from the end, e.g. -100 for the last 100 lines
+        limit: Maximum number of lines to read, None to read until the end
+        max_bytes: Maximum number of bytes returned, the range is cut at a line boundary
+
+    Returns:
+        The read result, with line positions
+    """
+    size = os.path.getsize(path)
+    with open_buffer(path) as buffer:
+        index = get_line_index(path, buffer)
+        total = index.total_lines
+        start_line = max(0, total + offset if offset < 0 else offset - 1)
+        end_line = total if limit is None else min(total, start_line + max(0, limit))
+        start_line = min(start_line, end_line)
+        text, end_line, truncated = _line_range(buffer, index, start_line, end_line, max_bytes)
+    return ReadResult(
+        path=path,
+        text=text,
+        unit="lines",
+        start=start_line,
+        end=end_line,
+        total=total,
+        size=size,
+        truncated=truncated,
+    )
+
+
+def read_bytes(
+    path: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    max_bytes: int = DEFAULT_MAX_RANGE_SIZE,
+) -> ReadResult:
+    """
+    Read a range of bytes of a file, as text for text files and as a hex dump for binary files.
+
+    Args:
+        path: File path
+        offset: First byte to read, 0-based. Negative offsets count from the end
+        limit: Maximum number of bytes to read, None to read until the end
+        max_bytes: Maximum number of bytes returned (MAX_HEXDUMP_SIZE for binary files)
+
+    Returns:
+        The read result, with byte positions
+    """
+    size = os.path.getsize(path)
+    binary = has_binary_extension(path) or is_binary_file(path)
+    if binary:
+        max_bytes = min(max_bytes, MAX_HEXDUMP_SIZE)
+    start = max(0, size + offset if offset < 0 else offset)
+    start = min(start, size)
+    end = size if limit is None else min(size, start + max(0, limit))
+    truncated = end - start > max_bytes
+    end = min(end, start + max_bytes)
+    with open_buffer(path) as buffer:
+        data = bytes(buffer[start:end])
+    return ReadResult(
+        path=path,
+        text=hexdump(data, start=start) if binary else data.decode("utf-8", errors="replace"),
+        unit="bytes",
+        start=start,
+        end=end,
+        total=size,
+        size=size,
+        truncated=truncated,
+        binary=binary,
+    )
+
+
+def preview_file(path: str, lines: int = DEFAULT_PREVIEW_LINES) -> str:
+    """
+    Describe a file too large or too binary to be returned whole: its size and line count,
+    with its first and last lines for text files.
+
+    Args:
+        path: File path
+        lines: Number of lines of the head and of the tail
+
+    Returns:
+        The preview
+    """
+    size = os.path.getsize(path)
+    if has_binary_extension(path) or is_binary_file(path):
+        head = read_bytes(path, offset=0, limit=256)
+        return (
+            f"{path} is a binary file of {format_size(size)}. First bytes:\n{head.text}\n"
+            f"Read other bytes with unit='bytes' and offset/limit, or open it with a dedicated library."
+        )
+    with open_buffer(path) as buffer:
+        index = get_line_index(path, buffer)
+        total = index.total_lines
+        head, head_end, head_cut = _line_range(buffer, index, 0, min(lines, total), PREVIEW_MAX_BYTES)
+        # A first line larger than the preview is shown cut
+        head_lines = max(head_end, 1) if total else 0
+        tail_start = max(head_lines, total - lines)
+        tail, tail_first, tail_cut = _last_lines(buffer, index, tail_start, total, PREVIEW_MAX_BYTES)
+    max_size = format_size(PREVIEW_MAX_BYTES)
+    head_label = _lines_label(1, head_lines)
+    if head_cut and head_end == 0:
+        head_label = f"start of line 1, its first {max_size}"
+    elif head_cut:
+        head_label += f" ({_lines_label(head_end + 1, min(lines, total))} left out, over {max_size})"
+    parts = [
+        f"{path} is {format_size(size)} with {total} lines, too large to read whole. "
+        f"Read a range with offset/limit, e.g. offset={max(1, total - 99)} for the last 100 lines.",
+        f"--- {head_label} ---\n{head.rstrip()}",
+    ]
+    if tail_start < total:
+        tail_label = _lines_label(tail_first + 1, total)
+        if tail_cut:
+            tail_label = f"end of line {total}, its last {max_size}"
+        elif tail_first > tail_start:
+            tail_label += f" ({_lines_label(tail_start + 1, tail_first)} left out, over {max_size})"
+        parts.append(f"--- {tail_label} ---\n{tail.rstrip()}")
+    return "\n".join(parts)
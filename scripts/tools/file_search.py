@@ -0,0 +1,385 @@
+import os
+import re
+import time
+import fnmatch
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Deque, Iterator, List, Optional, Pattern, Tuple
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+# Directories and files never worth searching in the agent workspace and data directories
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/",
+    "__pycache__/",
+    "node_modules/",
+    ".venv/",
+    "venv/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    "*.egg-info/",
+    "*.pyc",
+]
+# Caches and logs written by the agent tools at the top of the workspace, anchored at the workspace
+# root whatever directory is searched, so that indexed and walked searches skip the same files
+WORKSPACE_DIR = os.getenv("AGENT_WORK_DIR", "/home/agent_workspace")
+WORKSPACE_IGNORE_PATTERNS = ["/cache/", "/logs/"]
+# Ignore files read in each searched directory, with gitignore syntax
+IGNORE_FILE_NAMES = [".gitignore", ".agentignore"]
+
+DEFAULT_MAX_RESULTS = 200
+DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+# Extensions of the binary data files common in /home/data, classified without reading them
+BINARY_EXTENSIONS = {
+    ".nwb", ".h5", ".hdf5", ".mat", ".npy", ".npz", ".bin", ".dat", ".rhd", ".rhs", ".abf",
+    ".tif", ".tiff", ".png", ".jpg", ".jpeg", ".avi", ".mp4", ".mkv", ".zip", ".gz", ".tar", ".pdf",
+}
+# Characters of the matching line shown around a match
+CONTEXT_CHARS = 50
+
+
+@dataclass
+class FileMatch:
+    path: str
+    line_number: int
+    match: str
+    context: str
+
+    def format(self) -> str:
+        return f"File: {self.path}:{self.line_number}\nMatch: {self.match}\nContext: ...{self.context}..."
+
+
+@dataclass
+class SearchReport:
+    """Matches of a search, with what was skipped and whether the search stopped early."""
+
+    matches: List[FileMatch] = field(default_factory=list)
+    files_searched: int = 0
+    skipped_binary: int = 0
+    skipped_large: int = 0
+    truncated: bool = False
+    timed_out: bool = False
+
+    def format(self, max_results: int) -> str:
+        if not self.matches:
+            text = "No matches found"
+        else:
+            text = "\n\n".join(m.format() for m in self.matches)
+        notes = []
+        if self.truncated:
+            notes.append(f"Stopped at {max_results} matches, there may be more: narrow the path, regex or file_pattern.")
+        if self.timed_out:
+            notes.append("The search timed out before all files were searched: narrow the path or file_pattern.")
+        if self.skipped_binary or self.skipped_large:
+            notes.append(f"Skipped {self.skipped_binary} binary files and {self.skipped_large} files larger than the size cap.")
+        return "\n\n".join([text, *notes])
+
+
+class IgnoreRules:
+    """Subset of the gitignore syntax: glob patterns, `/`-anchored patterns, trailing `/` for
+    directories only and `!` negations, applied to paths relative to the directory of the file
+    that declared them."""
+
+    def __init__(self, patterns: List[Tuple[str, str]]):
+        """
+        Args:
+            patterns: List of (base directory, pattern) pairs, in declaration order
+        """
+        self.patterns = patterns
+
+    @classmethod
+    def default(cls, root: str) -> "IgnoreRules":
+        return cls(
+            [(root, p) for p in DEFAULT_IGNORE_PATTERNS]
+            + [(os.path.abspath(WORKSPACE_DIR), p) for p in WORKSPACE_IGNORE_PATTERNS]
+        )
+
+    def extended(self, directory: str) -> "IgnoreRules":
+        """Rules of a subdirectory: these rules plus the ones of the ignore files it contains."""
+        patterns = []
+        for name in IGNORE_FILE_NAMES:
+            ignore_file = os.path.join(directory, name)
+            if not os.path.isfile(ignore_file):
+                continue
+            try:
+                with open(ignore_file, "r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith("#"):
+                            patterns.append((directory, line))
+            except OSError as e:
+                logger.warning(f"Failed to read ignore file {ignore_file}: {str(e)}")
+        return IgnoreRules(self.patterns + patterns) if patterns else self
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, pattern in self.patterns:
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            if pattern.endswith("/"):
+                if not is_dir:
+                    continue
+                pattern = pattern.rstrip("/")
+            relative = os.path.relpath(path, base)
+            if relative.startswith(".."):
+                continue
+            if pattern.startswith("/") or "/" in pattern:
+                matched = fnmatch.fnmatch(relative, pattern.lstrip("/"))
+            else:
+                matched = fnmatch.fnmatch(os.path.basename(path), pattern)
+            if matched:
+                ignored = not negated
+        return ignored
+
+
+def expand_braces(pattern: str) -> List[str]:
+    """Expand `{a,b}` alternatives of a glob pattern, e.g. '*.{js,ts}' -> ['*.js', '*.ts']."""
+    match = re.search(r"\{([^{}]*)\}", pattern)
+    if match is None:
+        return [pattern]
+    expanded = []
+    for alternative in match.group(1).split(","):
+        expanded.extend(expand_braces(pattern[:match.start()] + alternative + pattern[match.end():]))
+    return expanded
+
+
+def matches_file_pattern(path: str, root: str, patterns: List[str]) -> bool:
+    """
+    Whether a file matches one of the glob patterns of `expand_braces`.
+
+    Patterns with a `/` are matched against the path relative to the searched directory (e.g.
+    'src/*.py', where `*` also matches across directories, or '**/test_*.py'), the others
+    against the file name.
+
+    Args:
+        path: File path
+        root: Searched directory
+        patterns: Glob patterns
+
+    Returns:
+        True if the file matches one of the patterns
+    """
+    relative = None
+    for pattern in patterns:
+        if "/" not in pattern:
+            if fnmatch.fnmatch(os.path.basename(path), pattern):
+                return True
+            continue
+        if relative is None:
+            relative = os.path.relpath(path, root)
+        pattern = pattern.lstrip("/")
+        if pattern.startswith("./"):
+            pattern = pattern[2:]
+        # '**/' also matches no directory at all
+        if fnmatch.fnmatch(relative, pattern) or (pattern.startswith("**/") and fnmatch.fnmatch(relative, pattern[3:])):
+            return True
+    return False
+
+
+def has_binary_extension(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS
+
+
+def is_binary_file(path: str, sniff_bytes: int = BINARY_SNIFF_BYTES) -> bool:
+    """Whether a file looks binary, from a NUL byte or a large share of undecodable bytes in its first bytes."""
+    with open(path, "rb") as f:
+        head = f.read(sniff_bytes)
+    if not head:
+        return False
+    if b"\x00" in head:
+        return True
+    text_bytes = bytes(range(32, 127)) + b"\n\r\t\f\b"
+    non_text = head.translate(None, text_bytes)
+    # UTF-8 multibyte characters are above 127: only count them as binary if they do not decode
+    if len(non_text) / len(head) > 0.3:
+        try:
+            head.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # A multibyte character cut at the end of the sniffed bytes is still text
+            return e.start < len(head) - 4
+    return False
+
+
+def iter_files(
+    root: str,
+    file_pattern: Optional[str] = None,
+    include_hidden: bool = False,
+) -> Iterator[os.DirEntry]:
+    """
+    Walk a directory tree with `os.scandir`, in sorted order, honoring the ignore rules.
+
+    Args:
+        root: Directory to walk
+        file_pattern: Optional glob pattern the files must match, with `{a,b}` alternatives, matched
+            against the path relative to `root` if it contains a `/` (see `matches_file_pattern`)
+        include_hidden: Whether to include the files and directories starting with a dot
+
+    Yields:
+        Directory entries of the matching files
+    """
+    patterns = expand_braces(file_pattern) if file_pattern else None
+    stack = [(root, IgnoreRules.default(root).extended(root))]
+    while stack:
+        directory, rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Failed to list directory {directory}: {str(e)}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            if not include_hidden and entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if rules.is_ignored(entry.path, is_dir=is_dir):
+                continue
+            if is_dir:
+                subdirectories.append(entry.path)
+            elif entry.is_file() and (patterns is None or matches_file_pattern(entry.path, root, patterns)):
+                yield entry
+        # Depth-first, in sorted order
+        for subdirectory in reversed(subdirectories):
+            stack.append((subdirectory, rules.extended(subdirectory)))
+
+
+def _search_file(
+    path: str,
+    pattern: Pattern,
+    max_matches: int,
+    stop: threading.Event,
+) -> List[FileMatch]:
+    """Search a text file line by line, stopping after `max_matches` matches or when `stop` is set."""
+    matches = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line_number, line in enumerate(f, start=1):
+            if stop.is_set():
+                break
+            for match in pattern.finditer(line):
+                start = max(0, match.start() - CONTEXT_CHARS)
+                end = min(len(line), match.end() + CONTEXT_CHARS)
+                matches.append(
+                    FileMatch(
+                        path=path,
+                        line_number=line_number,
+                        match=match.group(),
+                        context=line[start:end].rstrip("\n"),
+                    )
+                )
+                if len(matches) >= max_matches:
+                    return matches
+    return matches
+
+
+def search_files(
+    root: str,
+    regex: str,
+    file_pattern: Optional[str] = None,
+    max_results: int = DEFAULT_MAX_RESULTS,
+    max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+    max_workers: int = 8,
+    timeout: Optional[float] = 30.0,
+    files: Optional[Iterator[str]] = None,
+) -> SearchReport:
+    """
+    Search a regex in the text files of a directory tree, in bounded time and memory.
+
+    Files are streamed line by line by a thread pool, in the sorted order of the walk, with a
+    bounded number of files in flight. Binary files (sniffed from their first bytes), files
+    larger than `max_file_size` and ignored paths (see `IgnoreRules`) are skipped. The search
+    stops after `max_results` matches or `timeout` seconds. Patterns match within a line.
+
+    Args:
+        root: Directory to search
+        regex: Regular expression to search for
+        file_pattern: Optional glob pattern of the files to search, e.g. '*.py', '*.{yaml,yml}' or 'src/*.py'
+        max_results: Maximum number of matches returned
+        max_file_size: Files larger than this number of bytes are skipped
+        max_workers: Number of files searched concurrently
+        timeout: Seconds after which the search stops with the matches found so far, None for no limit
+        files: Optional candidate file paths, e.g. from a file index, instead of walking `root`
+
+    Returns:
+        The search report, with the matches sorted in walk order
+    """
+    pattern = re.compile(regex)
+    report = SearchReport()
+    stop = threading.Event()
+    start_time = time.monotonic()
+    if files is None:
+        files = (entry.path for entry in iter_files(root, file_pattern=file_pattern))
+
+    counts_lock = threading.Lock()
+
+    def search(path: str) -> List[FileMatch]:
+        if stop.is_set():
+            return []
+        try:
+            if os.path.getsize(path) > max_file_size:
+                with counts_lock:
+                    report.skipped_large += 1
+                return []
+            if has_binary_extension(path) or is_binary_file(path):
+                with counts_lock:
+                    report.skipped_binary += 1
+                return []
+            with counts_lock:
+                report.files_searched += 1
+            return _search_file(path, pattern, max_matches=max_results, stop=stop)
+        except Exception as e:
+            logger.warning(f"Failed to search file {path}: {str(e)}")
+            return []
+
+    def collect(future: Future) -> None:
+        """Add the matches of the oldest file in flight, in walk order, stopping at the time or result limit."""
+        remaining_time = None if timeout is None else max(0.0, timeout - (time.monotonic() - start_time))
+        try:
+            file_matches = future.result(timeout=remaining_time)
+        except FutureTimeoutError:
+            report.timed_out = True
+            stop.set()
+            return
+        remaining = max_results - len(report.matches)
+        if len(file_matches) > remaining:
+            report.truncated = True
+        report.matches.extend(file_matches[:remaining])
+        if len(report.matches) >= max_results:
+            stop.set()
+
+    in_flight: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-files") as executor:
+        for path in files:
+            if stop.is_set():
+                break
+            if timeout is not None and time.monotonic() - start_time > timeout:
+                report.timed_out = True
+                stop.set()
+                break
+            in_flight.append(executor.submit(search, path))
+            if len(in_flight) >= max_workers * 4:
+                collect(in_flight.popleft())
+        else:
+            # All files were submitted, wait for the remaining ones
+            while in_flight and not stop.is_set():
+                collect(in_flight.popleft())
+        # Stopped early with files left unsearched
+        if in_flight and not report.timed_out:
+            report.truncated = True
+        for future in in_flight:
+            future.cancel()
+
+    logger.info(
+        f"Searched {report.files_searched} files in {root} in {time.monotonic() - start_time:.2f}s: "
+        f"{len(report.matches)} matches, truncated={report.truncated}, timed_out={report.timed_out}"
+    )
+    return report
@@ -1,10 +1,21 @@
 import os
-import re
-import glob
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from smolagents import Tool
 
+from .file_index import FileIndex, get_file_index
+from .file_reader import DEFAULT_MAX_READ_SIZE, preview_file, read_bytes, read_lines
+from .patching import FilePatch, Hunk, PatchError, apply_hunks, apply_patches, atomic_write, parse_patch
+from .file_search import (
+    DEFAULT_MAX_FILE_SIZE,
+    DEFAULT_MAX_RESULTS,
+    IgnoreRules,
+    has_binary_extension,
+    is_binary_file,
+    search_files,
+)
+from .tree_view import DEFAULT_MAX_DEPTH, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_LINES, TreeEntry, render_tree, scan_entries
+
 # Configure logging
 from utils.logger import set_logger
 logger = set_logger(__name__)
@@ -47,10 +58,21 @@ class FileSystemTool(Tool):
 
         return abs_path
 
+    def _indexed(self, path: str) -> Optional[FileIndex]:
+        """The shared file index if it covers a directory, None to walk the file system instead."""
+        index = get_file_index()
+        if index is None:
+            return None
+        try:
+            return index if index.covers(path) else None
+        except Exception as e:
+            logger.warning(f"File index unavailable for {path}: {str(e)}")
+            return None
+
 
 class WriteToFileTool(FileSystemTool):
     name = "write_to_file"
-    description = "Request to write content to a file at the specified path. If the file exists, it will be overwritten with the provided content. If the file doesn't exist, it will be created. This tool will automatically create any directories needed to write the file."
+    description = "Request to write content to a file at the specified path. If the file exists, it will be overwritten with the provided content. If the file doesn't exist, it will be created. This tool will automatically create any directories needed to write the file. To modify parts of an existing file, prefer apply_patch."
     inputs = {
         "path": {
             "type": "string",
@@ -67,11 +89,8 @@ class WriteToFileTool(FileSystemTool):
         try:
             path = self._validate_path_write(path)
 
-            # Create directories if they don't exist
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(content)
+            # Create directories if they don't exist, and replace the file atomically
+            atomic_write(path, content)
 
             logger.info(f"Successfully wrote to file: {path}")
             return f"Successfully wrote content to {path}"
@@ -83,24 +102,64 @@ class WriteToFileTool(FileSystemTool):
 
 class ReadFileTool(FileSystemTool):
     name = "read_file"
-    description = "Request to read the contents of a file at the specified path. Use this when you need to examine the contents of an existing file you do not know the contents of, for example to analyze code, review text files, or extract information from configuration files."
+    description = """
+    Request to read the contents of a file at the specified path. Use this when you need to examine the contents of an existing file you do not know the contents of, for example to analyze code, review text files, or extract information from configuration files.
+    Files larger than 256 KB and binary files are not returned whole: you get their size, line count and first and last lines instead.
+    Use offset and limit to read a range of lines (or of bytes with unit='bytes'), e.g. offset=90000 and limit=100 for lines 90000 to 90099, or offset=-100 for the last 100 lines.
+    """
     inputs = {
         "path": {
             "type": "string",
             "description": "The path of the file to read (relative to the agent's working directory). The file must exist and be readable."
         },
+        "offset": {
+            "type": "integer",
+            "description": "Optional first line to read (1-based), or first byte (0-based) with unit='bytes'. Negative values count from the end of the file.",
+            "nullable": True,
+        },
+        "limit": {
+            "type": "integer",
+            "description": "Optional maximum number of lines to read, or of bytes with unit='bytes'.",
+            "nullable": True,
+        },
+        "unit": {
+            "type": "string",
+            "description": "Optional unit of offset and limit: 'lines' (default) or 'bytes'. Bytes of binary files are returned as a hex dump.",
+            "nullable": True,
+        },
     }
     output_type = "string"
 
-    def forward(self, path: str) -> str:
+    def __init__(self, work_dir: str = "/home/agent_workspace", max_read_size: int = DEFAULT_MAX_READ_SIZE):
+        super().__init__(work_dir=work_dir)
+        self.max_read_size = max_read_size
+
+    def forward(
+        self,
+        path: str,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+        unit: Optional[str] = None,
+    ) -> str:
         try:
             path = self._validate_path_read(path)
 
             if not os.path.exists(path):
                 raise FileNotFoundError(f"File not found: {path}")
 
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read()
+            unit = unit or "lines"
+            if unit not in ("lines", "bytes"):
+                raise ValueError(f"Invalid unit '{unit}', expected 'lines' or 'bytes'")
+
+            if unit == "bytes":
+                content = read_bytes(path, offset=offset or 0, limit=limit).format()
+            elif offset is not None or limit is not None:
+                content = read_lines(path, offset=offset or 1, limit=limit).format()
+            elif os.path.getsize(path) > self.max_read_size or has_binary_extension(path) or is_binary_file(path):
+                content = preview_file(path)
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
 
             logger.info(f"Successfully read file: {path}")
             return content
@@ -117,6 +176,8 @@ class ReplaceInFileTool(FileSystemTool):
     need to make targeted changes to specific parts of a file without overwriting the entire file.
     It's especially useful for small, localized changes like updating function implementations,
     changing variable names, or modifying specific sections of text.
+    The search content must match exactly once in the file, otherwise nothing is changed.
+    To make several changes at once, in one or more files, use apply_patch.
     """
     inputs = {
         "path": {
@@ -125,7 +186,7 @@ class ReplaceInFileTool(FileSystemTool):
         },
         "search": {
             "type": "string",
-            "description": "The exact content to find in the file. This must match character-for-character, including whitespace and indentation."
+            "description": "The exact content to find in the file. This must match character-for-character, including whitespace and indentation, and occur exactly once in the file."
         },
         "replace": {
             "type": "string",
@@ -142,15 +203,14 @@ class ReplaceInFileTool(FileSystemTool):
                 raise FileNotFoundError(f"File not found: {path}")
 
             # Read file content
-            with open(path, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8", newline="") as f:
                 content = f.read()
 
-            # Perform replacement
-            new_content = content.replace(search, replace)
+            # Perform replacement, failing unless the search content matches exactly once
+            new_content = apply_hunks(content, [Hunk(search=search, replace=replace)])
 
             # Write back to file
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(new_content)
+            atomic_write(path, new_content)
 
             logger.info(f"Successfully replaced content in file: {path}")
             return f"Successfully replaced content in {path}"
@@ -160,6 +220,79 @@ class ReplaceInFileTool(FileSystemTool):
             return f"Failed to replace content in file {path}: {str(e)}"
 
 
+class ApplyPatchTool(FileSystemTool):
+    name = "apply_patch"
+    description = """
+    Request to apply several changes at once, to one or more files, as a unified diff or as search/replace blocks.
+    This is the most efficient way to edit existing files: only the changed lines are sent, and all changes are
+    applied in a single step. The patch is applied atomically: if any hunk does not apply, no file is modified
+    and the error lists every failing hunk.
+    Each hunk is located by its content, not by its line numbers: its context and removed lines (or its SEARCH
+    text) must match the file character for character, exactly once.
+    Search/replace blocks format, one block per change, each preceded by the file path:
+    path/to/file.py
+    <<<<<<< SEARCH
+    exact lines to find
+    =======
+    lines to replace them with
+    >>>>>>> REPLACE
+    A unified diff with `--- /dev/null` creates a file, and one with `+++ /dev/null` deletes it.
+    """
+    inputs = {
+        "patch": {
+            "type": "string",
+            "description": "Optional unified diff (as produced by `git diff` or `diff -u`) or search/replace blocks.",
+            "nullable": True,
+        },
+        "edits": {
+            "type": "array",
+            "description": "Optional list of edits, as an alternative to patch: dictionaries with keys 'path', 'search' and 'replace'. An empty 'search' creates a new file with the 'replace' content.",
+            "nullable": True,
+        },
+        "base_dir": {
+            "type": "string",
+            "description": "Optional directory the relative paths of the patch are relative to, e.g. the root of a git repository. Defaults to the agent's working directory.",
+            "nullable": True,
+        },
+    }
+    output_type = "string"
+
+    def forward(
+        self,
+        patch: Optional[str] = None,
+        edits: Optional[List[Dict[str, str]]] = None,
+        base_dir: Optional[str] = None,
+    ) -> str:
+        try:
+            if not patch and not edits:
+                raise ValueError("Provide either a patch or a list of edits")
+
+            base_dir = os.path.abspath(base_dir or self.work_dir)
+
+            def resolve_path(path: str) -> str:
+                return self._validate_path_write(os.path.join(base_dir, path))
+
+            file_patches = parse_patch(patch) if patch else []
+            for edit in edits or []:
+                missing = {"path", "search", "replace"} - set(edit)
+                if missing:
+                    raise ValueError(f"Edit {edit} is missing the keys {sorted(missing)}")
+                file_patches.append(FilePatch(path=edit["path"], hunks=[Hunk(search=edit["search"], replace=edit["replace"])]))
+
+            summary = apply_patches(file_patches, resolve_path=resolve_path)
+
+            logger.info(f"Successfully applied patch:\n{summary}")
+            return f"Successfully applied patch:\n{summary}"
+
+        except PatchError as e:
+            logger.error(f"Failed to apply patch: {str(e)}")
+            return str(e)
+
+        except Exception as e:
+            logger.error(f"Failed to apply patch: {str(e)}")
+            return f"Failed to apply patch: {str(e)}"
+
+
 class SearchFilesTool(FileSystemTool):
     name = "search_files"
     description = """
@@ -167,6 +300,8 @@ class SearchFilesTool(FileSystemTool):
     This tool searches for patterns or specific content across multiple files, displaying each match with
     encapsulating context. It's particularly useful for understanding code patterns, finding specific
     implementations, or identifying areas that need refactoring.
+    Patterns are matched line by line. Binary files, files larger than 10 MB and paths ignored by
+    .gitignore/.agentignore files are skipped, and the search stops after max_results matches.
     """
     inputs = {
         "path": {
@@ -179,48 +314,63 @@ class SearchFilesTool(FileSystemTool):
         },
         "file_pattern": {
             "type": "string",
-            "description": "Optional glob pattern to filter files (e.g., '*.py' for Python files, '*.{js,ts}' for JavaScript and TypeScript). If not provided, it will search all files.",
+            "description": "Optional glob pattern to filter files (e.g., '*.py' for Python files, '*.{js,ts}' for JavaScript and TypeScript). Patterns containing '/' match the path relative to the searched directory (e.g., 'src/*.py'). If not provided, it will search all files.",
+            "nullable": True,
+        },
+        "max_results": {
+            "type": "integer",
+            "description": f"Optional maximum number of matches to return (default {DEFAULT_MAX_RESULTS}).",
             "nullable": True,
         },
     }
     output_type = "string"
 
-    def forward(self, path: str, regex: str, file_pattern: Optional[str] = None) -> str:
+    def __init__(
+        self,
+        work_dir: str = "/home/agent_workspace",
+        max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+        max_workers: int = 8,
+        timeout: float = 30.0,
+    ):
+        super().__init__(work_dir=work_dir)
+        self.max_file_size = max_file_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def forward(
+        self,
+        path: str,
+        regex: str,
+        file_pattern: Optional[str] = None,
+        max_results: Optional[int] = None,
+    ) -> str:
         try:
             path = self._validate_path_read(path)
 
             if not os.path.isdir(path):
                 raise NotADirectoryError(f"Not a directory: {path}")
 
-            # Compile regex pattern
-            pattern = re.compile(regex)
-
-            # Get list of files to search
-            if file_pattern:
-                files = glob.glob(os.path.join(path, "**", file_pattern), recursive=True)
-            else:
-                files = glob.glob(os.path.join(path, "**", "*"), recursive=True)
-
-            # Search files
-            results = []
-            for file in files:
-                if os.path.isfile(file):
-                    try:
-                        with open(file, "r", encoding="utf-8") as f:
-                            content = f.read()
-                            matches = pattern.finditer(content)
-                            for match in matches:
-                                start = max(0, match.start() - 50)
-                                end = min(len(content), match.end() + 50)
-                                context = content[start:end]
-                                results.append(
-                                    f"File: {file}\nMatch: {match.group()}\nContext: ...{context}..."
-                                )
-                    except Exception as e:
-                        logger.warning(f"Failed to search file {file}: {str(e)}")
+            max_results = max_results or DEFAULT_MAX_RESULTS
+            index = self._indexed(path)
+            # The index skips the files that cannot contain the regex literals without reading them
+            files = (
+                index.search_candidates(path, regex, file_pattern=file_pattern, max_workers=self.max_workers)
+                if index is not None
+                else None
+            )
+            report = search_files(
+                root=path,
+                regex=regex,
+                file_pattern=file_pattern,
+                max_results=max_results,
+                max_file_size=self.max_file_size,
+                max_workers=self.max_workers,
+                timeout=self.timeout,
+                files=files,
+            )
 
             logger.info(f"Successfully searched files in: {path}")
-            return "\n\n".join(results) if results else "No matches found"
+            return report.format(max_results=max_results)
 
         except Exception as e:
             logger.error(f"Failed to search files in {path}: {str(e)}")
@@ -247,6 +397,18 @@ class ListFilesTool(FileSystemTool):
     }
     output_type = "string"
 
+    @staticmethod
+    def _walk_files(directory: str, path: str) -> List[str]:
+        """Paths relative to `path` of all the files below a directory."""
+        files = []
+        for root, dirs, filenames in os.walk(directory):
+            rel_root = os.path.relpath(root, path)
+            if rel_root == ".":
+                files.extend(filenames)
+            else:
+                files.extend(os.path.join(rel_root, f) for f in filenames)
+        return files
+
     def forward(self, path: str, recursive: Optional[bool] = False) -> str:
         try:
             path = self._validate_path_read(path)
@@ -255,14 +417,19 @@ class ListFilesTool(FileSystemTool):
                 raise NotADirectoryError(f"Not a directory: {path}")
 
             # Get file listing
-            if recursive:
+            index = self._indexed(path)
+            if index is not None and recursive:
                 files = []
-                for root, dirs, filenames in os.walk(path):
-                    rel_root = os.path.relpath(root, path)
-                    if rel_root == ".":
-                        files.extend(filenames)
-                    else:
-                        files.extend(os.path.join(rel_root, f) for f in filenames)
+                for entry in index.walk(path, include_ignored=True):
+                    if not entry.is_dir:
+                        files.append(os.path.relpath(entry.path, path))
+                    elif entry.ignored:
+                        # Ignored directories are not indexed, but all files are listed
+                        files.extend(self._walk_files(entry.path, path))
+            elif index is not None:
+                files = [e.name for e in index.list_directory(path)]
+            elif recursive:
+                files = self._walk_files(path, path)
             else:
                 files = os.listdir(path)
 
@@ -307,31 +474,77 @@ class DeleteFileTool(FileSystemTool):
 
 class DirectoryTreeTool(FileSystemTool):
     name = "directory_tree"
-    description = "Generate a tree view of the directory structure"
+    description = """
+    Generate a tree view of the directory structure, with file sizes. The output is bounded: numbered files are
+    collapsed into one line (e.g. `frame_{00000..19999}.tif (20000 files, 38.0 GB)`), numbered directories show
+    the first one with its contents and the others on one line (e.g. `sub-{02..10}/ (9 more directories)`), directories
+    deeper than max_depth and ignored directories (e.g. .git) only show their number of entries, ignored files
+    (e.g. gitignored *.nwb outputs) are marked as such, and long directories are cut after max_entries lines. Call it again on a subdirectory to see more.
+    """
     inputs = {
         "path": {"type": "string", "description": "Path to the directory to generate tree for"},
+        "max_depth": {
+            "type": "integer",
+            "description": f"Optional number of directory levels to show (default {DEFAULT_MAX_DEPTH}).",
+            "nullable": True,
+        },
+        "max_entries": {
+            "type": "integer",
+            "description": f"Optional maximum number of lines per directory (default {DEFAULT_MAX_ENTRIES}).",
+            "nullable": True,
+        },
+        "ignore": {
+            "type": "array",
+            "description": "Optional glob patterns of file and directory names to leave out, e.g. ['*.log', 'tmp*'].",
+            "nullable": True,
+        },
     }
     output_type = "string"
 
-    def forward(self, path: str) -> str:
+    def __init__(self, work_dir: str = "/home/agent_workspace", max_lines: int = DEFAULT_MAX_LINES):
+        super().__init__(work_dir=work_dir)
+        self.max_lines = max_lines
+
+    @staticmethod
+    def _index_lister(index: FileIndex) -> Callable[[str], List[TreeEntry]]:
+        """Directory lister of `render_tree` backed by the file index."""
+
+        def list_entries(directory: str) -> List[TreeEntry]:
+            # Ignored directories are not indexed, their entries are only counted
+            if not index.covers(directory):
+                return scan_entries(directory, IgnoreRules([]))
+            return [
+                TreeEntry(name=e.name, path=e.path, is_dir=e.is_dir, size=e.size, ignored=e.ignored)
+                for e in index.list_directory(directory)
+            ]
+
+        return list_entries
+
+    def forward(
+        self,
+        path: str,
+        max_depth: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        ignore: Optional[List[str]] = None,
+    ) -> str:
         try:
-            from directory_tree import DisplayTree
-
             path = self._validate_path_read(path)
 
-            tree = DisplayTree(
-                dirPath=path,
-                stringRep=True,
-                header=False,
-                maxDepth=float('inf'),
-                showHidden=True,
-                ignoreList=None,
-                onlyFiles=False,
-                onlyDirs=False,
-                sortBy=0,
+            if not os.path.isdir(path):
+                raise NotADirectoryError(f"Not a directory: {path}")
+
+            index = self._indexed(path)
+            list_entries = self._index_lister(index) if index is not None else None
+            tree = render_tree(
+                path,
+                list_entries=list_entries,
+                max_depth=max_depth or DEFAULT_MAX_DEPTH,
+                max_entries=max_entries or DEFAULT_MAX_ENTRIES,
+                max_lines=self.max_lines,
+                ignore_patterns=ignore,
             )
 
-            logger.info(f"Directory tree: {tree}")
+            logger.info(f"Generated directory tree of {path}: {tree.count(chr(10)) + 1} lines")
             return tree
 
         except Exception as e:
@@ -0,0 +1,406 @@
+import os
+import re
+import ast
+import time
+import uuid
+import asyncio
+import hashlib
+import subprocess
+from pathlib import Path
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
+
+from qdrant_client import AsyncQdrantClient, models
+
+from .semantic_search import generate_embeddings, get_vector_names
+from .search_filters import ensure_payload_indexes
+from .local_index import VERSION_MARKER_ID
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+NEUROCONV_REPO_URL = "https://github.com/catalystneuro/neuroconv"
+# Releases are cloned outside of the agent workspace, so that the agent file tools never index or search them
+DEFAULT_SOURCE_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "neuroconv_agent", "sources"
+)
+
+# Namespace of the deterministic point IDs, derived from the chunk source file and content hash
+CHUNK_ID_NAMESPACE = uuid.UUID("8f0e4bd2-0a7c-4e7e-9a51-3b4f1c8d2e60")
+
+RST_HEADING_PATTERN = re.compile(r"^(?P<title>\S.*)\n(?P<underline>[=\-~^\"'`#*+]{3,})\s*$", re.MULTILINE)
+MD_HEADING_PATTERN = re.compile(r"^#{1,6}\s+(?P<title>.+)$", re.MULTILINE)
+
+
+@dataclass
+class Chunk:
+    """A piece of NeuroConv documentation or source code to embed."""
+
+    content: str
+    source_file: str
+    chunk_type: str
+    context: str
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(f"{self.context}\n{self.content}".encode()).hexdigest()
+
+    @property
+    def id(self) -> str:
+        return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{self.source_file}:{self.content_hash}"))
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "content": self.content,
+            "source_file": self.source_file,
+            "chunk_type": self.chunk_type,
+            "context": self.context,
+            "content_hash": self.content_hash,
+        }
+
+
+@dataclass
+class IngestionStats:
+    """What an ingestion run changed in the collection."""
+
+    files: int = 0
+    chunks: int = 0
+    unchanged: int = 0
+    embedded: int = 0
+    stale: int = 0
+    deleted: int = 0
+    embedding_requests: int = 0
+    content_version: Optional[str] = None
+    embedded_characters: int = 0
+    collection_created: bool = False
+    payload_indexes_created: List[str] = field(default_factory=list)
+    vector_names: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def split_text(text: str, max_chars: int = 2000, overlap: int = 200) -> List[str]:
+    """Split text on line boundaries into pieces of at most `max_chars`, with `overlap` characters of overlap."""
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    lines = text.splitlines(keepends=True)
+    current = ""
+    for line in lines:
+        if current and len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = current[-overlap:] if overlap else ""
+        # Lines longer than max_chars are hard-split
+        while len(line) > max_chars:
+            pieces.append(current + line[:max_chars - len(current)])
+            line = line[max_chars - len(current):]
+            current = ""
+        current += line
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+
+def chunk_python_file(path: Path, relative_path: str, max_chars: int = 2000) -> List[Chunk]:
+    """Chunk a Python module into its top-level classes and functions, plus the module level code."""
+    source = path.read_text(encoding="utf-8", errors="replace")
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return [
+            Chunk(content=piece, source_file=relative_path, chunk_type="code", context=relative_path)
+            for piece in split_text(source, max_chars=max_chars)
+        ]
+
+    lines = source.splitlines(keepends=True)
+    chunks = []
+    module_lines = []
+    covered_until = 0
+    for node in tree.body:
+        start = (node.decorator_list[0].lineno if getattr(node, "decorator_list", None) else node.lineno) - 1
+        end = node.end_lineno
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            module_lines.extend(lines[covered_until:start])
+            kind = "class" if isinstance(node, ast.ClassDef) else "def"
+            context = f"{relative_path} > {kind} {node.name}"
+            for piece in split_text("".join(lines[start:end]), max_chars=max_chars):
+                chunks.append(Chunk(content=piece, source_file=relative_path, chunk_type="code", context=context))
+            covered_until = end
+    module_lines.extend(lines[covered_until:])
+
+    module_code = "".join(module_lines).strip()
+    module_chunks = [
+        Chunk(content=piece, source_file=relative_path, chunk_type="code", context=f"{relative_path} > module")
+        for piece in (split_text(module_code, max_chars=max_chars) if module_code else [])
+    ]
+    return module_chunks + chunks
+
+
+def chunk_doc_file(path: Path, relative_path: str, max_chars: int = 2000) -> List[Chunk]:
+    """Chunk a reStructuredText or Markdown document by section."""
+    text = path.read_text(encoding="utf-8", errors="replace")
+    pattern = MD_HEADING_PATTERN if path.suffix == ".md" else RST_HEADING_PATTERN
+    headings = list(pattern.finditer(text))
+
+    sections = []
+    if not headings or headings[0].start() > 0:
+        sections.append((Path(relative_path).stem, text[:headings[0].start()] if headings else text))
+    for i, heading in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        sections.append((heading.group("title").strip(), text[heading.start():end]))
+
+    chunks = []
+    for title, section in sections:
+        if not section.strip():
+            continue
+        for piece in split_text(section.strip(), max_chars=max_chars):
+            chunks.append(Chunk(content=piece, source_file=relative_path, chunk_type="docs", context=f"{relative_path} > {title}"))
+    return chunks
+
+
+def iter_source_files(source_dir: Path) -> Iterator[Path]:
+    """Yield the NeuroConv source modules and documentation pages of a repository checkout."""
+    for pattern, root in (("*.py", source_dir / "src"), ("*.rst", source_dir / "docs"), ("*.md", source_dir / "docs")):
+        if root.exists():
+            yield from sorted(p for p in root.rglob(pattern) if "_build" not in p.parts)
+
+
+def chunk_repository(source_dir: Union[str, Path], max_chars: int = 2000) -> List[Chunk]:
+    """
+    Chunk the documentation and source code of a NeuroConv repository checkout.
+
+    Args:
+        source_dir: Root of the NeuroConv repository
+        max_chars: Maximum number of characters per chunk
+
+    Returns:
+        List of chunks, deduplicated by ID
+    """
+    source_dir = Path(source_dir)
+    chunks: Dict[str, Chunk] = {}
+    for path in iter_source_files(source_dir):
+        relative_path = str(path.relative_to(source_dir))
+        if path.suffix == ".py":
+            file_chunks = chunk_python_file(path, relative_path, max_chars=max_chars)
+        else:
+            file_chunks = chunk_doc_file(path, relative_path, max_chars=max_chars)
+        for chunk in file_chunks:
+            chunks.setdefault(chunk.id, chunk)
+    return list(chunks.values())
+
+
+def checkout_neuroconv(
+    version: str,
+    cache_dir: Union[str, Path] = DEFAULT_SOURCE_CACHE_DIR,
+    repo_url: str = NEUROCONV_REPO_URL,
+) -> Path:
+    """
+    Shallow-clone a NeuroConv release, reusing an existing clone of the same version.
+
+    Other repositories with the same `src/` and `docs/` layout (e.g. PyNWB, HDMF, NWB Inspector)
+    can be cloned with `repo_url`, into a subdirectory of `cache_dir` named after the repository.
+
+    Args:
+        version: Release version, e.g. "0.7.3"
+        cache_dir: Directory the releases are cloned into
+        repo_url: URL of the repository to clone
+
+    Returns:
+        Path of the checkout
+    """
+    target = Path(cache_dir) / f"v{version}"
+    if repo_url != NEUROCONV_REPO_URL:
+        target = Path(cache_dir) / repo_url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git") / f"v{version}"
+    if not (target / ".git").exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Cloning {repo_url} v{version} into {target}")
+        subprocess.run(
+            ["git", "clone", "--depth", "1", "--branch", f"v{version}", repo_url, str(target)],
+            check=True,
+            capture_output=True,
+        )
+    return target
+
+
+def vector_text(chunk: Chunk, vector_name: str) -> str:
+    """Text embedded for a named vector: the chunk content, or its location followed by the content."""
+    if vector_name == "content":
+        return chunk.content
+    if vector_name == "context":
+        return f"{chunk.context}\n{chunk.content}"
+    raise ValueError(f"Unknown vector name: {vector_name}. Must be one of: 'content', 'context'.")
+
+
+async def fetch_point_ids(client: AsyncQdrantClient, collection_name: str, batch_size: int = 1000) -> Set[str]:
+    """Scroll all point IDs of a collection, without payloads or vectors."""
+    ids: Set[str] = set()
+    offset = None
+    while True:
+        records, offset = await client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(r.id) for r in records if str(r.id) != VERSION_MARKER_ID)
+        if offset is None:
+            break
+    return ids
+
+
+def content_version(point_ids: Set[str]) -> str:
+    """Version of the contents of a collection: a hash of its point IDs, which are content hashes."""
+    return hashlib.sha256("\n".join(sorted(point_ids)).encode()).hexdigest()[:16]
+
+
+async def write_version_marker(client: AsyncQdrantClient, collection_name: str, point_ids: Set[str]) -> str:
+    """Store the content version of a collection in a point without vectors, read by `get_collection_version`.
+
+    The number of points alone does not version a collection: re-ingesting changed chunks
+    replaces their points with new ones and usually keeps the count.
+    """
+    version = content_version(point_ids)
+    await client.upsert(
+        collection_name=collection_name,
+        points=[
+            models.PointStruct(
+                id=VERSION_MARKER_ID,
+                vector={},
+                payload={"content_version": version, "points": len(point_ids), "ingested_at": time.time()},
+            )
+        ],
+        wait=True,
+    )
+    return version
+
+
+async def ingest_chunks(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    chunks: List[Chunk],
+    vector_names: Optional[List[str]] = None,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_batch_size: int = 256,
+    max_concurrency: int = 4,
+    upsert_batch_size: int = 256,
+    delete_stale: bool = False,
+    dry_run: bool = False,
+) -> IngestionStats:
+    """Bring a collection in sync with a set of chunks, embedding only the new or changed ones.
+
+    Point IDs are derived from the chunk source file and content hash, so an unchanged chunk
+    keeps its ID and is skipped, a changed chunk gets a new ID and its old point becomes stale.
+    Each batch is upserted as soon as it is embedded, so at most `max_concurrency` batches of
+    vectors are held in memory, and an interrupted run keeps the batches already upserted.
+    The content version of the collection is written last (see `write_version_marker`).
+
+    Args:
+        client: AsyncQdrantClient instance
+        collection_name: Collection to create or update
+        chunks: All chunks the collection should contain
+        vector_names: Named vectors to embed, among 'content' and 'context'
+        embedding_model: Embedding model, the same one used at query time
+        embedding_batch_size: Number of texts per embedding request
+        max_concurrency: Maximum number of embedding and upsert requests in flight
+        upsert_batch_size: Number of points per upsert request
+        delete_stale: Whether to delete the points that no longer match a chunk. Off by default:
+            points written by another ingestion (e.g. other IDs or vectors) would all be deleted
+        dry_run: Only compute what would change
+
+    Returns:
+        Ingestion stats
+    """
+    vector_names = vector_names or ["content", "context"]
+    stats = IngestionStats(chunks=len(chunks), vector_names=vector_names)
+    stats.files = len({c.source_file for c in chunks})
+
+    exists = await client.collection_exists(collection_name=collection_name)
+    if exists:
+        missing_vectors = set(vector_names) - set(await get_vector_names(client=client, collection_name=collection_name))
+        if missing_vectors:
+            raise ValueError(f"Collection {collection_name} has no vectors named {sorted(missing_vectors)}.")
+    existing_ids = await fetch_point_ids(client, collection_name) if exists else set()
+    chunks_by_id = {c.id: c for c in chunks}
+    new_chunks = [c for point_id, c in chunks_by_id.items() if point_id not in existing_ids]
+    stale_ids = sorted(existing_ids - chunks_by_id.keys())
+    stats.stale = len(stale_ids)
+    stats.unchanged = len(chunks_by_id) - len(new_chunks)
+    logger.info(
+        f"Collection {collection_name}: {len(existing_ids)} points, {len(chunks_by_id)} chunks, "
+        f"{len(new_chunks)} new or changed, {len(stale_ids)} stale ({'deleted' if delete_stale else 'kept'})"
+    )
+    if not delete_stale:
+        stale_ids = []
+    if dry_run:
+        stats.embedded = len(new_chunks)
+        stats.deleted = len(stale_ids)
+        stats.embedded_characters = sum(len(vector_text(c, name)) for c in new_chunks for name in vector_names)
+        return stats
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def embed_batch(batch: List[Chunk]) -> List[models.PointStruct]:
+        texts = [vector_text(c, name) for c in batch for name in vector_names]
+        embeddings = await generate_embeddings(texts=texts, model=embedding_model, use_cache=False)
+        stats.embedding_requests += 1
+        stats.embedded_characters += sum(len(t) for t in texts)
+        n = len(vector_names)
+        return [
+            models.PointStruct(
+                id=c.id,
+                vector={name: embeddings[i * n + j] for j, name in enumerate(vector_names)},
+                payload=c.payload(),
+            )
+            for i, c in enumerate(batch)
+        ]
+
+    async def upsert_batch(points: List[models.PointStruct]) -> None:
+        for i in range(0, len(points), upsert_batch_size):
+            await client.upsert(collection_name=collection_name, points=points[i:i + upsert_batch_size], wait=True)
+        stats.embedded += len(points)
+
+    async def embed_and_upsert(batch: List[Chunk]) -> None:
+        # The semaphore covers both steps, so a batch is upserted before another one is embedded in its place
+        async with semaphore:
+            await upsert_batch(await embed_batch(batch))
+
+    # Embed the first batch alone to learn the vector size when the collection does not exist yet
+    batches = [new_chunks[i:i + embedding_batch_size] for i in range(0, len(new_chunks), embedding_batch_size)]
+    if batches and not exists:
+        points = await embed_batch(batches.pop(0))
+        await client.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                name: models.VectorParams(size=len(points[0].vector[name]), distance=models.Distance.COSINE)
+                for name in vector_names
+            },
+        )
+        stats.collection_created = True
+        logger.info(f"Created collection {collection_name} with vectors {vector_names}")
+        await upsert_batch(points)
+
+    await asyncio.gather(*(embed_and_upsert(batch) for batch in batches))
+    logger.info(f"Embedded and upserted {stats.embedded} chunks in {stats.embedding_requests} embedding requests")
+
+    if exists or stats.collection_created:
+        stats.payload_indexes_created = await ensure_payload_indexes(client, collection_name)
+
+    for i in range(0, len(stale_ids), upsert_batch_size):
+        await client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=stale_ids[i:i + upsert_batch_size]),
+            wait=True,
+        )
+    stats.deleted = len(stale_ids)
+
+    if exists or stats.collection_created:
+        point_ids = (existing_ids | chunks_by_id.keys()) - set(stale_ids)
+        stats.content_version = await write_version_marker(client, collection_name, point_ids)
+
+    logger.info(f"Ingestion into collection {collection_name} done: {stats.to_dict()}")
+    return stats
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+
+from .search_filters import PayloadFilter
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_LOCAL_INDEX_PATH = "/home/agent_workspace/cache/neuroconv_index"
+# ID of the point without vectors holding the content version of a collection, written by each ingestion
+VERSION_MARKER_ID = "6b1d4a0e-7f3c-5e2a-9c8d-0f4e2b7a1c35"
+
+
+class LocalVectorIndex:
+    """In-process, read-only mirror of a Qdrant collection.
+
+    The index directory contains:
+    - manifest.json: collection name, vector names, distances and sync time
+    - payloads.jsonl: one {"id", "payload"} record per point, in row order
+    - vectors_<vector_name>.npy: float32 matrix of shape (n_points, dim) per named vector
+
+    Vector matrices are memory-mapped and searched by brute force, which is sub-millisecond
+    for collections of a few thousand chunks.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Load a local index from disk.
+
+        Args:
+            path: Directory written by `sync_collection`
+        """
+        self.path = Path(path)
+        with open(self.path / "manifest.json", "r") as f:
+            self.manifest = json.load(f)
+
+        self.ids: List[str] = []
+        self.payloads: List[Dict[str, Any]] = []
+        with open(self.path / "payloads.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.payloads.append(record["payload"])
+
+        self.vectors: Dict[str, np.ndarray] = {
+            name: np.load(self.path / f"vectors_{name}.npy", mmap_mode="r")
+            for name in self.manifest["vector_names"]
+        }
+        # Point ID -> row, built on first use
+        self._rows: Optional[Dict[str, int]] = None
+
+    @property
+    def collection_name(self) -> str:
+        return self.manifest["collection_name"]
+
+    @property
+    def vector_names(self) -> List[str]:
+        return list(self.manifest["vector_names"])
+
+    def check_collection(self, collection_name: str) -> None:
+        """
+        Check that the index is a snapshot of a collection.
+
+        Args:
+            collection_name: Name of the collection expected by the caller
+
+        Raises:
+            ValueError: If the index was synced from another collection, e.g. one indexed with another embedding model
+        """
+        if collection_name != self.collection_name:
+            raise ValueError(
+                f"The local index at {self.path} is a snapshot of collection {self.collection_name}, "
+                f"not {collection_name}. Re-run sync_local_index.py with --collection {collection_name}."
+            )
+
+    def get_vectors(self, vector_name: str, ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Get the stored vectors of points.
+
+        Args:
+            vector_name: Name of the vector
+            ids: Point IDs, unknown ones are left out
+
+        Returns:
+            Vectors by point ID
+        """
+        if self._rows is None:
+            self._rows = {point_id: i for i, point_id in enumerate(self.ids)}
+        matrix = self.vectors[vector_name]
+        return {point_id: np.asarray(matrix[self._rows[point_id]]) for point_id in ids if point_id in self._rows}
+
+    def search(
+        self,
+        vector_name: str,
+        query_vector: List[float],
+        limit: int = 5,
+        score_threshold: Optional[float] = None,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for the most similar points by brute force.
+
+        Args:
+            vector_name: Name of the vector to search
+            query_vector: Query vector
+            limit: Maximum number of results
+            score_threshold: Minimum similarity score threshold
+            payload_filter: Optional restriction to chunk types and source file prefixes
+
+        Returns:
+            List of search results, in the same format as `semantic_search.search_vectors`
+        """
+        matrix = self.vectors[vector_name]
+        if matrix.shape[0] == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape != (matrix.shape[1],):
+            raise ValueError(
+                f"Query vector of dimension {query.shape[-1]} does not match the {matrix.shape[1]}-dimensional "
+                f"'{vector_name}' vectors of the local index of collection {self.collection_name}. "
+                f"The query must be embedded with the model the collection was indexed with."
+            )
+        # Stored vectors of cosine collections are already normalized by `sync_collection`
+        if self.manifest["distances"].get(vector_name) == "Cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query
+        if payload_filter is not None:
+            mask = np.fromiter((payload_filter.matches(p) for p in self.payloads), dtype=bool, count=len(self.payloads))
+            if not mask.any():
+                return []
+            scores = np.where(mask, scores, -np.inf)
+            limit = min(limit, int(mask.sum()))
+
+        k = min(limit, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            score = float(scores[i])
+            if score_threshold is not None and score < score_threshold:
+                break
+            payload = self.payloads[i]
+            results.append(
+                {
+                    "id": self.ids[i],
+                    "score": score,
+                    "content": payload.get("content", ""),
+                    "file": payload.get("source_file", ""),
+                    "type": payload.get("chunk_type", ""),
+                    "context": payload.get("context"),
+                }
+            )
+        return results
+
+
+# Path -> (manifest mtime, loaded index)
+_local_indexes: Dict[str, Tuple[int, LocalVectorIndex]] = {}
+_local_indexes_lock = threading.Lock()
+
+
+def load_local_index(path: str = DEFAULT_LOCAL_INDEX_PATH) -> LocalVectorIndex:
+    """Load a local index once per process and path, reloading it when `sync_collection` writes a new snapshot."""
+    mtime_ns = os.stat(Path(path) / "manifest.json").st_mtime_ns
+    with _local_indexes_lock:
+        cached = _local_indexes.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        logger.info(f"Loading local vector index from {path}")
+        index = LocalVectorIndex(path)
+        _local_indexes[path] = (mtime_ns, index)
+        return index
+
+
+async def get_collection_version(client: Union[AsyncQdrantClient, LocalVectorIndex], collection_name: str) -> str:
+    """Get a version of the contents of a collection, which changes when it is re-ingested.
+
+    Args:
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+
+    Returns:
+        The content version written by the last ingestion (see `ingestion.ingest_chunks`). For
+        collections ingested without it, the sync time and number of points of a local index,
+        or the number of points of a Qdrant collection
+    """
+    if isinstance(client, LocalVectorIndex):
+        if client.manifest.get("content_version"):
+            return f"local:{client.manifest['content_version']}"
+        return f"local:{client.manifest.get('synced_at')}:{len(client.ids)}"
+    records = await client.retrieve(
+        collection_name=collection_name,
+        ids=[VERSION_MARKER_ID],
+        with_payload=True,
+        with_vectors=False,
+    )
+    if records and (records[0].payload or {}).get("content_version"):
+        return f"qdrant:{records[0].payload['content_version']}"
+    collection_info = await client.get_collection(collection_name=collection_name)
+    return f"qdrant:{collection_info.points_count}"
+
+
+async def sync_collection(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    output_dir: Union[str, Path] = DEFAULT_LOCAL_INDEX_PATH,
+    batch_size: int = 256,
+) -> Path:
+    """Snapshot a Qdrant collection (all named vectors plus payloads) into a local index.
+
+    The snapshot is written to a temporary directory and swapped in place at the end, so a
+    running process never reads a half-written index.
+
+    Args:
+        client: AsyncQdrantClient instance
+        collection_name: Name of the collection to snapshot
+        output_dir: Directory of the local index
+        batch_size: Number of points fetched per scroll request
+
+    Returns:
+        Path of the local index directory
+    """
+    output_dir = Path(output_dir)
+    collection_info = await client.get_collection(collection_name=collection_name)
+    vectors_config = collection_info.config.params.vectors
+    vector_names = list(vectors_config.keys())
+    distances = {
+        name: getattr(vectors_config[name].distance, "value", str(vectors_config[name].distance))
+        for name in vector_names
+    }
+    dims = {name: vectors_config[name].size for name in vector_names}
+
+    ids: List[str] = []
+    payloads: List[Dict[str, Any]] = []
+    vectors: Dict[str, List[List[float]]] = {name: [] for name in vector_names}
+    content_version = None
+
+    offset = None
+    while True:
+        records, offset = await client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for record in records:
+            if str(record.id) == VERSION_MARKER_ID:
+                content_version = (record.payload or {}).get("content_version")
+                continue
+            ids.append(str(record.id))
+            payloads.append(record.payload or {})
+            record_vectors = record.vector or {}
+            for name in vector_names:
+                vectors[name].append(record_vectors.get(name) or [0.0] * dims[name])
+        logger.info(f"Synced {len(ids)} points from collection {collection_name}")
+        if offset is None:
+            break
+
+    tmp_dir = output_dir.with_name(output_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    for name in vector_names:
+        matrix = np.asarray(vectors[name], dtype=np.float32).reshape(len(ids), dims[name])
+        if distances[name] == "Cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1.0, norms)
+        np.save(tmp_dir / f"vectors_{name}.npy", matrix)
+
+    with open(tmp_dir / "payloads.jsonl", "w", encoding="utf-8") as f:
+        for point_id, payload in zip(ids, payloads):
+            f.write(json.dumps({"id": point_id, "payload": payload}) + "\n")
+
+    with open(tmp_dir / "manifest.json", "w") as f:
+        json.dump(
+            {
+                "collection_name": collection_name,
+                "vector_names": vector_names,
+                "distances": distances,
+                "dims": dims,
+                "count": len(ids),
+                "content_version": content_version,
+                "synced_at": time.time(),
+            },
+            f,
+            indent=4,
+        )
+
+    # Swap the new snapshot in place of the old one
+    old_dir = output_dir.with_name(output_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if output_dir.exists():
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(f"Local index of collection {collection_name} written to {output_dir} ({len(ids)} points)")
+    return output_dir
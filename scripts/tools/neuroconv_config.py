@@ -0,0 +1,6 @@
+# Qdrant deployment holding the NeuroConv documentation collections. Kept apart from
+# `neuroconv_specialist_tool` so that scripts can use it without the tool's API keys.
+QDRANT_URL = "https://f068e67a-2d2b-45b8-8098-f6c354d763ec.europe-west3-0.gcp.cloud.qdrant.io:6333"
+
+# Collection of the default embedding model, see `embedding_backends.collection_for_model` for the others
+COLLECTION_NAME = "neuroconv"
@@ -1,26 +1,70 @@
 import os
+import time
 import asyncio
+from typing import Any, Callable, Dict, List, Optional
 from smolagents import Tool
+from qdrant_client import AsyncQdrantClient
 
-from .semantic_search import search
+from .semantic_search import (
+    search_stream,
+    search_batch_stream,
+    get_vector_names,
+    normalize_batch_queries,
+    VectorBackend,
+)
+from .local_index import DEFAULT_LOCAL_INDEX_PATH, get_collection_version, load_local_index
+from .neuroconv_config import COLLECTION_NAME, QDRANT_URL
+from .bm25_index import get_bm25_index
+from .search_filters import PayloadFilter
+from .search_profiles import PROFILES, get_profile
+from .embedding_backends import (
+    DEFAULT_EMBEDDING_MODEL,
+    collection_for_model,
+    get_local_embedding_backend,
+    is_local_model,
+)
+from utils.async_runtime import BackgroundEventLoop
+from utils.response_cache import get_response_cache
+from utils.run_context import current_run_id
 
 # Configure logging
 from utils.logger import set_logger
 logger = set_logger(__name__)
 
 
-# Check environment variables
-if not os.getenv("OPENROUTER_API_KEY", None):
-    logger.error("OPENROUTER_API_KEY environment variable is not set")
-    raise ValueError("Please set the OPENROUTER_API_KEY environment variable.")
+# API key read by litellm for each model provider prefix
+PROVIDER_API_KEYS = {"openrouter": "OPENROUTER_API_KEY", "openai": "OPENAI_API_KEY"}
 
-if not os.getenv("OPENAI_API_KEY", None):
-    logger.error("OPENAI_API_KEY environment variable is not set")
-    raise ValueError("Please set the OPENAI_API_KEY environment variable.")
 
-if not os.getenv("QDRANT_API_KEY", None):
-    logger.error("QDRANT_API_KEY environment variable is not set")
-    raise ValueError("Please set the QDRANT_API_KEY environment variable.")
+def _check_environment(llm_model: str, embedding_model: str, backend: str) -> None:
+    """Check the API keys used by the configured completion, embedding and search backends.
+
+    Called when the tool is created rather than when `tools` is imported. Local embedding models
+    and the local search backend need no key.
+    """
+    names = [PROVIDER_API_KEYS.get(llm_model.split("/")[0])]
+    if not is_local_model(embedding_model):
+        names.append(PROVIDER_API_KEYS.get(embedding_model.split("/")[0]))
+    if backend == "qdrant":
+        names.append("QDRANT_API_KEY")
+    for name in dict.fromkeys(filter(None, names)):
+        if not os.getenv(name, None):
+            logger.error(f"{name} environment variable is not set")
+            raise ValueError(f"Please set the {name} environment variable.")
+
+
+# Default budget of a whole search, in seconds. Query expansion and summarization with reasoning
+# models take tens of seconds, well above the timeout of a single Qdrant request
+DEFAULT_SEARCH_TIMEOUT = 180.0
+
+
+def _parse_collection_limits(spec: str) -> Dict[str, int]:
+    """Parse `name:limit` pairs, e.g. "pynwb:5,hdmf:5" -> {"pynwb": 5, "hdmf": 5}."""
+    collection_limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limit = item.partition(":")
+        collection_limits[name.strip()] = int(limit) if limit else 5
+    return collection_limits
 
 
 class NeuroconvSpecialistTool(Tool):
@@ -40,6 +84,8 @@ class NeuroconvSpecialistTool(Tool):
     - Supports ensembles of multiple data streams and methods for temporal alignment of streams
 
     This tool uses semantic search to find relevant information about NeuroConv based on your query and context.
+    When configured with extra collections (e.g. the PyNWB, HDMF and NWB Inspector docs), single queries also
+    search them, and each reference names the collection it comes from.
     """
     inputs = {
         "query": {
@@ -50,41 +96,298 @@ class NeuroconvSpecialistTool(Tool):
             "type": "string",
             "description": "Additional context about your question or use case that will help the tool provide more relevant information (e.g., 'I need to convert recorded electrophysiology data to NWB format using NeuroConv')."
         },
+        "keywords": {
+            "type": "array",
+            "description": "Optional list of exact terms to match in the NeuroConv docs and code, such as class or function names (e.g., ['SpikeGLXRecordingInterface']). If not provided, code identifiers found in the query are used.",
+            "nullable": True,
+        },
+        "additional_queries": {
+            "type": "array",
+            "description": "Optional list of other lookups to run in the same call, as objects with 'query', 'context' and optional 'keywords' fields (e.g., [{'query': 'Add behavior video to NWB', 'context': 'The session also has a camera recording'}]). Use it instead of several tool calls when you have several questions, e.g. one per data stream. Results are deduplicated across queries and one summary answers all of them.",
+            "nullable": True,
+        },
+        "chunk_types": {
+            "type": "array",
+            "description": "Optional list of chunk types to search: 'code' (NeuroConv source) and/or 'docs' (documentation pages). Searches both if not provided.",
+            "nullable": True,
+        },
+        "source_prefix": {
+            "type": "string",
+            "description": "Optional path prefix of the files to search, e.g. 'src/neuroconv/datainterfaces/ecephys' to only look at extracellular electrophysiology interfaces, or 'docs/conversion_examples_gallery'.",
+            "nullable": True,
+        },
+        "profile": {
+            "type": "string",
+            "description": "Optional search profile: 'fast' (exact lookups such as a class name, returns the matching chunks without a summary), 'balanced' (default, summarized answer), 'thorough' (slower, more results and LLM relevance filtering) or 'auto' (picked from the query).",
+            "nullable": True,
+        },
     }
     output_type = "string"
 
+    QDRANT_URL = QDRANT_URL
+    COLLECTION_NAME = COLLECTION_NAME
+
     def __init__(
         self,
         return_digest_summary: bool = True,
         llm_model: str = "openrouter/openai/o3-mini",
+        use_response_cache: bool = True,
+        timeout: float = 60.0,
+        search_timeout: Optional[float] = None,
+        schema_refresh_interval: float = 600.0,
+        backend: Optional[str] = None,
+        local_index_path: Optional[str] = None,
+        reranker: Optional[str] = None,
+        profile: Optional[str] = None,
+        latency_budget: Optional[float] = None,
+        embedding_model: Optional[str] = None,
+        extra_collections: Optional[Dict[str, int]] = None,
     ):
         super().__init__()
         self.return_digest_summary = return_digest_summary
         self.llm_model = llm_model
+        self.response_cache = get_response_cache() if use_response_cache else None
+        # Timeout of each Qdrant request
+        self.timeout = timeout
+        # Budget of a whole search (embeddings, expansion, retrieval, rerank and summary)
+        self.search_timeout = (
+            search_timeout
+            if search_timeout is not None
+            else float(os.getenv("NEUROCONV_SPECIALIST_SEARCH_TIMEOUT", str(DEFAULT_SEARCH_TIMEOUT)))
+        )
+        # Explicit reranker, overriding the one of the search profile
+        self.reranker = reranker
+        # Default search profile, "auto" picks one per query from the query and the latency budget
+        self.profile = profile or os.getenv("NEUROCONV_SPECIALIST_PROFILE", "balanced")
+        self.latency_budget = latency_budget if latency_budget is not None else self.search_timeout
+        if self.profile not in (*PROFILES, "auto"):
+            raise ValueError(f"Unknown search profile: {self.profile}. Must be one of: {', '.join([*PROFILES, 'auto'])}.")
+        self.schema_refresh_interval = schema_refresh_interval
+
+        # Query embedding model, paired with the collection indexed with it (see ingest_neuroconv.py).
+        # `local/<sentence-transformers model>` models run in-process on CPU, without any API call
+        self.embedding_model = embedding_model or os.getenv("NEUROCONV_SPECIALIST_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.collection_name = collection_for_model(self.COLLECTION_NAME, self.embedding_model)
+
+        # Other documentation collections searched along with the NeuroConv one, with their maximum
+        # number of results, e.g. NEUROCONV_SPECIALIST_EXTRA_COLLECTIONS="pynwb:5,hdmf:5,nwbinspector:5"
+        if extra_collections is None:
+            extra_collections = _parse_collection_limits(os.getenv("NEUROCONV_SPECIALIST_EXTRA_COLLECTIONS", ""))
+        self.extra_collections = {
+            collection_for_model(name, self.embedding_model): limit for name, limit in extra_collections.items()
+        }
+
+        # "qdrant" queries the remote collection, "local" its in-process mirror (see sync_local_index.py)
+        self.backend = backend or os.getenv("NEUROCONV_SPECIALIST_BACKEND", "qdrant")
+        self.local_index_path = local_index_path or os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX_PATH)
+        if self.backend not in ("qdrant", "local"):
+            raise ValueError(f"Unknown search backend: {self.backend}. Must be one of: 'qdrant', 'local'.")
+        if self.backend == "local" and self.extra_collections:
+            logger.warning("The local backend only mirrors the NeuroConv collection, ignoring the extra collections")
+            self.extra_collections = {}
+        _check_environment(llm_model=self.llm_model, embedding_model=self.embedding_model, backend=self.backend)
+
+        # Long-lived event loop owning the pooled Qdrant/LLM clients across calls
+        self._runtime = BackgroundEventLoop(name="neuroconv-specialist")
+        self._qdrant_client: Optional[AsyncQdrantClient] = None
+        self._vector_names: Optional[List[str]] = None
+        # Content versions of the searched Qdrant collections, keying the response cache
+        self._collection_versions: Dict[str, str] = {}
+        self._schema_refresh_task: Optional[asyncio.Task] = None
+
+        # Callbacks receiving the streamed search events (references, summary deltas) as they arrive
+        self._stream_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+        if is_local_model(self.embedding_model):
+            self._runtime.submit(get_local_embedding_backend(self.embedding_model).warm_up())
+        # Build the keyword (BM25) indexes in the background, instead of on the first query naming an identifier
+        self._runtime.submit(self._build_keyword_indexes())
+
+    def add_stream_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Register a callback called with each streamed search event. It runs on the tool's event loop thread.
+
+        Events carry the `run_id` of the agent run that called the tool (see `utils.run_context`), as
+        the listeners of all runs sharing the tool receive them.
+        """
+        self._stream_listeners.append(listener)
+
+    def remove_stream_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Unregister a callback added with `add_stream_listener`."""
+        if listener in self._stream_listeners:
+            self._stream_listeners.remove(listener)
+
+    async def _get_vector_backend(self) -> VectorBackend:
+        """Return the pooled Qdrant client (or the local index), creating it on first use."""
+        if self.backend == "local":
+            index = load_local_index(self.local_index_path)
+            index.check_collection(self.collection_name)
+            return index
+        if self._qdrant_client is None:
+            self._qdrant_client = AsyncQdrantClient(
+                url=self.QDRANT_URL,
+                api_key=os.getenv("QDRANT_API_KEY"),
+                timeout=self.timeout,
+            )
+        return self._qdrant_client
+
+    async def _build_keyword_indexes(self) -> None:
+        """Build the BM25 index of each searched collection."""
+        for collection_name in [self.collection_name, *self.extra_collections]:
+            try:
+                client = await self._get_vector_backend()
+                await get_bm25_index(client=client, collection_name=collection_name, local_index_path=self.local_index_path)
+            except Exception as e:
+                logger.warning(f"Failed to build the keyword index of collection {collection_name}: {str(e)}")
+
+    async def _get_vector_names(self) -> List[str]:
+        """Return the cached collection vector names, fetching them on first use."""
+        if self._vector_names is None:
+            await self._fetch_schema()
+            self._schema_refresh_task = asyncio.create_task(self._refresh_schema_periodically())
+        return self._vector_names
+
+    async def _fetch_schema(self) -> None:
+        """Fetch the collection vector names and, with Qdrant, the content versions of the searched collections.
+
+        The versions of the local index are read from its manifest on each search instead, as it
+        is reloaded as soon as `sync_local_index.py` writes a new snapshot.
+        """
+        client = await self._get_vector_backend()
+        self._vector_names = await get_vector_names(client=client, collection_name=self.collection_name)
+        if self.backend != "qdrant" or self.response_cache is None:
+            return
+        collection_names = [self.collection_name, *self.extra_collections]
+        versions = await asyncio.gather(
+            *(get_collection_version(client, name) for name in collection_names),
+            return_exceptions=True,
+        )
+        # Versions that could not be fetched are fetched by each search, as without caching
+        self._collection_versions = {
+            name: version for name, version in zip(collection_names, versions) if isinstance(version, str)
+        }
+
+    async def _refresh_schema_periodically(self) -> None:
+        """Refresh the cached collection vector names and versions every `schema_refresh_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.schema_refresh_interval)
+            try:
+                await self._fetch_schema()
+            except Exception as e:
+                logger.warning(f"Failed to refresh schema of collection {self.collection_name}: {str(e)}")
+
+    async def _search(
+        self,
+        query: str,
+        context: str,
+        keywords: Optional[List[str]] = None,
+        additional_queries: Optional[List[Dict[str, Any]]] = None,
+        chunk_types: Optional[List[str]] = None,
+        source_prefix: Optional[str] = None,
+        profile: Optional[str] = None,
+        run_id: Optional[str] = None,
+    ):
+        client = await self._get_vector_backend()
+        vector_names = await self._get_vector_names()
+        search_profile = get_profile(
+            profile or self.profile,
+            query=query,
+            context=context,
+            latency_budget=self.latency_budget,
+        )
+        logger.info(f"Using search profile: {search_profile.name}")
+        common_kwargs = dict(
+            qdrant_url=self.QDRANT_URL,
+            collection_name=self.collection_name,
+            embedding_model=self.embedding_model,
+            qdrant_api_key=os.getenv("QDRANT_API_KEY"),
+            timeout=self.timeout,
+            return_references=True,
+            model=self.llm_model,
+            client=client,
+            collection_versions=self._collection_versions,
+            local_index_path=self.local_index_path,
+            payload_filter=PayloadFilter.from_args(
+                chunk_types=chunk_types,
+                source_prefixes=[source_prefix] if source_prefix else None,
+            ),
+            **search_profile.search_kwargs(vector_names),
+        )
+        common_kwargs["return_digest_summary"] = self.return_digest_summary and search_profile.return_digest_summary
+        if self.reranker is not None:
+            common_kwargs["reranker"] = self.reranker
+        if self.extra_collections:
+            common_kwargs["collection_name"] = [self.collection_name, *self.extra_collections]
+            common_kwargs["collection_limits"] = {self.collection_name: common_kwargs["limit"], **self.extra_collections}
+        if additional_queries:
+            events = search_batch_stream(
+                queries=[
+                    {"query": query, "context": context, "keywords": keywords},
+                    *normalize_batch_queries(additional_queries, name="additional_queries"),
+                ],
+                response_cache=self.response_cache,
+                **common_kwargs,
+            )
+        else:
+            events = search_stream(
+                query=query,
+                context=context,
+                keywords=keywords,
+                response_cache=self.response_cache,
+                **common_kwargs,
+            )
+
+        response: Dict[str, Any] = {}
+        async for event in events:
+            for listener in list(self._stream_listeners):
+                try:
+                    listener({**event, "run_id": run_id})
+                except Exception as e:
+                    logger.warning(f"Stream listener failed: {str(e)}")
+            if event["type"] == "done":
+                response = event["response"]
+        return response
 
     def forward(
         self,
         query: str,
         context: str,
+        keywords: Optional[List[str]] = None,
+        additional_queries: Optional[List[Dict[str, Any]]] = None,
+        chunk_types: Optional[List[str]] = None,
+        source_prefix: Optional[str] = None,
+        profile: Optional[str] = None,
     ):
         try:
-            result = asyncio.run(
-                search(
+            start_time = time.perf_counter()
+            result = self._runtime.run(
+                self._search(
                     query=query,
                     context=context,
-                    qdrant_url="https://f068e67a-2d2b-45b8-8098-f6c354d763ec.europe-west3-0.gcp.cloud.qdrant.io:6333",
-                    collection_name="neuroconv",
-                    keywords=None,
-                    qdrant_api_key=os.getenv("QDRANT_API_KEY"),
-                    timeout=60.0,
-                    return_digest_summary=self.return_digest_summary,
-                    return_references=True,
-                    limit=10,
-                    model=self.llm_model,
-                )
+                    keywords=keywords,
+                    additional_queries=additional_queries,
+                    chunk_types=chunk_types,
+                    source_prefix=source_prefix,
+                    profile=profile,
+                    run_id=current_run_id.get(),
+                ),
+                timeout=self.search_timeout,
             )
+            logger.info(f"NeuroConv specialist tool took {time.perf_counter() - start_time:.2f}s")
             logger.info(f"NeuroConv specialist tool result: \n{result}")
             return str(result)
+        except TimeoutError:
+            elapsed = time.perf_counter() - start_time
+            if elapsed >= self.search_timeout:
+                error = f"the search did not complete within {self.search_timeout:g}s"
+            else:
+                error = f"a request timed out after {elapsed:.1f}s (Qdrant request timeout: {self.timeout:g}s)"
+            logger.error(f"neuroconv_specialist_tool failed with error: {error}")
+            return (
+                f"neuroconv_specialist_tool failed with error: {error}. "
+                f"Retry with profile='fast' or a more specific query."
+            )
         except Exception as e:
-            logger.error(f"neuroconv_specialist_tool failed with error: {str(e)}")
-            return f"neuroconv_specialist_tool failed with error: {str(e)}"
+            # Some exceptions, e.g. timeouts of inner calls, have an empty message
+            error = str(e) or type(e).__name__
+            logger.error(f"neuroconv_specialist_tool failed with error: {error}")
+            return f"neuroconv_specialist_tool failed with error: {error}"
@@ -0,0 +1,315 @@
+import os
+import re
+import stat
+import tempfile
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+SEARCH_REPLACE_BLOCK = re.compile(
+    r"^(?P<path>[^\n]*?)[ \t]*\n<{5,9} SEARCH[ \t]*\n(?P<search>.*?)^={5,9}[ \t]*\n(?P<replace>.*?)^>{5,9} REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be applied as a whole. No file is modified."""
+
+
+@dataclass
+class Hunk:
+    search: str
+    replace: str
+    # Whether the search text must start at the beginning of a line, as for unified diff hunks
+    line_anchored: bool = False
+
+
+@dataclass
+class FilePatch:
+    path: str
+    hunks: List[Hunk] = field(default_factory=list)
+    create: bool = False
+    delete: bool = False
+
+
+def _strip_diff_prefix(path: str) -> str:
+    path = path.split("\t", 1)[0].strip()
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+def _is_file_header(lines: List[str], i: int) -> bool:
+    return lines[i].startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ ")
+
+
+def _continues_hunk(lines: List[str], i: int) -> bool:
+    """Whether the first line after the blank lines starting at `i` is a line of the same hunk."""
+    while i < len(lines) and lines[i][:1] in ("\n", "\r"):
+        i += 1
+    return i < len(lines) and lines[i][:1] in (" ", "-", "+") and not _is_file_header(lines, i)
+
+
+def parse_unified_diff(diff: str) -> List[FilePatch]:
+    """
+    Parse a unified diff, e.g. from `git diff` or `diff -u`, into search/replace hunks.
+
+    Line numbers of the hunk headers are ignored: each hunk is located by its context and removed
+    lines, so a diff still applies after unrelated edits above it. Their line counts end each hunk,
+    so that blank lines between hunks or at the end of the diff are not taken as context.
+
+    Args:
+        diff: Unified diff of one or more files
+
+    Returns:
+        The patch of each file, in order
+    """
+    patches: List[FilePatch] = []
+    lines = diff.splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        if not _is_file_header(lines, i):
+            i += 1
+            continue
+        old_path = _strip_diff_prefix(lines[i][4:])
+        new_path = _strip_diff_prefix(lines[i + 1][4:])
+        patch = FilePatch(
+            path=old_path if new_path == "/dev/null" else new_path,
+            create=old_path == "/dev/null",
+            delete=new_path == "/dev/null",
+        )
+        patches.append(patch)
+        i += 2
+        while i < len(lines) and HUNK_HEADER.match(lines[i]):
+            header = HUNK_HEADER.match(lines[i])
+            # Lines of the old and new sides left in the hunk, according to its header
+            old_left = int(header.group(2)) if header.group(2) is not None else 1
+            new_left = int(header.group(4)) if header.group(4) is not None else 1
+            i += 1
+            search: List[str] = []
+            replace: List[str] = []
+            last_sides: List[List[str]] = []
+            while i < len(lines):
+                line = lines[i]
+                if _is_file_header(lines, i):
+                    break
+                # Editors and LLMs often drop the space of empty context lines: a bare blank line is
+                # context while the header counts are not reached, or when more hunk lines follow it
+                # (miscounted headers), and a separator otherwise
+                if line[:1] in ("\n", "\r") and old_left <= 0 and new_left <= 0 and not _continues_hunk(lines, i):
+                    break
+                if line[:1] not in (" ", "-", "+", "\\", "\n", "\r"):
+                    break
+                i += 1
+                if line.startswith("\\"):
+                    # "\ No newline at end of file" applies to the previous line
+                    for side in last_sides:
+                        side[-1] = side[-1].rstrip("\r\n")
+                    continue
+                text = line[1:] if line[:1] in (" ", "-", "+") else line
+                if line[:1] == "-":
+                    last_sides = [search]
+                    old_left -= 1
+                elif line[:1] == "+":
+                    last_sides = [replace]
+                    new_left -= 1
+                else:
+                    last_sides = [search, replace]
+                    old_left -= 1
+                    new_left -= 1
+                for side in last_sides:
+                    side.append(text)
+            patch.hunks.append(Hunk(search="".join(search), replace="".join(replace), line_anchored=True))
+            # Blank lines separating the hunks
+            while i < len(lines) and lines[i][:1] in ("\n", "\r"):
+                i += 1
+    if not patches:
+        raise PatchError("No file header ('--- a/path' followed by '+++ b/path') found in the diff")
+    return patches
+
+
+def parse_search_replace_blocks(text: str) -> List[FilePatch]:
+    """
+    Parse search/replace blocks, each preceded by the path of its file:
+
+        path/to/file.py
+        <<<<<<< SEARCH
+        exact lines to find
+        =======
+        lines to replace them with
+        >>>>>>> REPLACE
+
+    Args:
+        text: One or more blocks
+
+    Returns:
+        The patch of each file, in the order of their first block
+    """
+    patches: Dict[str, FilePatch] = {}
+    for match in SEARCH_REPLACE_BLOCK.finditer(text):
+        path = match.group("path").strip().strip("`")
+        if not path:
+            raise PatchError("A SEARCH/REPLACE block is not preceded by the path of its file")
+        patch = patches.setdefault(path, FilePatch(path=path))
+        patch.hunks.append(Hunk(search=match.group("search"), replace=match.group("replace")))
+    if not patches:
+        raise PatchError("No '<<<<<<< SEARCH' / '=======' / '>>>>>>> REPLACE' block found")
+    return list(patches.values())
+
+
+def parse_patch(text: str) -> List[FilePatch]:
+    """Parse a unified diff or search/replace blocks, whichever the text contains."""
+    if SEARCH_REPLACE_BLOCK.search(text):
+        return parse_search_replace_blocks(text)
+    return parse_unified_diff(text)
+
+
+def _find_unique(content: str, hunk: Hunk) -> Tuple[int, int]:
+    """Position of the single match of a hunk search text, raising PatchError on zero or several matches."""
+    positions = []
+    start = content.find(hunk.search)
+    while start >= 0 and len(positions) < 2:
+        if not hunk.line_anchored or start == 0 or content[start - 1] == "\n":
+            positions.append(start)
+        start = content.find(hunk.search, start + 1)
+    if not positions:
+        raise PatchError("the search text was not found, it must match the file character for character")
+    if len(positions) > 1:
+        raise PatchError("the search text matches several times, include more surrounding lines to make it unique")
+    return positions[0], positions[0] + len(hunk.search)
+
+
+def apply_hunks(content: str, hunks: List[Hunk]) -> str:
+    """
+    Apply hunks to the content of a file. All hunks are located in the original content, each must
+    match exactly once, and they must not overlap.
+
+    Args:
+        content: Original content
+        hunks: Hunks to apply
+
+    Returns:
+        The new content
+
+    Raises:
+        PatchError: Listing every hunk that does not apply
+    """
+    spans, errors = [], []
+    for number, hunk in enumerate(hunks, start=1):
+        if not hunk.search:
+            errors.append(f"hunk {number}: empty search text, only allowed to create a new file")
+            continue
+        try:
+            spans.append((*_find_unique(content, hunk), number, hunk))
+        except PatchError as e:
+            errors.append(f"hunk {number}: {str(e)}")
+    spans.sort()
+    for (_, end, number, _), (start, _, other, _) in zip(spans, spans[1:]):
+        if start < end:
+            errors.append(f"hunks {number} and {other} overlap, merge them into a single hunk")
+    if errors:
+        raise PatchError("; ".join(errors))
+    for start, end, _, hunk in reversed(spans):
+        content = content[:start] + hunk.replace + content[end:]
+    return content
+
+
+def atomic_write(path: str, content: str) -> None:
+    """Write a file through a temporary file renamed over it, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def apply_patches(patches: List[FilePatch], resolve_path: Callable[[str], str]) -> str:
+    """
+    Apply the patches of several files atomically: every hunk of every file is validated before
+    any file is written, each file is replaced through a temporary file, and the files already
+    written are restored if a later write fails.
+
+    Args:
+        patches: Patches to apply
+        resolve_path: Function turning a patch path into the absolute path to write, raising on forbidden paths
+
+    Returns:
+        Summary of the changes
+
+    Raises:
+        PatchError: If any hunk does not apply, with the reason of each failure
+    """
+    # Path -> (original content or None for a new file, new content or None to delete)
+    changes: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    summary, errors = [], []
+    for patch in patches:
+        try:
+            path = resolve_path(patch.path)
+            # Several patches of a file apply on top of each other
+            if path in changes:
+                first_original, original = changes[path]
+            else:
+                first_original = original = None
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8", newline="") as f:
+                        first_original = original = f.read()
+            exists = original is not None
+            if patch.delete:
+                if not exists:
+                    raise PatchError("cannot delete a file that does not exist")
+                changes[path] = (first_original, None)
+                summary.append(f"- {path}: deleted")
+                continue
+            if not exists:
+                if len(patch.hunks) != 1 or patch.hunks[0].search:
+                    raise PatchError("file not found")
+                changes[path] = (first_original, patch.hunks[0].replace)
+                summary.append(f"- {path}: created ({patch.hunks[0].replace.count(chr(10))} lines)")
+                continue
+            if patch.create:
+                raise PatchError("the file to create already exists")
+            new_content = apply_hunks(original, patch.hunks)
+            changes[path] = (first_original, new_content)
+            summary.append(f"- {path}: {len(patch.hunks)} hunk(s) applied")
+        except (PatchError, OSError, ValueError) as e:
+            errors.append(f"{patch.path}: {str(e)}")
+    if errors:
+        raise PatchError("Patch not applied, no file was modified:\n" + "\n".join(f"- {e}" for e in errors))
+
+    written: List[str] = []
+    try:
+        for path, (_, new_content) in changes.items():
+            if new_content is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                atomic_write(path, new_content)
+            written.append(path)
+    except OSError:
+        for path in written:
+            original, _ = changes[path]
+            try:
+                if original is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    atomic_write(path, original)
+            except OSError as e:
+                logger.error(f"Failed to restore {path} after a failed patch: {str(e)}")
+        raise
+    return "\n".join(summary)
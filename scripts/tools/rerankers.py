@@ -0,0 +1,305 @@
+import abc
+import asyncio
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type, TYPE_CHECKING
+
+import numpy as np
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+if TYPE_CHECKING:
+    from .semantic_search import SearchResult
+
+
+class Reranker(abc.ABC):
+    """Base class for the rerank stage that runs on retrieved results before summarization.
+
+    Subclasses implement `score()`. `rerank()` sorts results by score, drops those below
+    `score_threshold` and keeps at most `top_k`.
+    """
+
+    def __init__(self, top_k: Optional[int] = 5, score_threshold: Optional[float] = None):
+        """
+        Args:
+            top_k: Maximum number of results to keep, or None to keep all
+            score_threshold: Minimum rerank score to keep a result, or None to disable the cutoff
+        """
+        self.top_k = top_k
+        self.score_threshold = score_threshold
+
+    @abc.abstractmethod
+    async def score(self, query: str, context: str, results: List["SearchResult"]) -> List[float]:
+        """Return one relevance score per result, higher is more relevant."""
+
+    async def score_batch(
+        self,
+        requests: List[Tuple[str, str, List["SearchResult"]]],
+    ) -> List[List[float]]:
+        """Score several (query, context, results) requests. Subclasses can override it to share model calls."""
+        return list(await asyncio.gather(*(self.score(query, context, results) for query, context, results in requests)))
+
+    def _select(self, results: List["SearchResult"], scores: List[float]) -> List["SearchResult"]:
+        """Sort results by rerank score, apply the score cutoff and top-k."""
+        from .semantic_search import SearchResult
+
+        ranked = sorted(zip(results, scores), key=lambda x: x[1], reverse=True)
+        if self.score_threshold is not None:
+            ranked = [(r, s) for r, s in ranked if s >= self.score_threshold]
+        if self.top_k is not None:
+            ranked = ranked[:self.top_k]
+        logger.info(f"{type(self).__name__} kept {len(ranked)}/{len(results)} results")
+        return [
+            SearchResult(id=r.id, score=float(s), content=r.content, metadata=r.metadata)
+            for r, s in ranked
+        ]
+
+    async def rerank(self, query: str, context: str, results: List["SearchResult"]) -> List["SearchResult"]:
+        """
+        Rerank results and apply the score cutoff and top-k.
+
+        Args:
+            query: Original search query
+            context: Context for the query
+            results: Results to rerank
+
+        Returns:
+            Reranked results, with their score replaced by the rerank score
+        """
+        if not results:
+            return []
+        scores = await self.score(query=query, context=context, results=results)
+        return self._select(results, scores)
+
+    async def rerank_batch(
+        self,
+        requests: List[Tuple[str, str, List["SearchResult"]]],
+    ) -> List[List["SearchResult"]]:
+        """
+        Rerank the results of several queries, sharing model calls where the reranker supports it.
+
+        Args:
+            requests: List of (query, context, results) tuples
+
+        Returns:
+            Reranked results of each request, in the same order
+        """
+        scored = [(i, request) for i, request in enumerate(requests) if request[2]]
+        reranked: List[List["SearchResult"]] = [[] for _ in requests]
+        if not scored:
+            return reranked
+        scores = await self.score_batch([request for _, request in scored])
+        for (i, (_, _, results)), result_scores in zip(scored, scores):
+            reranked[i] = self._select(results, result_scores)
+        return reranked
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _point_id(point_id: str) -> Any:
+    """Qdrant point ID of a search result ID, which is an unsigned integer or a UUID."""
+    return int(point_id) if point_id.isdigit() else point_id
+
+
+class EmbeddingReranker(Reranker):
+    """Rerank by cosine similarity between the (query + context) embedding and each chunk vector.
+
+    Chunk vectors are the ones stored in the collection (`content` vector), fetched with the
+    results, so only the (query + context) text is embedded: one cached call per request. Without
+    a vector backend, e.g. when used on its own, the chunk contents are embedded with `model`.
+    """
+
+    def __init__(
+        self,
+        model: str = "openai/text-embedding-ada-002",
+        top_k: Optional[int] = 5,
+        score_threshold: Optional[float] = None,
+        client: Any = None,
+        collection_name: Optional[str] = None,
+        vector_name: str = "content",
+    ):
+        """
+        Args:
+            model: Model the collection vectors were embedded with
+            top_k: Maximum number of results to keep, or None to keep all
+            score_threshold: Minimum rerank score to keep a result, or None to disable the cutoff
+            client: AsyncQdrantClient instance or local index storing the chunk vectors
+            collection_name: Collection of the results not tagged with a `collection`
+            vector_name: Stored vector compared to the query, the first vector of collections without it
+        """
+        super().__init__(top_k=top_k, score_threshold=score_threshold)
+        self.model = model
+        self.client = client
+        self.collection_name = collection_name
+        self.vector_name = vector_name
+
+    async def score(self, query: str, context: str, results: List["SearchResult"]) -> List[float]:
+        return (await self.score_batch([(query, context, results)]))[0]
+
+    async def score_batch(
+        self,
+        requests: List[Tuple[str, str, List["SearchResult"]]],
+    ) -> List[List[float]]:
+        """Embed the (query + context) texts of all requests in one request, and compare them to the stored chunk vectors."""
+        from .semantic_search import generate_embeddings
+
+        queries = list(dict.fromkeys(f"{query}\n{context}" for query, context, _ in requests))
+        results = list({r.id: r for _, _, request_results in requests for r in request_results}.values())
+        vectors = await self._stored_vectors(results) if self.client is not None else {}
+        # Results without a stored vector, e.g. without a vector backend, have their content embedded
+        missing = list(dict.fromkeys(r.content for r in results if r.id not in vectors))
+        embeddings = await generate_embeddings(texts=queries + missing, model=self.model)
+        query_vectors = dict(zip(queries, _normalize_rows(np.asarray(embeddings[:len(queries)], dtype=np.float32))))
+        content_vectors = dict(zip(missing, _normalize_rows(np.asarray(embeddings[len(queries):], dtype=np.float32))))
+
+        scores = []
+        for query, context, request_results in requests:
+            if not request_results:
+                scores.append([])
+                continue
+            matrix = np.stack([vectors[r.id] if r.id in vectors else content_vectors[r.content] for r in request_results])
+            scores.append((matrix @ query_vectors[f"{query}\n{context}"]).tolist())
+        return scores
+
+    async def _stored_vectors(self, results: List["SearchResult"]) -> Dict[str, np.ndarray]:
+        """Normalized stored vectors of the results, by result ID."""
+        from .local_index import LocalVectorIndex
+        from .semantic_search import get_vector_names
+
+        ids_by_collection: Dict[str, List[str]] = defaultdict(list)
+        for r in results:
+            ids_by_collection[r.metadata.get("collection") or self.collection_name].append(r.id)
+
+        vectors: Dict[str, np.ndarray] = {}
+        for collection_name, ids in ids_by_collection.items():
+            if collection_name is None:
+                continue
+            vector_names = await get_vector_names(client=self.client, collection_name=collection_name)
+            vector_name = self.vector_name if self.vector_name in vector_names else vector_names[0]
+            if isinstance(self.client, LocalVectorIndex):
+                stored = self.client.get_vectors(vector_name=vector_name, ids=ids)
+            else:
+                records = await self.client.retrieve(
+                    collection_name=collection_name,
+                    ids=[_point_id(i) for i in ids],
+                    with_payload=False,
+                    with_vectors=[vector_name],
+                )
+                stored = {str(record.id): (record.vector or {}).get(vector_name) for record in records}
+            for point_id, vector in stored.items():
+                if vector is not None:
+                    vectors[point_id] = _normalize_rows(np.asarray(vector, dtype=np.float32))
+        return vectors
+
+
+@lru_cache(maxsize=2)
+def _load_cross_encoder(model_name: str):
+    try:
+        from sentence_transformers import CrossEncoder
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError(
+            "Please install 'sentence-transformers' to use the cross-encoder reranker: "
+            "`pip install sentence-transformers`"
+        )
+    return CrossEncoder(model_name, device="cpu")
+
+
+class CrossEncoderReranker(Reranker):
+    """Rerank with a small local cross-encoder model running on CPU."""
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        top_k: Optional[int] = 5,
+        score_threshold: Optional[float] = None,
+        max_length: int = 2000,
+    ):
+        super().__init__(top_k=top_k, score_threshold=score_threshold)
+        self.model_name = model_name
+        self.max_length = max_length
+
+    async def score(self, query: str, context: str, results: List["SearchResult"]) -> List[float]:
+        return (await self.score_batch([(query, context, results)]))[0]
+
+    async def score_batch(
+        self,
+        requests: List[Tuple[str, str, List["SearchResult"]]],
+    ) -> List[List[float]]:
+        """Score the pairs of all requests in a single model call."""
+        model = _load_cross_encoder(self.model_name)
+        pairs = [
+            (f"{query}\n{context}", r.content[:self.max_length])
+            for query, context, results in requests
+            for r in results
+        ]
+        flat_scores = [float(s) for s in await asyncio.to_thread(model.predict, pairs)]
+        scores, offset = [], 0
+        for _, _, results in requests:
+            scores.append(flat_scores[offset:offset + len(results)])
+            offset += len(results)
+        return scores
+
+
+class LLMReranker(Reranker):
+    """Keep only the results an LLM judges relevant, in the order it returns them.
+
+    This is the slowest and most expensive option, kept as an opt-in fallback. Results keep
+    their retrieval score and `score_threshold` is not used.
+    """
+
+    def __init__(self, model: str = "openrouter/openai/o3-mini", top_k: Optional[int] = None):
+        super().__init__(top_k=top_k, score_threshold=None)
+        self.model = model
+
+    async def score(self, query: str, context: str, results: List["SearchResult"]) -> List[float]:
+        """1.0 for the results the LLM judges relevant, 0.0 for the others."""
+        kept_ids = {r.id for r in await self.rerank(query=query, context=context, results=results)}
+        return [1.0 if r.id in kept_ids else 0.0 for r in results]
+
+    async def rerank(self, query: str, context: str, results: List["SearchResult"]) -> List["SearchResult"]:
+        from .semantic_search import llm_filter_results
+
+        if not results:
+            return []
+        kept = await llm_filter_results(query=query, context=context, results=results, model=self.model)
+        if self.top_k is not None:
+            kept = kept[:self.top_k]
+        logger.info(f"{type(self).__name__} kept {len(kept)}/{len(results)} results")
+        return kept
+
+    async def rerank_batch(
+        self,
+        requests: List[Tuple[str, str, List["SearchResult"]]],
+    ) -> List[List["SearchResult"]]:
+        # The filter prompt is per query, the calls run concurrently
+        return list(await asyncio.gather(*(self.rerank(query, context, results) for query, context, results in requests)))
+
+
+RERANKERS: Dict[str, Type[Reranker]] = {
+    "embedding": EmbeddingReranker,
+    "cross-encoder": CrossEncoderReranker,
+    "llm": LLMReranker,
+}
+
+
+def get_reranker(name: str, **kwargs) -> Optional[Reranker]:
+    """
+    Build a reranker by name.
+
+    Args:
+        name: One of 'embedding', 'cross-encoder', 'llm' or 'none'
+        **kwargs: Arguments passed to the reranker constructor
+
+    Returns:
+        The reranker, or None for 'none'
+    """
+    if name == "none":
+        return None
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker: {name}. Must be one of: {', '.join([*RERANKERS, 'none'])}.")
+    return RERANKERS[name](**kwargs)
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from qdrant_client import AsyncQdrantClient, models
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+# Payload indexes backing the filters: exact match on the chunk type, and a full-text index of
+# the source file path components to preselect the path prefixes (checked exactly by
+# `PayloadFilter.matches`). The prefix tokenizer lets a partial last component match, e.g. "oph"
+PAYLOAD_INDEXES: Dict[str, Any] = {
+    "chunk_type": models.PayloadSchemaType.KEYWORD,
+    "source_file": models.TextIndexParams(
+        type=models.TextIndexType.TEXT,
+        tokenizer=models.TokenizerType.PREFIX,
+        lowercase=True,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class PayloadFilter:
+    """Restricts a search to some chunk types and source file path prefixes."""
+
+    # e.g. ("code",) or ("docs",), empty for all chunk types
+    chunk_types: Tuple[str, ...] = ()
+    # e.g. ("src/neuroconv/datainterfaces/ecephys",), empty for all files
+    source_prefixes: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_args(
+        cls,
+        chunk_types: Optional[Sequence[str]] = None,
+        source_prefixes: Optional[Sequence[str]] = None,
+    ) -> Optional["PayloadFilter"]:
+        """Build a filter from optional tool arguments, None when nothing is filtered."""
+        prefixes = {p.strip().removeprefix("./").lstrip("/") for p in source_prefixes or []}
+        payload_filter = cls(
+            chunk_types=tuple(sorted(set(chunk_types or []))),
+            source_prefixes=tuple(sorted(p for p in prefixes if p)),
+        )
+        return payload_filter if payload_filter.chunk_types or payload_filter.source_prefixes else None
+
+    def to_qdrant(self) -> models.Filter:
+        """Qdrant filter selecting a superset of the matching points, served by `PAYLOAD_INDEXES`."""
+        must: List[Any] = []
+        if self.chunk_types:
+            must.append(models.FieldCondition(key="chunk_type", match=models.MatchAny(any=list(self.chunk_types))))
+        if self.source_prefixes:
+            must.append(
+                models.Filter(
+                    should=[
+                        models.FieldCondition(key="source_file", match=models.MatchText(text=prefix))
+                        for prefix in self.source_prefixes
+                    ]
+                )
+            )
+        return models.Filter(must=must)
+
+    def matches(self, result: Dict[str, Any]) -> bool:
+        """Whether a search result (or a chunk payload) passes the filter.
+
+        Args:
+            result: Search result with `file` and `type` fields, or payload with `source_file` and `chunk_type` fields
+        """
+        chunk_type = result.get("type", result.get("chunk_type", ""))
+        source_file = result.get("file", result.get("source_file", "")) or ""
+        if self.chunk_types and chunk_type not in self.chunk_types:
+            return False
+        if self.source_prefixes and not source_file.startswith(self.source_prefixes):
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"chunk_types": list(self.chunk_types), "source_prefixes": list(self.source_prefixes)}
+
+
+async def ensure_payload_indexes(client: AsyncQdrantClient, collection_name: str) -> List[str]:
+    """Create the payload indexes of `PAYLOAD_INDEXES` missing from a collection.
+
+    Args:
+        client: AsyncQdrantClient instance
+        collection_name: Collection name
+
+    Returns:
+        Names of the fields indexed by this call
+    """
+    collection_info = await client.get_collection(collection_name=collection_name)
+    existing = set((collection_info.payload_schema or {}).keys())
+    created = []
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name in existing:
+            continue
+        await client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+            wait=True,
+        )
+        created.append(field_name)
+    if created:
+        logger.info(f"Created payload indexes {created} on collection {collection_name}")
+    return created
+
+
+T = TypeVar("T")
+
+
+def adaptive_score_cutoff(results: List[T], score_margin: Optional[float], min_results: int = 3) -> List[T]:
+    """Drop the results scoring more than `score_margin` below the best one.
+
+    Similarity scores are only comparable within a query, so the cutoff is relative to the top
+    score instead of absolute: a query with one strong match keeps few results, a query with many
+    close matches keeps them all.
+
+    Args:
+        results: Results sorted by decreasing `score`
+        score_margin: Maximum score difference with the best result, None to keep all results
+        min_results: Number of results always kept
+
+    Returns:
+        The leading results within the margin
+    """
+    if score_margin is None or len(results) <= min_results:
+        return results
+    cutoff = results[0].score - score_margin
+    kept = [r for i, r in enumerate(results) if i < min_results or r.score >= cutoff]
+    if len(kept) < len(results):
+        logger.info(f"Adaptive score cutoff at {cutoff:.3f} kept {len(kept)}/{len(results)} results")
+    return kept
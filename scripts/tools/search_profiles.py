@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .bm25_index import WORD_PATTERN, extract_identifiers
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+@dataclass(frozen=True)
+class SearchProfile:
+    """Settings of the semantic search pipeline, trading answer quality for latency and cost."""
+
+    name: str
+    use_query_expansion: bool
+    # Number of named vectors searched, None for all of them
+    max_vector_names: Optional[int]
+    reranker: str
+    return_digest_summary: bool
+    limit: int
+    context_token_budget: Optional[int]
+    # Seconds after which retrieval proceeds with the results it has
+    deadline: Optional[float]
+    # Vector search results scoring more than this below the best one are dropped, None keeps all
+    score_margin: Optional[float]
+
+    def select_vector_names(self, vector_names: List[str], preferred: str = "content") -> List[str]:
+        """Keep the first `max_vector_names` vector names, starting with the preferred one if present."""
+        if self.max_vector_names is None:
+            return list(vector_names)
+        ordered = sorted(vector_names, key=lambda name: name != preferred)
+        return ordered[:self.max_vector_names]
+
+    def search_kwargs(self, vector_names: List[str]) -> Dict[str, Any]:
+        """Arguments of `semantic_search.search_stream()` set by this profile."""
+        return {
+            "use_query_expansion": self.use_query_expansion,
+            "vector_names": self.select_vector_names(vector_names),
+            "reranker": self.reranker,
+            "return_digest_summary": self.return_digest_summary,
+            "limit": self.limit,
+            "context_token_budget": self.context_token_budget,
+            "deadline": self.deadline,
+            "score_margin": self.score_margin,
+        }
+
+
+PROFILES: Dict[str, SearchProfile] = {
+    # One embedding and one vector search round trip (plus the local BM25 search), no LLM call
+    "fast": SearchProfile(
+        name="fast",
+        use_query_expansion=False,
+        max_vector_names=1,
+        reranker="none",
+        return_digest_summary=False,
+        limit=5,
+        context_token_budget=None,
+        deadline=None,
+        score_margin=0.1,
+    ),
+    "balanced": SearchProfile(
+        name="balanced",
+        use_query_expansion=True,
+        max_vector_names=None,
+        reranker="embedding",
+        return_digest_summary=True,
+        limit=10,
+        context_token_budget=6000,
+        deadline=None,
+        score_margin=None,
+    ),
+    "thorough": SearchProfile(
+        name="thorough",
+        use_query_expansion=True,
+        max_vector_names=None,
+        reranker="llm",
+        return_digest_summary=True,
+        limit=20,
+        context_token_budget=12000,
+        deadline=None,
+        score_margin=None,
+    ),
+}
+
+# Latency budgets (seconds) below which the automatic mode falls back to a cheaper profile
+FAST_PROFILE_MAX_BUDGET = 3.0
+BALANCED_PROFILE_MAX_BUDGET = 30.0
+
+
+def choose_profile(query: str, context: str = "", latency_budget: Optional[float] = None) -> SearchProfile:
+    """
+    Pick a profile from query features and a latency budget.
+
+    - Short queries naming exact code identifiers (e.g. `SpikeGLXRecordingInterface metadata`)
+      are answered well by the original query alone: "fast".
+    - Long, open-ended queries get "thorough" when the latency budget allows it.
+    - Everything else gets "balanced", or "fast" when the latency budget is too tight for LLM calls.
+
+    Args:
+        query: Search query
+        context: Context of the query
+        latency_budget: Seconds the caller can wait, None for no limit
+
+    Returns:
+        The selected profile
+    """
+    n_words = len(WORD_PATTERN.findall(query))
+    identifiers = extract_identifiers(query)
+
+    if latency_budget is not None and latency_budget < FAST_PROFILE_MAX_BUDGET:
+        reason = f"latency budget {latency_budget}s"
+        profile = PROFILES["fast"]
+    elif identifiers and n_words <= 6:
+        reason = f"short query naming {identifiers}"
+        profile = PROFILES["fast"]
+    elif n_words >= 15 and (latency_budget is None or latency_budget >= BALANCED_PROFILE_MAX_BUDGET):
+        reason = f"open-ended query of {n_words} words"
+        profile = PROFILES["thorough"]
+    else:
+        reason = "default"
+        profile = PROFILES["balanced"]
+    logger.info(f"Selected search profile {profile.name} ({reason})")
+    return profile
+
+
+def get_profile(
+    name: str,
+    query: str = "",
+    context: str = "",
+    latency_budget: Optional[float] = None,
+) -> SearchProfile:
+    """
+    Return a profile by name, resolving "auto" from the query.
+
+    Args:
+        name: One of 'fast', 'balanced', 'thorough' or 'auto'
+        query: Search query, used by 'auto'
+        context: Context of the query, used by 'auto'
+        latency_budget: Seconds the caller can wait, used by 'auto'
+
+    Returns:
+        The profile
+    """
+    if name == "auto":
+        return choose_profile(query=query, context=context, latency_budget=latency_budget)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown search profile: {name}. Must be one of: {', '.join([*PROFILES, 'auto'])}.")
+    return PROFILES[name]
@@ -1,6 +1,8 @@
+import json
 import asyncio
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
 from collections import defaultdict
 
 import instructor
@@ -9,6 +11,17 @@ from qdrant_client import AsyncQdrantClient, models
 from qdrant_client.http.models import Distance, VectorParams
 from pydantic import BaseModel
 
+from utils.embedding_cache import get_embedding_cache
+from utils.response_cache import SemanticResponseCache
+from utils.metrics import current_stream_record, record_usage, stage, stream_stage
+from utils.rate_limiter import call_with_limits, is_available
+from .local_index import DEFAULT_LOCAL_INDEX_PATH, LocalVectorIndex, get_collection_version, load_local_index
+from .bm25_index import extract_identifiers, get_bm25_index, reciprocal_rank_fusion
+from .rerankers import Reranker, get_reranker
+from .context_packing import pack_context
+from .search_filters import PayloadFilter, adaptive_score_cutoff
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL, get_local_embedding_backend, is_local_model
+
 # Configure logging
 from utils.logger import set_logger
 logger = set_logger(__name__)
@@ -50,67 +63,233 @@ Search Results:
 
 Provide a clear and focused response that addresses the query within its context."""
 
+BATCH_SUMMARY_PROMPT = """Synthesize a concise and informative response to each of the following queries, based on the search results shared by all of them. Focus on relevant information and discard any irrelevant details.
+Queries:
+{queries}
+Search Results:
+{results}
+
+Provide a clear and focused response to each query within its context, in one section per query titled "Query <number>: <query>"."""
+
+# Set in responses degraded to a cheaper pipeline because LLM calls are failing
+DEGRADED_NOTICE = "The LLM provider is unavailable or rate limited: the summary was skipped, the references are the raw search results."
+
+# Dense retrieval runs either against the remote Qdrant collection or its local mirror
+VectorBackend = Union[AsyncQdrantClient, LocalVectorIndex]
+
 
 class FilterResult(BaseModel):
     indices: List[int]
 
 
+@lru_cache(maxsize=1)
+def get_instructor_client():
+    """Return a shared instructor client patched over litellm's async completion."""
+    return instructor.from_litellm(acompletion)
+
+
+async def get_vector_names(client: VectorBackend, collection_name: str) -> List[str]:
+    """Get the names of the vectors stored in a collection.
+
+    Args:
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+
+    Returns:
+        List of vector names
+    """
+    if isinstance(client, LocalVectorIndex):
+        client.check_collection(collection_name)
+        return client.vector_names
+    collection_info = await client.get_collection(collection_name=collection_name)
+    return list(collection_info.config.params.vectors.keys())
+
+
 async def generate_embeddings(
     texts: List[str],
-    model: str = "openai/text-embedding-ada-002",
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    use_cache: bool = True,
 ) -> List[List[float]]:
-    """Generate embeddings for a list of texts using litellm.
+    """Generate embeddings for a list of texts using litellm, or a local model for `local/` models.
+
+    Embeddings of remote models are looked up in the on-disk embedding cache first, and only the
+    missing texts are sent to the embedding model. Local models run in-process on CPU and are
+    not cached.
 
     Args:
         texts: List of texts to generate embeddings for
         model: Model to use for embeddings
+        use_cache: Whether to use the on-disk embedding cache
 
     Returns:
         List of embedding vectors
     """
-    response = await aembedding(model=model, input=texts)
-    return [data["embedding"] for data in response.data]
+    with stage("embedding", model=model, texts=len(texts)) as record:
+        if is_local_model(model):
+            record.count("local_calls")
+            return await get_local_embedding_backend(model).embed(texts)
+
+        cache = get_embedding_cache() if use_cache else None
+        if cache is None:
+            response = await call_with_limits("embedding", model, aembedding, model=model, input=texts, record=record)
+            record.count("remote_calls")
+            record_usage(record, getattr(response, "usage", None))
+            return [data["embedding"] for data in response.data]
+
+        embeddings = await asyncio.to_thread(cache.get_many, model=model, texts=texts)
+        missing = [t for t in dict.fromkeys(texts) if t not in embeddings]
+        if missing:
+            response = await call_with_limits("embedding", model, aembedding, model=model, input=missing, record=record)
+            record.count("remote_calls")
+            record_usage(record, getattr(response, "usage", None))
+            new_embeddings = {t: data["embedding"] for t, data in zip(missing, response.data)}
+            await asyncio.to_thread(cache.put_many, model=model, embeddings=new_embeddings)
+            embeddings.update(new_embeddings)
+        record.count("cache_hits", len(texts) - len(missing))
+        record.count("cache_misses", len(missing))
+        logger.info(f"Embedding cache: {len(texts) - len(missing)}/{len(texts)} hits, stats: {cache.stats()}")
+
+        return [embeddings[t] for t in texts]
 
 
 async def search_vectors(
-    client: AsyncQdrantClient,
+    client: VectorBackend,
     collection_name: str,
     query_vector: List[float],
     vector_name: str,
     limit: int = 5,
     score_threshold: Optional[float] = None,
+    payload_filter: Optional[PayloadFilter] = None,
 ) -> List[Dict[str, Any]]:
-    """Search for similar vectors using Qdrant.
+    """Search for similar vectors using Qdrant or a local index.
 
     Args:
-        client: AsyncQdrantClient instance
+        client: AsyncQdrantClient instance or local index
         collection_name: Collection name
         query_vector: Query vector
         vector_name: Name of the vector to search
         limit: Maximum number of results
         score_threshold: Minimum similarity score threshold
+        payload_filter: Optional restriction to chunk types and source file prefixes
 
     Returns:
         List of search results
     """
-    results = await client.search(
-        collection_name=collection_name,
-        query_vector=(vector_name, query_vector),
-        limit=limit,
-        score_threshold=score_threshold,
-    )
+    with stage("vector_search", vector_name=vector_name, searches=1) as record:
+        if isinstance(client, LocalVectorIndex):
+            client.check_collection(collection_name)
+            results_list = client.search(
+                vector_name=vector_name,
+                query_vector=query_vector,
+                limit=limit,
+                score_threshold=score_threshold,
+                payload_filter=payload_filter,
+            )
+        else:
+            results = await client.search(
+                collection_name=collection_name,
+                query_vector=(vector_name, query_vector),
+                limit=limit,
+                score_threshold=score_threshold,
+                query_filter=payload_filter.to_qdrant() if payload_filter is not None else None,
+            )
+            record.count("remote_calls")
+            results_list = _filter_results([_scored_point_to_dict(r) for r in results], payload_filter)
+        record.count("results", len(results_list))
+        return results_list
 
-    return [
-        {
-            "id": str(r.id),
-            "score": r.score,
-            "content": r.payload.get("content", ""),
-            "file": r.payload.get("source_file", ""),
-            "type": r.payload.get("chunk_type", ""),
-            "context": r.payload.get("context"),
-        }
-        for r in results
+
+def _filter_results(results_list: List[Dict[str, Any]], payload_filter: Optional[PayloadFilter]) -> List[Dict[str, Any]]:
+    # Qdrant preselects path prefixes with a full-text index, check them exactly
+    if payload_filter is None:
+        return results_list
+    return [r for r in results_list if payload_filter.matches(r)]
+
+
+def _scored_point_to_dict(point: models.ScoredPoint) -> Dict[str, Any]:
+    return {
+        "id": str(point.id),
+        "score": point.score,
+        "content": point.payload.get("content", ""),
+        "file": point.payload.get("source_file", ""),
+        "type": point.payload.get("chunk_type", ""),
+        "context": point.payload.get("context"),
+    }
+
+
+async def search_all_vectors(
+    client: VectorBackend,
+    collection_name: str,
+    query_vectors: List[List[float]],
+    vector_names: List[str],
+    limit: int = 5,
+    score_threshold: Optional[float] = None,
+    payload_filter: Optional[PayloadFilter] = None,
+) -> List[List[List[Dict[str, Any]]]]:
+    """Search every query vector against every named vector.
+
+    Against Qdrant all searches are sent in a single batch request, against the local index
+    they run in process.
+
+    Args:
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+        query_vectors: Query vectors, one per query
+        vector_names: Names of the vectors to search
+        limit: Maximum number of results per search
+        score_threshold: Minimum similarity score threshold
+        payload_filter: Optional restriction to chunk types and source file prefixes
+
+    Returns:
+        Search results indexed as [query][vector_name]
+    """
+    if not query_vectors:
+        return []
+
+    if isinstance(client, AsyncQdrantClient):
+        query_filter = payload_filter.to_qdrant() if payload_filter is not None else None
+        with stage("vector_search", searches=len(query_vectors) * len(vector_names)) as record:
+            batch_results = await client.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=query_vector,
+                        using=vector_name,
+                        limit=limit,
+                        score_threshold=score_threshold,
+                        filter=query_filter,
+                        with_payload=True,
+                    )
+                    for query_vector in query_vectors
+                    for vector_name in vector_names
+                ],
+            )
+            record.count("remote_calls")
+            flat_results = [
+                _filter_results([_scored_point_to_dict(r) for r in results.points], payload_filter)
+                for results in batch_results
+            ]
+            record.count("results", sum(len(r) for r in flat_results))
+        n = len(vector_names)
+        return [flat_results[i * n:(i + 1) * n] for i in range(len(query_vectors))]
+
+    tasks = [
+        search_vectors(
+            client=client,
+            collection_name=collection_name,
+            query_vector=query_vector,
+            vector_name=vector_name,
+            limit=limit,
+            score_threshold=score_threshold,
+            payload_filter=payload_filter,
+        )
+        for query_vector in query_vectors
+        for vector_name in vector_names
     ]
+    flat_results = await asyncio.gather(*tasks)
+
+    n = len(vector_names)
+    return [list(flat_results[i * n:(i + 1) * n]) for i in range(len(query_vectors))]
 
 
 @dataclass
@@ -133,6 +312,42 @@ class SearchResult:
         )
 
 
+def merge_results(unique_results: Dict[str, SearchResult], results_list: List[Dict[str, Any]]) -> None:
+    """Merge raw search results into a dict of unique results, keeping the best score per ID."""
+    for r in results_list:
+        result = SearchResult.from_dict(r)
+        if result.id not in unique_results or result.score > unique_results[result.id].score:
+            unique_results[result.id] = result
+
+
+async def keyword_search(
+    client: VectorBackend,
+    collection_name: str,
+    keywords: List[str],
+    limit: int = 10,
+    local_index_path: Optional[str] = None,
+    payload_filter: Optional[PayloadFilter] = None,
+) -> List[SearchResult]:
+    """Search chunk payloads with a local BM25 index.
+
+    Args:
+        client: AsyncQdrantClient instance or local index the BM25 index is built from
+        collection_name: Collection name
+        keywords: Keywords to search for
+        limit: Maximum number of results
+        local_index_path: Directory of the local index, if any
+        payload_filter: Optional restriction to chunk types and source file prefixes
+
+    Returns:
+        List of search results sorted by BM25 score
+    """
+    with stage("keyword_search", keywords=len(keywords)) as record:
+        index = await get_bm25_index(client=client, collection_name=collection_name, local_index_path=local_index_path)
+        results = [SearchResult.from_dict(r) for r in index.search(" ".join(keywords), limit=limit, payload_filter=payload_filter)]
+        record.count("results", len(results))
+        return results
+
+
 async def expand_query(
     query: str,
     context: str,
@@ -150,10 +365,17 @@ async def expand_query(
     """
     prompt = QUERY_EXPANSION_PROMPT.format(query=query, context=context)
 
-    response = await acompletion(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    with stage("query_expansion", model=model) as record:
+        response = await call_with_limits(
+            "completion",
+            model,
+            acompletion,
+            record=record,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        record.count("remote_calls")
+        record_usage(record, getattr(response, "usage", None))
 
     # Split response into lines and clean up
     expanded_queries = [
@@ -209,16 +431,24 @@ async def llm_filter_results(
     #     response_model=FilterResult,
     # )
 
-    # Enable instructor patches for async
-    aclient = instructor.from_litellm(acompletion)
-    resp = await aclient.chat.completions.create(
-        model="openai/o3-mini",
-        messages=messages,
-        response_model=FilterResult,
-    )
+    with stage("llm_filter", model=model, input_results=len(results)) as record:
+        aclient = get_instructor_client()
+        resp, completion = await call_with_limits(
+            "completion",
+            model,
+            aclient.chat.completions.create_with_completion,
+            record=record,
+            model=model,
+            messages=messages,
+            response_model=FilterResult,
+        )
+        record.count("remote_calls")
+        record_usage(record, getattr(completion, "usage", None))
 
-    # Return only the results at the specified indices
-    return [results[i] for i in resp.indices]
+        # Return only the results at the specified indices
+        filtered_results = [results[i] for i in dict.fromkeys(resp.indices) if 0 <= i < len(results)]
+        record.count("results", len(filtered_results))
+        return filtered_results
 
 
 async def generate_summary(
@@ -241,18 +471,406 @@ async def generate_summary(
     # Format results for the prompt
     formatted_results = "\n".join(f"- {r.content}" for r in results)
     prompt = SUMMARY_PROMPT.format(query=query, context=context, results=formatted_results)
-    response = await acompletion(
+    with stage("summary", model=model, input_results=len(results)) as record:
+        response = await call_with_limits(
+            "completion",
+            model,
+            acompletion,
+            record=record,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        record.count("remote_calls")
+        record_usage(record, getattr(response, "usage", None))
+    return response.choices[0].message.content.strip()
+
+
+async def generate_summary_stream(
+    query: str,
+    context: str,
+    results: List[SearchResult],
+    model: str = "openrouter/openai/o3-mini",
+) -> AsyncIterator[str]:
+    """Generate a summary of search results using LLM, yielding text deltas as they arrive.
+
+    Args:
+        query: Original search query
+        context: Context for the query
+        results: List of search results to summarize
+        model: LLM model to use
+
+    Yields:
+        Summary text deltas
+    """
+    formatted_results = "\n".join(f"- {r.content}" for r in results)
+    prompt = SUMMARY_PROMPT.format(query=query, context=context, results=formatted_results)
+    async for delta in _stream_completion(prompt=prompt, model=model, n_results=len(results)):
+        yield delta
+
+
+async def _stream_completion(prompt: str, model: str, n_results: int) -> AsyncIterator[str]:
+    """Stream a summary completion, recording its latency, time to first token and token usage."""
+    with stage("summary", model=model, input_results=n_results, stream=True) as record:
+        start_time = asyncio.get_running_loop().time()
+        response = await call_with_limits(
+            "completion",
+            model,
+            acompletion,
+            record=record,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        record.count("remote_calls")
+        async for chunk in response:
+            record_usage(record, getattr(chunk, "usage", None))
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if "first_token_ms" not in record.attributes:
+                    record.set(first_token_ms=(asyncio.get_running_loop().time() - start_time) * 1000)
+                yield delta
+
+
+async def generate_batch_summary_stream(
+    queries: List[Dict[str, Any]],
+    results: List[SearchResult],
+    model: str = "openrouter/openai/o3-mini",
+) -> AsyncIterator[str]:
+    """Generate one summary answering several queries from their shared search results, yielding text deltas.
+
+    Args:
+        queries: List of {"query", "context"} dictionaries
+        results: Deduplicated search results of all queries
+        model: LLM model to use
+
+    Yields:
+        Summary text deltas
+    """
+    formatted_queries = "\n".join(
+        f"{i}. Query: {q['query']}\n   Context: {q['context']}" for i, q in enumerate(queries, start=1)
+    )
+    formatted_results = "\n".join(f"- {r.content}" for r in results)
+    prompt = BATCH_SUMMARY_PROMPT.format(queries=formatted_queries, results=formatted_results)
+    async for delta in _stream_completion(prompt=prompt, model=model, n_results=len(results)):
+        yield delta
+
+
+async def pipelined_semantic_search(
+    query: str,
+    context: str,
+    client: VectorBackend,
+    collection_name: str,
+    vector_names: Optional[List[str]] = None,
+    limit: int = 10,
+    model: str = "openrouter/openai/o3-mini",
+    deadline: Optional[float] = None,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+) -> Tuple[List[str], Dict[str, SearchResult], bool]:
+    """Run query expansion and dense retrieval as a pipeline.
+
+    The original query is embedded and searched right away, in parallel with the query
+    expansion LLM call. Expanded queries are embedded in one batched request as soon as the
+    expansion returns, and searched together. See `federated_batched_semantic_search()`.
+
+    Args:
+        query: Original search query
+        context: Context for the query
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+        vector_names: Vector names of the collection, fetched if not provided
+        limit: Maximum number of results per search
+        model: LLM model to use for query expansion
+        deadline: Optional number of seconds after which pending work is cancelled
+        use_query_expansion: Whether to also search with LLM-generated alternative queries
+        embedding_model: Model the collection vectors were embedded with
+        payload_filter: Optional restriction to chunk types and source file prefixes
+        score_threshold: Optional minimum similarity score of the vector search results
+
+    Returns:
+        Tuple of (expanded queries, unique results by ID, whether the deadline was exceeded)
+    """
+    with stage("retrieval", queries=1, use_query_expansion=use_query_expansion) as record:
+        expanded_queries, unique_results, deadline_exceeded = await federated_batched_semantic_search(
+            queries=[{"query": query, "context": context}],
+            client=client,
+            collection_limits={collection_name: limit},
+            vector_names={collection_name: vector_names} if vector_names is not None else None,
+            model=model,
+            deadline=deadline,
+            use_query_expansion=use_query_expansion,
+            embedding_model=embedding_model,
+            payload_filter=payload_filter,
+            score_threshold=score_threshold,
+        )
+        record.set(deadline_exceeded=deadline_exceeded)
+        record.count("results", len(unique_results[collection_name][0]))
+    return expanded_queries[0], unique_results[collection_name][0], deadline_exceeded
+
+
+async def federated_semantic_search(
+    query: str,
+    context: str,
+    client: AsyncQdrantClient,
+    collection_limits: Dict[str, int],
+    vector_names: Optional[Dict[str, List[str]]] = None,
+    model: str = "openrouter/openai/o3-mini",
+    deadline: Optional[float] = None,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+) -> Tuple[List[str], Dict[str, Dict[str, SearchResult]], bool]:
+    """Run dense retrieval against several collections concurrently, sharing the query expansion and embeddings.
+
+    The original query is embedded once and searched in every collection while the query is
+    expanded, then the expanded queries are embedded once and searched in every collection.
+    A collection that cannot be searched (e.g. missing) is skipped with a warning.
+
+    Args:
+        query: Original search query
+        context: Context for the query
+        client: AsyncQdrantClient instance
+        collection_limits: Maximum number of results per search, by collection name
+        vector_names: Vector names by collection, fetched for the collections not provided
+        model: LLM model to use for query expansion
+        deadline: Optional number of seconds after which pending work is cancelled, keeping
+            the results found so far
+        use_query_expansion: Whether to also search with LLM-generated alternative queries
+        embedding_model: Model the collection vectors were embedded with
+        payload_filter: Optional restriction to chunk types and source file prefixes
+        score_threshold: Optional minimum similarity score of the vector search results
+
+    Returns:
+        Tuple of (expanded queries, unique results by ID by collection, whether the deadline was exceeded)
+    """
+    expanded_queries, unique_results, deadline_exceeded = await federated_batched_semantic_search(
+        queries=[{"query": query, "context": context}],
+        client=client,
+        collection_limits=collection_limits,
+        vector_names=vector_names,
         model=model,
-        messages=[{"role": "user", "content": prompt}],
+        deadline=deadline,
+        use_query_expansion=use_query_expansion,
+        embedding_model=embedding_model,
+        payload_filter=payload_filter,
+        score_threshold=score_threshold,
     )
-    return response.choices[0].message.content.strip()
+    return expanded_queries[0], {name: results[0] for name, results in unique_results.items()}, deadline_exceeded
 
 
-async def search(
+def fuse_collection_results(results_by_collection: Dict[str, List[SearchResult]]) -> List[SearchResult]:
+    """Merge the ranked results of several collections into one ranking.
+
+    Scores of different collections are not comparable (different contents, and fused BM25
+    scores for some), so each collection's scores are min-max normalized to [0, 1] before
+    merging. Each result's metadata gets the name of its collection.
+
+    Args:
+        results_by_collection: Ranked results by collection name, already cut to each collection's limit
+
+    Returns:
+        Results of all collections sorted by normalized score
+    """
+    fused = []
+    for collection_name, results in results_by_collection.items():
+        if not results:
+            continue
+        scores = [r.score for r in results]
+        min_score, max_score = min(scores), max(scores)
+        for r in results:
+            normalized = (r.score - min_score) / (max_score - min_score) if max_score > min_score else 1.0
+            fused.append(
+                SearchResult(
+                    id=r.id,
+                    score=normalized,
+                    content=r.content,
+                    metadata={**r.metadata, "collection": collection_name},
+                )
+            )
+    return sorted(fused, key=lambda r: r.score, reverse=True)
+
+
+async def _hybrid_search(
+    queries: List[Dict[str, Any]],
+    client: VectorBackend,
+    collection_limits: Dict[str, int],
+    vector_names: Optional[Dict[str, List[str]]],
+    model: str,
+    deadline: Optional[float],
+    use_query_expansion: bool,
+    embedding_model: str,
+    local_index_path: Optional[str],
+    payload_filter: Optional[PayloadFilter],
+    score_threshold: Optional[float],
+    score_margin: Optional[float],
+) -> Tuple[List[List[str]], List[List[SearchResult]], List[List[SearchResult]], List[List[SearchResult]], bool]:
+    """Dense and sparse search of one or several queries in one or several collections.
+
+    The sparse searches use the keywords of each query, or the code identifiers (e.g.
+    SpikeGLXRecordingInterface) found in it, and run concurrently with the dense retrieval.
+    Both rankings are fused with RRF per query and collection, then across collections with
+    `fuse_collection_results()` when several are searched.
+
+    Returns:
+        Tuple of (expanded queries, semantic results, keyword results and fused results per
+        query, whether the deadline was exceeded)
+    """
+    sparse_tasks: Dict[str, List[Optional[asyncio.Task]]] = {name: [] for name in collection_limits}
+    for q in queries:
+        sparse_terms = q.get("keywords") or extract_identifiers(q["query"])
+        if sparse_terms:
+            logger.info(f"Keyword search terms: {sparse_terms}")
+        for name, collection_limit in collection_limits.items():
+            sparse_tasks[name].append(
+                asyncio.create_task(
+                    keyword_search(
+                        client=client,
+                        collection_name=name,
+                        keywords=sparse_terms,
+                        limit=collection_limit,
+                        local_index_path=local_index_path,
+                        payload_filter=payload_filter,
+                    )
+                ) if sparse_terms else None
+            )
+
+    with stage(
+        "retrieval",
+        queries=len(queries),
+        collections=len(collection_limits),
+        use_query_expansion=use_query_expansion,
+    ) as record:
+        try:
+            expanded_queries, unique_results, deadline_exceeded = await federated_batched_semantic_search(
+                queries=queries,
+                client=client,
+                collection_limits=collection_limits,
+                vector_names=vector_names,
+                model=model,
+                deadline=deadline,
+                use_query_expansion=use_query_expansion,
+                embedding_model=embedding_model,
+                payload_filter=payload_filter,
+                score_threshold=score_threshold,
+            )
+        except BaseException:
+            for task in (t for tasks in sparse_tasks.values() for t in tasks if t is not None):
+                task.cancel()
+            raise
+        record.set(deadline_exceeded=deadline_exceeded)
+        record.count("results", sum(len(r) for results in unique_results.values() for r in results))
+
+    semantic_results: List[List[SearchResult]] = [[] for _ in queries]
+    keyword_results: List[List[SearchResult]] = [[] for _ in queries]
+    results_by_collection: Dict[str, List[List[SearchResult]]] = {}
+    for name, collection_limit in collection_limits.items():
+        results_by_collection[name] = []
+        for i, (query_results, sparse_task) in enumerate(zip(unique_results[name], sparse_tasks[name])):
+            # Dense results sorted by score, cut relative to the best score
+            query_semantic_results = adaptive_score_cutoff(
+                sorted(query_results.values(), key=lambda x: x.score, reverse=True),
+                score_margin=score_margin,
+            )
+            query_keyword_results: List[SearchResult] = []
+            if sparse_task is not None:
+                try:
+                    query_keyword_results = await sparse_task
+                except Exception as e:
+                    logger.warning(f"Keyword search of collection {name} failed, using semantic results only: {str(e)}")
+
+            # Merge dense and sparse rankings with reciprocal rank fusion
+            if query_keyword_results:
+                results_by_collection[name].append([
+                    SearchResult(id=r.id, score=fused_score, content=r.content, metadata=r.metadata)
+                    for r, fused_score in reciprocal_rank_fusion(
+                        [query_semantic_results, query_keyword_results]
+                    )[:collection_limit]
+                ])
+            else:
+                results_by_collection[name].append(query_semantic_results[:collection_limit])
+            semantic_results[i].extend(query_semantic_results)
+            keyword_results[i].extend(query_keyword_results)
+        logger.info(f"Results of collection {name}: {[len(r) for r in results_by_collection[name]]}")
+
+    if len(collection_limits) > 1:
+        combined_results = [
+            fuse_collection_results({name: results[i] for name, results in results_by_collection.items()})
+            for i in range(len(queries))
+        ]
+    else:
+        combined_results = next(iter(results_by_collection.values()))
+    return expanded_queries, semantic_results, keyword_results, combined_results, deadline_exceeded
+
+
+async def _pack_and_rerank(
+    queries: List[Dict[str, Any]],
+    results_per_query: List[List[SearchResult]],
+    reranker: Union[str, Reranker, None],
+    model: str,
+    embedding_model: str,
+    client: VectorBackend,
+    collection_name: str,
+    context_token_budget: Optional[int],
+) -> List[List[SearchResult]]:
+    """Fit the results of the queries in the prompt token budget, then rerank and filter the results of each query.
+
+    The results of all queries are deduplicated, diversified and packed together, and each query
+    keeps its packed results in packing order. When reranking fails, the packed results are kept.
+    """
+    if context_token_budget is not None:
+        with stage("context_packing", max_tokens=context_token_budget) as packing_record:
+            packed_results, packing_stats = pack_context(
+                results=_deduplicate_results(results_per_query),
+                model=model,
+                max_tokens=context_token_budget,
+            )
+            packing_record.set(**packing_stats.to_dict())
+        packed_positions = {r.id: i for i, r in enumerate(packed_results)}
+        results_per_query = [
+            sorted((r for r in results if r.id in packed_positions), key=lambda r: packed_positions[r.id])
+            for results in results_per_query
+        ]
+
+    reranker = _build_reranker(
+        reranker,
+        model=model,
+        embedding_model=embedding_model,
+        client=client,
+        collection_name=collection_name,
+    )
+    if reranker is None:
+        return results_per_query
+    logger.info(f"Reranking the search results of {len(queries)} queries with {type(reranker).__name__}")
+    with stage(
+        "rerank",
+        reranker=type(reranker).__name__,
+        input_results=sum(len(r) for r in results_per_query),
+    ) as rerank_record:
+        try:
+            results_per_query = await reranker.rerank_batch(
+                [(q["query"], q["context"], results) for q, results in zip(queries, results_per_query)]
+            )
+        except Exception as e:
+            logger.warning(f"Reranking failed, using the packed results: {type(e).__name__}: {str(e)}")
+            rerank_record.set(fallback=True)
+        rerank_record.count("results", sum(len(r) for r in results_per_query))
+    return results_per_query
+
+
+@stream_stage("search", lambda args: {
+    "model": args["model"],
+    "backend": args["backend"],
+    "reranker": _reranker_name(args["reranker"]),
+})
+async def search_stream(
     query: str,
     context: str,
     qdrant_url: str,
-    collection_name: str,
+    collection_name: Union[str, List[str]],
     keywords: Optional[List[str]] = None,
     qdrant_api_key: Optional[str] = None,
     timeout: float = 60.0,
@@ -260,96 +878,147 @@ async def search(
     return_references: bool = True,
     limit: int = 10,
     model: str = "openrouter/openai/o3-mini",
-) -> Dict[str, Any]:
-    """Perform advanced hybrid search with query expansion and optional summarization.
+    response_cache: Optional[SemanticResponseCache] = None,
+    client: Optional[VectorBackend] = None,
+    vector_names: Optional[List[str]] = None,
+    collection_versions: Optional[Dict[str, str]] = None,
+    deadline: Optional[float] = None,
+    backend: str = "qdrant",
+    local_index_path: str = DEFAULT_LOCAL_INDEX_PATH,
+    reranker: Union[str, Reranker, None] = "embedding",
+    context_token_budget: Optional[int] = 6000,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    collection_limits: Optional[Dict[str, int]] = None,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+    score_margin: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Perform advanced hybrid search with query expansion and optional summarization, streaming the response.
+
+    LLM and embedding calls are rate limited and retried (see `utils.rate_limiter`). While the
+    circuit breaker of the LLM is open, or when the rerank or summary calls fail, the search
+    degrades to the references without summary, and the response gets a `degraded` notice.
 
     Args:
         query: Search query text
         context: Context in which the query is relevant
-        keywords: List of keywords for sparse search
+        keywords: List of keywords for sparse (BM25) search. Defaults to the code identifiers in the query
         qdrant_manager: QdrantManager instance
-        collection_name: Name of collection to search
+        collection_name: Name of collection to search, or names of several collections to search
+            concurrently. Results of several collections are normalized per collection, fused, and
+            tagged with a `collection` field
         return_digest_summary: Whether to generate a summary of results
         return_references: Whether to include search results in response
-        limit: Maximum number of results to return
+        limit: Maximum number of results to return (per collection when searching several)
         model: LLM model to use for query expansion and summarization
-
-    Returns:
-        Dictionary containing:
-        - expanded_queries: List of generated alternative queries
-        - search_results: List of search results (if return_references=True)
-        - summary: Generated summary (if return_digest_summary=True)
+        response_cache: Optional semantic cache of whole responses for similar queries
+        client: Optional long-lived AsyncQdrantClient or local index to reuse instead of creating a new one
+        vector_names: Optional cached vector names of the collection (of the first one when searching
+            several), to skip fetching its schema
+        collection_versions: Optional cached content versions by collection name (see
+            `get_collection_version`), keying the response cache. Fetched for each search otherwise
+        collection_limits: Optional maximum number of results by collection name, when searching
+            several collections. Collections not listed get `limit`
+        deadline: Optional number of seconds after which the retrieval stage stops waiting for
+            query expansion and pending searches, and proceeds with the results it has
+        backend: Vector search backend, either "qdrant" (remote collection) or "local"
+            (in-process mirror written by `sync_local_index.py`)
+        local_index_path: Directory of the local index, used when backend is "local"
+        reranker: Rerank stage applied before summarization: a Reranker instance or one of
+            "embedding" (cosine between the query embedding and the stored chunk vectors, default),
+            "cross-encoder" (local CPU model), "llm" (LLM filter, slowest) or "none"
+        context_token_budget: Maximum number of tokens of result contents sent to the rerank and
+            summary prompts, after near-duplicate removal and MMR selection. None disables packing
+        use_query_expansion: Whether to also search with LLM-generated alternative queries.
+            Disabling it saves an LLM round trip, e.g. for queries naming an exact class
+        embedding_model: Model the collection vectors were embedded with, used for the query,
+            response cache and embedding reranker embeddings. `local/` models run in-process
+        payload_filter: Optional restriction of the vector and keyword searches to chunk types
+            (e.g. "code" or "docs") and source file path prefixes, served by payload indexes
+        score_threshold: Optional minimum similarity score of the vector search results
+        score_margin: Optional adaptive cutoff: vector search results scoring more than this
+            below the best one are dropped before fusion, keeping at least 3
+
+    Yields:
+        Event dictionaries, in order:
+        - {"type": "references", "expanded_queries": [...], "search_results": [...]}
+        - {"type": "summary_delta", "content": str}, zero or more times (if return_digest_summary=True)
+        - {"type": "done", "response": dict}, with the full response as returned by `search()`
     """
-    # Step 1: Generate alternative queries
-    logger.info(f"Expanding query: {query}")
-    expanded_queries = await expand_query(query, context, model)
-    logger.info(f"Expanded queries: {expanded_queries}")
-
-    # Initialize Qdrant client
-    client = AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key, timeout=timeout)
-
-    # Get vector names from collection
-    collection_info = await client.get_collection(collection_name=collection_name)
-    vector_names = list(collection_info.config.params.vectors.keys())
-    logger.info(f"Available vector names: {vector_names}")
-
-    # Dictionary to track unique results by ID
-    unique_results: Dict[str, SearchResult] = {}
-
-    # Generate embedding for original query
-    query_embedding = (await generate_embeddings(texts=[query]))[0]
-
-    # Search with original query across all vector names
-    for vector_name in vector_names:
-        results_list = await search_vectors(
+    record = current_stream_record()
+    client = _search_client(client, backend, qdrant_url, qdrant_api_key, timeout, local_index_path)
+    collection_names = [collection_name] if isinstance(collection_name, str) else list(collection_name)
+
+    # Serve similar (query, context) pairs from the response cache
+    if response_cache is not None:
+        cached_response, cache_key = await _lookup_response_cache(
+            response_cache,
             client=client,
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            vector_name=vector_name,
-            limit=limit,
-        )
-        for r in results_list:
-            result = SearchResult.from_dict(r)
-            if result.id not in unique_results or result.score > unique_results[result.id].score:
-                unique_results[result.id] = result
-        logger.info(f"Semantic search results for original query with {vector_name}: {len(results_list)}")
-
-    # Expanded queries search
-    for exp_query in expanded_queries:
-        # Generate embedding for expanded query
-        exp_query_embedding = (await generate_embeddings(texts=[exp_query]))[0]
-        for vector_name in vector_names:
-            results_list = await search_vectors(
-                client=client,
+            query=query,
+            context=context,
+            collection_names=collection_names,
+            collection_versions=collection_versions,
+            embedding_model=embedding_model,
+            options=_search_options(
                 collection_name=collection_name,
-                query_vector=exp_query_embedding,
-                vector_name=vector_name,
+                keywords=keywords,
+                return_digest_summary=return_digest_summary,
+                return_references=return_references,
                 limit=limit,
-            )
-            for r in results_list:
-                result = SearchResult.from_dict(r)
-                if (
-                    result.id not in unique_results
-                    or result.score > unique_results[result.id].score
-                ):
-                    unique_results[result.id] = result
-            logger.info(
-                f"Semantic search results for expanded query with {vector_name}: {len(results_list)}"
-            )
-
-    # Convert unique results to sorted list
-    semantic_results = [
-        sorted(unique_results.values(), key=lambda x: x.score, reverse=True)[:limit]
-    ]
-
-    # Keyword search if keywords provided
-    if keywords:
-        logger.info("Keyword search not implemented")
+                model=model,
+                context_token_budget=context_token_budget,
+                reranker=reranker,
+                use_query_expansion=use_query_expansion,
+                vector_names=vector_names,
+                embedding_model=embedding_model,
+                collection_limits=collection_limits,
+                payload_filter=payload_filter,
+                score_threshold=score_threshold,
+                score_margin=score_margin,
+            ),
+        )
+        if cached_response is not None:
+            logger.info(f"Response cache hit for query: {query}, stats: {response_cache.stats()}")
+            for event in _cached_response_events(cached_response):
+                yield event
+            return
+
+    # Fall back to a pipeline without LLM calls while the circuit breaker of the LLM is open
+    degraded = not is_available("completion", model)
+    if degraded:
+        logger.warning(f"LLM calls to {model} are failing, searching without query expansion and summary")
+        use_query_expansion = False
+        return_digest_summary = False
+
+    # Expand the query while already searching with the original one, in every collection
+    queries = [{"query": query, "context": context, "keywords": keywords}]
+    expanded_queries, semantic_results, keyword_results, combined_results, deadline_exceeded = await _hybrid_search(
+        queries=queries,
+        client=client,
+        collection_limits={name: (collection_limits or {}).get(name, limit) for name in collection_names},
+        vector_names={collection_names[0]: vector_names} if vector_names is not None else None,
+        model=model,
+        deadline=deadline,
+        use_query_expansion=use_query_expansion,
+        embedding_model=embedding_model,
+        local_index_path=local_index_path,
+        payload_filter=payload_filter,
+        score_threshold=score_threshold,
+        score_margin=score_margin,
+    )
+    combined_results = combined_results[0]
 
-    combined_results = semantic_results[0]
+    record.set(
+        semantic_results=len(semantic_results[0]),
+        keyword_results=len(keyword_results[0]),
+        deadline_exceeded=deadline_exceeded,
+    )
 
     # Prepare response
-    response = {"expanded_queries": expanded_queries}
+    response = {"expanded_queries": expanded_queries[0]}
+    if degraded:
+        response["degraded"] = DEGRADED_NOTICE
 
     if return_references:
         response["search_results"] = [
@@ -358,14 +1027,17 @@ async def search(
         ]
 
     if return_digest_summary and combined_results:
-        # First filter the results
-        logger.info("LLM is filtering the search results")
-        filtered_results = await llm_filter_results(
-            query=query,
-            context=context,
-            results=combined_results,
+        # Fit the results in the prompt token budget, then rerank and filter them
+        filtered_results = (await _pack_and_rerank(
+            queries=queries,
+            results_per_query=[combined_results],
+            reranker=reranker,
             model=model,
-        )
+            embedding_model=embedding_model,
+            client=client,
+            collection_name=collection_names[0],
+            context_token_budget=context_token_budget,
+        ))[0]
 
         # Then generate summary only if we have filtered results
         if filtered_results:
@@ -373,12 +1045,672 @@ async def search(
                 {"id": r.id, "score": r.score, "content": r.content, **r.metadata}
                 for r in filtered_results
             ]
+            yield _references_event(response)
+
             logger.info("Generating summary based on filtered results")
-            response["summary"] = await generate_summary(
-                query=query,
-                context=context,
-                results=filtered_results,
-                model=model,
+            summary_parts = []
+            try:
+                async for delta in generate_summary_stream(
+                    query=query,
+                    context=context,
+                    results=filtered_results,
+                    model=model,
+                ):
+                    summary_parts.append(delta)
+                    yield {"type": "summary_delta", "content": delta}
+            except Exception as e:
+                # Keep the references (and any partial summary) instead of failing the whole search
+                logger.warning(f"Summary generation failed, returning the references: {type(e).__name__}: {str(e)}")
+                degraded = True
+                response["degraded"] = DEGRADED_NOTICE
+            if summary_parts:
+                response["summary"] = "".join(summary_parts).strip()
+        else:
+            yield _references_event(response)
+    else:
+        yield _references_event(response)
+
+    # Partial results cut by the deadline or degraded ones are not worth serving to later queries
+    if degraded:
+        record.count("degraded")
+    if response_cache is not None and not deadline_exceeded and not degraded:
+        await _store_response(response_cache, cache_key, query=query, context=context, response=response)
+
+    record.count("results", len(response.get("search_results", [])))
+    yield {"type": "done", "response": response}
+
+
+def _search_client(
+    client: Optional[VectorBackend],
+    backend: str,
+    qdrant_url: str,
+    qdrant_api_key: Optional[str],
+    timeout: float,
+    local_index_path: str,
+) -> VectorBackend:
+    """The client passed by the caller, or a new one for the backend."""
+    if client is not None:
+        return client
+    if backend == "local":
+        return load_local_index(local_index_path)
+    if backend == "qdrant":
+        return AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key, timeout=timeout)
+    raise ValueError(f"Unknown search backend: {backend}. Must be one of: 'qdrant', 'local'.")
+
+
+def _search_options(
+    collection_name: Union[str, List[str]],
+    keywords: Any,
+    return_digest_summary: bool,
+    return_references: bool,
+    limit: int,
+    model: str,
+    context_token_budget: Optional[int],
+    reranker: Union[str, Reranker, None],
+    use_query_expansion: bool,
+    vector_names: Optional[List[str]],
+    embedding_model: str,
+    collection_limits: Optional[Dict[str, int]],
+    payload_filter: Optional[PayloadFilter],
+    score_threshold: Optional[float],
+    score_margin: Optional[float],
+) -> Dict[str, Any]:
+    """Search options a response depends on, part of its response cache scope."""
+    return {
+        "collection_name": collection_name,
+        "keywords": keywords,
+        "return_digest_summary": return_digest_summary,
+        "return_references": return_references,
+        "limit": limit,
+        "model": model,
+        "context_token_budget": context_token_budget,
+        "reranker": _reranker_name(reranker),
+        "use_query_expansion": use_query_expansion,
+        "vector_names": vector_names,
+        "embedding_model": embedding_model,
+        "collection_limits": collection_limits,
+        "payload_filter": payload_filter.to_dict() if payload_filter is not None else None,
+        "score_threshold": score_threshold,
+        "score_margin": score_margin,
+    }
+
+
+async def _lookup_response_cache(
+    response_cache: SemanticResponseCache,
+    client: VectorBackend,
+    query: str,
+    context: str,
+    collection_names: List[str],
+    collection_versions: Optional[Dict[str, str]],
+    embedding_model: str,
+    options: Dict[str, Any],
+) -> Tuple[Optional[Dict[str, Any]], Tuple[str, List[float], List[float]]]:
+    """Look up a similar (query, context) pair in the response cache.
+
+    The scope of the lookup is the search options and the content versions of the collections,
+    so that responses cached before a re-ingestion miss.
+
+    Returns:
+        Tuple of (cached response or None, (scope, query embedding, context embedding) to store
+        the response under)
+    """
+    embeddings, *versions = await asyncio.gather(
+        generate_embeddings(texts=[query, context], model=embedding_model),
+        *(_get_collection_version(client, name, collection_versions) for name in collection_names),
+    )
+    query_embedding, context_embedding = embeddings
+    cache_scope = json.dumps({**options, "collection_versions": versions}, sort_keys=True)
+    with stage("response_cache") as cache_record:
+        cached_response = await asyncio.to_thread(
+            response_cache.lookup, cache_scope, query_embedding, context_embedding
+        )
+        cache_record.count("cache_hits" if cached_response is not None else "cache_misses")
+    current_stream_record().set(response_cache_hit=cached_response is not None)
+    return cached_response, (cache_scope, query_embedding, context_embedding)
+
+
+async def _store_response(
+    response_cache: SemanticResponseCache,
+    cache_key: Tuple[str, List[float], List[float]],
+    query: str,
+    context: str,
+    response: Dict[str, Any],
+) -> None:
+    cache_scope, query_embedding, context_embedding = cache_key
+    await asyncio.to_thread(
+        response_cache.store,
+        scope=cache_scope,
+        query=query,
+        context=context,
+        query_embedding=query_embedding,
+        context_embedding=context_embedding,
+        response=response,
+    )
+
+
+def _cached_response_events(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    events = [_references_event(response)]
+    if response.get("summary"):
+        events.append({"type": "summary_delta", "content": response["summary"]})
+    events.append({"type": "done", "response": response})
+    return events
+
+
+def _reranker_name(reranker: Union[str, Reranker, None]) -> Optional[str]:
+    return reranker if isinstance(reranker, str) or reranker is None else type(reranker).__name__
+
+
+async def _get_collection_version(
+    client: VectorBackend,
+    collection_name: str,
+    collection_versions: Optional[Dict[str, str]],
+) -> str:
+    """Content version of a collection, from the versions cached by the caller when it has one."""
+    if collection_versions and collection_name in collection_versions:
+        return collection_versions[collection_name]
+    return await get_collection_version(client, collection_name)
+
+
+def _build_reranker(
+    reranker: Union[str, Reranker, None],
+    model: str,
+    embedding_model: str,
+    client: Optional[VectorBackend] = None,
+    collection_name: Optional[str] = None,
+) -> Optional[Reranker]:
+    """Build a reranker given by name, using the search LLM, or the embedding model and stored vectors of the collection."""
+    if not isinstance(reranker, str):
+        return reranker
+    if reranker == "llm":
+        return get_reranker(reranker, model=model)
+    if reranker == "embedding":
+        return get_reranker(reranker, model=embedding_model, client=client, collection_name=collection_name)
+    return get_reranker(reranker)
+
+
+def _references_event(response: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "references",
+        "expanded_queries": response.get("expanded_queries", []),
+        "search_results": response.get("search_results", []),
+    }
+
+
+async def search(
+    query: str,
+    context: str,
+    qdrant_url: str,
+    collection_name: str,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Perform advanced hybrid search with query expansion and optional summarization.
+
+    Thin collector over `search_stream()`, which accepts the same arguments.
+
+    Args:
+        query: Search query text
+        context: Context in which the query is relevant
+        qdrant_url: Qdrant URL
+        collection_name: Name of collection to search
+        **kwargs: Other `search_stream()` arguments
+
+    Returns:
+        Dictionary containing:
+        - expanded_queries: List of generated alternative queries
+        - search_results: List of search results (if return_references=True)
+        - summary: Generated summary (if return_digest_summary=True)
+    """
+    response: Dict[str, Any] = {}
+    async for event in search_stream(
+        query=query,
+        context=context,
+        qdrant_url=qdrant_url,
+        collection_name=collection_name,
+        **kwargs,
+    ):
+        if event["type"] == "done":
+            response = event["response"]
+    return response
+
+
+async def batched_semantic_search(
+    queries: List[Dict[str, Any]],
+    client: VectorBackend,
+    collection_name: str,
+    vector_names: Optional[List[str]] = None,
+    limit: int = 10,
+    model: str = "openrouter/openai/o3-mini",
+    deadline: Optional[float] = None,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+) -> Tuple[List[List[str]], List[Dict[str, SearchResult]], bool]:
+    """Run query expansion and dense retrieval for several queries with shared requests.
+
+    All original queries are embedded in one request and searched in one batch, in parallel
+    with the query expansion LLM calls. All expanded queries are then embedded in one request
+    and searched in one batch.
+
+    Args:
+        queries: List of {"query", "context"} dictionaries
+        client: AsyncQdrantClient instance or local index
+        collection_name: Collection name
+        vector_names: Vector names of the collection, fetched if not provided
+        limit: Maximum number of results per search
+        model: LLM model to use for query expansion
+        deadline: Optional number of seconds after which pending work is cancelled, keeping
+            the results found so far
+        use_query_expansion: Whether to also search with LLM-generated alternative queries
+        embedding_model: Model the collection vectors were embedded with
+        payload_filter: Optional restriction to chunk types and source file prefixes
+        score_threshold: Optional minimum similarity score of the vector search results
+
+    Returns:
+        Tuple of (expanded queries per query, unique results by ID per query, whether the
+        deadline was exceeded)
+    """
+    expanded_queries, unique_results, deadline_exceeded = await federated_batched_semantic_search(
+        queries=queries,
+        client=client,
+        collection_limits={collection_name: limit},
+        vector_names={collection_name: vector_names} if vector_names is not None else None,
+        model=model,
+        deadline=deadline,
+        use_query_expansion=use_query_expansion,
+        embedding_model=embedding_model,
+        payload_filter=payload_filter,
+        score_threshold=score_threshold,
+    )
+    return expanded_queries, unique_results[collection_name], deadline_exceeded
+
+
+async def federated_batched_semantic_search(
+    queries: List[Dict[str, Any]],
+    client: VectorBackend,
+    collection_limits: Dict[str, int],
+    vector_names: Optional[Dict[str, List[str]]] = None,
+    model: str = "openrouter/openai/o3-mini",
+    deadline: Optional[float] = None,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+) -> Tuple[List[List[str]], Dict[str, List[Dict[str, SearchResult]]], bool]:
+    """Run `batched_semantic_search` against one or several collections, sharing the query expansion and embeddings.
+
+    This is the dense retrieval of all the searches: the single query, batched and federated
+    variants call it with one query or one collection. The original queries are embedded in
+    one request and searched in every collection right away, in parallel with the query
+    expansion LLM calls; the expanded queries are then embedded in one request and searched in
+    every collection. When several collections are searched, a collection that cannot be
+    searched (e.g. missing) is skipped with a warning.
+
+    Args:
+        queries: List of {"query", "context"} dictionaries
+        client: AsyncQdrantClient instance or local index
+        collection_limits: Maximum number of results per search, by collection name
+        vector_names: Vector names by collection, fetched for the collections not provided
+        deadline: Optional number of seconds after which pending work is cancelled, keeping
+            the results found so far
+        Other arguments: same as `batched_semantic_search()`
+
+    Returns:
+        Tuple of (expanded queries per query, unique results by ID per query by collection,
+        whether the deadline was exceeded)
+
+    Raises:
+        ValueError: If several collections are searched in a local index
+    """
+    if len(collection_limits) > 1 and isinstance(client, LocalVectorIndex):
+        raise ValueError("Federated search across several collections requires the 'qdrant' backend.")
+
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+
+    def remaining_time() -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - (loop.time() - start_time))
+
+    vector_names = vector_names or {}
+    vector_names_tasks = {
+        name: asyncio.create_task(get_vector_names(client=client, collection_name=name))
+        for name in collection_limits
+        if name not in vector_names
+    }
+    skip_failures = len(collection_limits) > 1
+
+    unique_results: Dict[str, List[Dict[str, SearchResult]]] = {
+        name: [{} for _ in queries] for name in collection_limits
+    }
+    expanded_queries: List[List[str]] = [[] for _ in queries]
+
+    async def search_collection(name: str, query_indexes: List[int], query_vectors: List[List[float]]) -> None:
+        try:
+            results = await search_all_vectors(
+                client=client,
+                collection_name=name,
+                query_vectors=query_vectors,
+                vector_names=vector_names[name] if name in vector_names else await vector_names_tasks[name],
+                limit=collection_limits[name],
+                score_threshold=score_threshold,
+                payload_filter=payload_filter,
             )
+        except Exception as e:
+            if not skip_failures:
+                raise
+            logger.warning(f"Search of collection {name} failed, skipping it: {str(e)}")
+            return
+        for i, results_by_vector in zip(query_indexes, results):
+            for results_list in results_by_vector:
+                merge_results(unique_results[name][i], results_list)
+
+    async def search_collections(query_indexes: List[int], query_vectors: List[List[float]]) -> None:
+        await asyncio.gather(*(search_collection(name, query_indexes, query_vectors) for name in collection_limits))
+
+    async def search_original() -> None:
+        query_embeddings = await generate_embeddings(texts=[q["query"] for q in queries], model=embedding_model)
+        await search_collections(list(range(len(queries))), query_embeddings)
+        logger.info(
+            f"Semantic search results for {len(queries)} original queries: "
+            f"{ {name: [len(r) for r in results] for name, results in unique_results.items()} }"
+        )
+
+    async def expand_and_search() -> None:
+        expansions = await asyncio.gather(
+            *(expand_query(q["query"], q["context"], model) for q in queries),
+            return_exceptions=True,
+        )
+        for i, (q, expanded) in enumerate(zip(queries, expansions)):
+            if isinstance(expanded, Exception):
+                logger.warning(f"Query expansion failed for {q['query']}, using the original query only: {str(expanded)}")
+                continue
+            expanded_queries[i] = expanded
+        logger.info(f"Expanded queries: {expanded_queries}")
+
+        flat_queries = [(i, text) for i, expanded in enumerate(expanded_queries) for text in expanded]
+        if flat_queries:
+            embeddings = await generate_embeddings(texts=[text for _, text in flat_queries], model=embedding_model)
+            await search_collections([i for i, _ in flat_queries], embeddings)
+
+    original_task = asyncio.create_task(search_original())
+    expansion_task = asyncio.create_task(expand_and_search()) if use_query_expansion else None
+    try:
+        # The deadline also covers the embedding and search of the original queries
+        done, _ = await asyncio.wait({original_task}, timeout=remaining_time())
+        if not done:
+            logger.warning(f"Search deadline of {deadline}s exceeded while searching the original queries")
+            return expanded_queries, unique_results, True
+        original_task.result()
+
+        if expansion_task is not None:
+            done, _ = await asyncio.wait({expansion_task}, timeout=remaining_time())
+            if not done:
+                logger.warning(f"Search deadline of {deadline}s exceeded, cancelling the expanded query searches")
+                return expanded_queries, unique_results, True
+            try:
+                expansion_task.result()
+            except Exception as e:
+                logger.warning(f"Expanded query searches failed, using the original queries only: {str(e)}")
+                expanded_queries = [[] for _ in queries]
+    finally:
+        # Cancel what is left on the deadline, on an error or when the caller is cancelled
+        for task in [original_task, expansion_task, *vector_names_tasks.values()]:
+            if task is not None and not task.done():
+                task.cancel()
+    return expanded_queries, unique_results, False
+
+
+def normalize_batch_queries(queries: Any, name: str = "queries") -> List[Dict[str, Any]]:
+    """
+    Validate the queries of a batch search and fill in their optional fields.
+
+    Args:
+        queries: List of {"query", "context" (optional), "keywords" (optional)} dictionaries
+        name: Name of the argument, used in error messages
+
+    Returns:
+        List of {"query", "context", "keywords"} dictionaries
 
+    Raises:
+        ValueError: If the queries are not a list of such dictionaries
+    """
+    if not isinstance(queries, list):
+        raise ValueError(f"{name} must be a list of {{'query', 'context'}} dictionaries, got {type(queries).__name__}")
+    normalized = []
+    for i, q in enumerate(queries):
+        if not isinstance(q, dict):
+            raise ValueError(
+                f"{name}[{i}] must be a dictionary such as {{'query': '...', 'context': '...'}}, "
+                f"got {type(q).__name__}: {q!r}"
+            )
+        if not isinstance(q.get("query"), str) or not q["query"].strip():
+            raise ValueError(f"{name}[{i}] must have a non-empty 'query' string")
+        context = q.get("context")
+        if context is not None and not isinstance(context, str):
+            raise ValueError(f"{name}[{i}]['context'] must be a string, got {type(context).__name__}")
+        keywords = q.get("keywords")
+        if keywords is not None and (not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords)):
+            raise ValueError(f"{name}[{i}]['keywords'] must be a list of strings")
+        normalized.append({"query": q["query"], "context": context or "", "keywords": keywords})
+    return normalized
+
+
+@stream_stage("search_batch", lambda args: {
+    "model": args["model"],
+    "backend": args["backend"],
+    "queries": len(args["queries"]) if isinstance(args["queries"], list) else None,
+})
+async def search_batch_stream(
+    queries: List[Dict[str, Any]],
+    qdrant_url: str,
+    collection_name: Union[str, List[str]],
+    qdrant_api_key: Optional[str] = None,
+    timeout: float = 60.0,
+    return_digest_summary: bool = True,
+    return_references: bool = True,
+    limit: int = 10,
+    model: str = "openrouter/openai/o3-mini",
+    response_cache: Optional[SemanticResponseCache] = None,
+    client: Optional[VectorBackend] = None,
+    vector_names: Optional[List[str]] = None,
+    collection_versions: Optional[Dict[str, str]] = None,
+    deadline: Optional[float] = None,
+    backend: str = "qdrant",
+    local_index_path: str = DEFAULT_LOCAL_INDEX_PATH,
+    reranker: Union[str, Reranker, None] = "embedding",
+    context_token_budget: Optional[int] = 6000,
+    use_query_expansion: bool = True,
+    embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    collection_limits: Optional[Dict[str, int]] = None,
+    payload_filter: Optional[PayloadFilter] = None,
+    score_threshold: Optional[float] = None,
+    score_margin: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Search several queries at once, sharing the embedding, vector search, rerank and summary calls.
+
+    Results are deduplicated across queries: each chunk appears once in `search_results`, and
+    each query lists the IDs of its results. A single summary answers all queries. As in
+    `search_stream()`, the results are packed in the token budget before being reranked.
+
+    Args:
+        queries: List of {"query", "context", "keywords" (optional)} dictionaries
+        qdrant_url: Qdrant URL
+        collection_name: Name of collection to search, or names of several collections to search
+            concurrently, as in `search_stream()`
+        response_cache: Optional semantic cache of whole responses, matched on all the queries and contexts
+        Other arguments: same as `search_stream()`
+
+    Yields:
+        Event dictionaries, in the same order as `search_stream()`
+
+    Raises:
+        ValueError: If the queries are not a list of {"query", "context"} dictionaries
+    """
+    queries = normalize_batch_queries(queries)
+    collection_names = [collection_name] if isinstance(collection_name, str) else list(collection_name)
+    collection_limits = {name: (collection_limits or {}).get(name, limit) for name in collection_names}
+    record = current_stream_record()
+    client = _search_client(client, backend, qdrant_url, qdrant_api_key, timeout, local_index_path)
+
+    # Serve similar batches from the response cache, matching all the queries and all the contexts at once
+    if response_cache is not None:
+        cached_response, cache_key = await _lookup_response_cache(
+            response_cache,
+            client=client,
+            query="\n".join(q["query"] for q in queries),
+            context="\n".join(q["context"] for q in queries),
+            collection_names=collection_names,
+            collection_versions=collection_versions,
+            embedding_model=embedding_model,
+            options={
+                **_search_options(
+                    collection_name=collection_name,
+                    keywords=[q["keywords"] for q in queries],
+                    return_digest_summary=return_digest_summary,
+                    return_references=return_references,
+                    limit=limit,
+                    model=model,
+                    context_token_budget=context_token_budget,
+                    reranker=reranker,
+                    use_query_expansion=use_query_expansion,
+                    vector_names=vector_names,
+                    embedding_model=embedding_model,
+                    collection_limits=collection_limits,
+                    payload_filter=payload_filter,
+                    score_threshold=score_threshold,
+                    score_margin=score_margin,
+                ),
+                "batch": len(queries),
+            },
+        )
+        if cached_response is not None:
+            logger.info(f"Response cache hit for {len(queries)} queries, stats: {response_cache.stats()}")
+            for event in _cached_response_events(cached_response):
+                yield event
+            return
+
+    degraded = not is_available("completion", model)
+    if degraded:
+        logger.warning(f"LLM calls to {model} are failing, searching without query expansion and summary")
+        use_query_expansion = False
+        return_digest_summary = False
+
+    expanded_queries, _, _, combined_results, deadline_exceeded = await _hybrid_search(
+        queries=queries,
+        client=client,
+        collection_limits=collection_limits,
+        vector_names={collection_names[0]: vector_names} if vector_names is not None else None,
+        model=model,
+        deadline=deadline,
+        use_query_expansion=use_query_expansion,
+        embedding_model=embedding_model,
+        local_index_path=local_index_path,
+        payload_filter=payload_filter,
+        score_threshold=score_threshold,
+        score_margin=score_margin,
+    )
+
+    if return_digest_summary and any(combined_results):
+        # Fit the results of all queries in the prompt token budget, then rerank and filter the results of each query
+        combined_results = await _pack_and_rerank(
+            queries=queries,
+            results_per_query=combined_results,
+            reranker=reranker,
+            model=model,
+            embedding_model=embedding_model,
+            client=client,
+            collection_name=collection_names[0],
+            context_token_budget=context_token_budget,
+        )
+
+    shared_results_list = _deduplicate_results(combined_results)
+    response: Dict[str, Any] = {
+        "queries": [
+            {
+                "query": q["query"],
+                "context": q["context"],
+                "expanded_queries": expanded,
+                "result_ids": [r.id for r in results],
+            }
+            for q, expanded, results in zip(queries, expanded_queries, combined_results)
+        ],
+    }
+    if return_references:
+        response["search_results"] = [
+            {"id": r.id, "score": r.score, "content": r.content, **r.metadata}
+            for r in shared_results_list
+        ]
+    if degraded:
+        response["degraded"] = DEGRADED_NOTICE
+    yield _references_event(response)
+
+    if return_digest_summary and shared_results_list:
+        logger.info(f"Generating one summary for {len(queries)} queries")
+        summary_parts = []
+        try:
+            async for delta in generate_batch_summary_stream(queries=queries, results=shared_results_list, model=model):
+                summary_parts.append(delta)
+                yield {"type": "summary_delta", "content": delta}
+        except Exception as e:
+            logger.warning(f"Summary generation failed, returning the references: {type(e).__name__}: {str(e)}")
+            degraded = True
+            response["degraded"] = DEGRADED_NOTICE
+        if summary_parts:
+            response["summary"] = "".join(summary_parts).strip()
+
+    # Partial results cut by the deadline or degraded ones are not worth serving to later batches
+    if degraded:
+        record.count("degraded")
+    if response_cache is not None and not deadline_exceeded and not degraded:
+        await _store_response(
+            response_cache,
+            cache_key,
+            query="\n".join(q["query"] for q in queries),
+            context="\n".join(q["context"] for q in queries),
+            response=response,
+        )
+
+    record.count("results", len(shared_results_list))
+    yield {"type": "done", "response": response}
+
+
+def _deduplicate_results(results_per_query: List[List[SearchResult]]) -> List[SearchResult]:
+    """Results of several queries, once per ID with its best score, sorted by score."""
+    shared_results: Dict[str, SearchResult] = {}
+    for results in results_per_query:
+        for r in results:
+            if r.id not in shared_results or r.score > shared_results[r.id].score:
+                shared_results[r.id] = r
+    return sorted(shared_results.values(), key=lambda x: x.score, reverse=True)
+
+
+async def search_batch(
+    queries: List[Dict[str, Any]],
+    qdrant_url: str,
+    collection_name: Union[str, List[str]],
+    **kwargs,
+) -> Dict[str, Any]:
+    """Search several queries at once. Thin collector over `search_batch_stream()`.
+
+    Args:
+        queries: List of {"query", "context", "keywords" (optional)} dictionaries
+        qdrant_url: Qdrant URL
+        collection_name: Name of collection to search, or names of several collections
+        **kwargs: Other `search_batch_stream()` arguments
+
+    Returns:
+        Dictionary containing:
+        - queries: List of {"query", "context", "expanded_queries", "result_ids"} per query
+        - search_results: Deduplicated search results of all queries (if return_references=True)
+        - summary: One summary answering all queries (if return_digest_summary=True)
+    """
+    response: Dict[str, Any] = {}
+    async for event in search_batch_stream(
+        queries=queries,
+        qdrant_url=qdrant_url,
+        collection_name=collection_name,
+        **kwargs,
+    ):
+        if event["type"] == "done":
+            response = event["response"]
     return response
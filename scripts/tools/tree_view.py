@@ -0,0 +1,212 @@
+import os
+import re
+import fnmatch
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from .file_reader import format_size
+from .file_search import IgnoreRules
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_MAX_ENTRIES = 50
+# Bound on the output, whatever the size of the tree
+DEFAULT_MAX_LINES = 500
+# Minimum number of numbered siblings collapsed into a single line
+MIN_RUN_LENGTH = 4
+
+# Last run of digits of a name, e.g. frame_00042.tif -> ("frame_", "00042", ".tif")
+NUMBERED_NAME = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+@dataclass
+class TreeEntry:
+    name: str
+    path: str
+    is_dir: bool
+    size: int
+    ignored: bool = False
+
+
+def scan_entries(directory: str, rules: IgnoreRules) -> List[TreeEntry]:
+    """Entries of a directory with `os.scandir`, flagging the ones matched by the ignore rules."""
+    entries = []
+    with os.scandir(directory) as it:
+        for dir_entry in it:
+            try:
+                is_dir = dir_entry.is_dir(follow_symlinks=False)
+                size = 0 if is_dir else dir_entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            entries.append(
+                TreeEntry(
+                    name=dir_entry.name,
+                    path=dir_entry.path,
+                    is_dir=is_dir,
+                    size=size,
+                    ignored=rules.is_ignored(dir_entry.path, is_dir=is_dir),
+                )
+            )
+    return entries
+
+
+def run_label(entries: List[TreeEntry]) -> str:
+    """Label of a run of numbered siblings sorted by number, e.g. `frame_{00000..19999}.tif`."""
+    prefix, first, suffix = NUMBERED_NAME.match(entries[0].name).groups()
+    last = NUMBERED_NAME.match(entries[-1].name).group(2)
+    return f"{prefix}{{{first}..{last}}}{suffix}"
+
+
+def collapse_runs(entries: List[TreeEntry]) -> List[Tuple[str, List[TreeEntry]]]:
+    """
+    Group the numbered siblings sharing a prefix and a suffix, e.g. frame_00000.tif to frame_19999.tif.
+
+    Args:
+        entries: Entries of a directory, sorted by name
+
+    Returns:
+        List of (label, entries), directories first and then in name order: the name of single entries, and a
+        `frame_{00000..19999}.tif` label for runs of at least MIN_RUN_LENGTH entries
+    """
+    groups: "OrderedDict[tuple, List[Tuple[int, str, TreeEntry]]]" = OrderedDict()
+    for entry in entries:
+        match = NUMBERED_NAME.match(entry.name)
+        if match is None:
+            groups[("", entry.name, entry.is_dir, entry.ignored, None)] = [(0, "", entry)]
+            continue
+        prefix, digits, suffix = match.groups()
+        groups.setdefault((prefix, suffix, entry.is_dir, entry.ignored, True), []).append((int(digits), digits, entry))
+
+    collapsed = []
+    for (prefix, suffix, _, _, numbered), members in groups.items():
+        if not numbered or len(members) < MIN_RUN_LENGTH:
+            collapsed.extend((entry.name, [entry]) for _, _, entry in members)
+            continue
+        members.sort(key=lambda m: m[0])
+        run = [entry for _, _, entry in members]
+        collapsed.append((run_label(run), run))
+    # Directories first, so that the entry caps do not hide them behind files
+    collapsed.sort(key=lambda group: (not group[1][0].is_dir, group[1][0].name))
+    return collapsed
+
+
+def render_tree(
+    root: str,
+    list_entries: Optional[Callable[[str], List[TreeEntry]]] = None,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    max_lines: int = DEFAULT_MAX_LINES,
+    ignore_patterns: Optional[List[str]] = None,
+    show_hidden: bool = True,
+) -> str:
+    """
+    Render the tree of a directory, in bounded size whatever the number of files.
+
+    - numbered sibling files are collapsed into one line, e.g. `frame_{00000..19999}.tif (20000 files, 38.0 GB)`
+    - of numbered sibling directories, the first one is shown with its contents and the others on
+      one line, e.g. `sub-01/` followed by `sub-{02..10}/ (9 more directories)`, so the layout of
+      each subject or session stays visible
+    - directories below `max_depth` and ignored directories (e.g. .git) are shown with their
+      number of entries, without their contents, and ignored files (e.g. `*.nwb` outputs matched
+      by a .gitignore) are marked as such
+    - at most `max_entries` lines are shown per directory, and `max_lines` in total
+
+    Args:
+        root: Directory to render
+        list_entries: Function listing the entries of a directory, e.g. from the file index.
+            Defaults to `os.scandir` with the ignore rules of `file_search`
+        max_depth: Number of directory levels shown below the root
+        max_entries: Maximum number of lines per directory
+        max_lines: Maximum number of lines of the whole tree
+        ignore_patterns: Additional glob patterns of names to leave out
+        show_hidden: Whether to show the files and directories starting with a dot
+
+    Returns:
+        The tree
+    """
+    root = os.path.abspath(root)
+    if list_entries is None:
+        rules = {root: IgnoreRules.default(root).extended(root)}
+
+        def list_entries(directory: str) -> List[TreeEntry]:
+            directory_rules = rules.pop(directory, None) or IgnoreRules.default(root).extended(directory)
+            entries = scan_entries(directory, directory_rules)
+            for entry in entries:
+                if entry.is_dir and not entry.ignored:
+                    rules[entry.path] = directory_rules.extended(entry.path)
+            return entries
+
+    def visible(directory: str) -> List[TreeEntry]:
+        entries = [
+            entry for entry in list_entries(directory)
+            if (show_hidden or not entry.name.startswith("."))
+            and not any(fnmatch.fnmatch(entry.name, p) for p in ignore_patterns or [])
+        ]
+        return sorted(entries, key=lambda e: e.name)
+
+    def count_entries(directory: str) -> str:
+        try:
+            return f"{len(list_entries(directory))} entries"
+        except OSError:
+            return "unreadable"
+
+    lines = [os.path.basename(root) + "/"]
+    truncated = False
+
+    def render_directory(entry: TreeEntry, label: str, prefix: str, connector: str, last: bool, depth: int) -> None:
+        if entry.ignored:
+            lines.append(f"{prefix}{connector}{label}/ (ignored, {count_entries(entry.path)})")
+        elif depth >= max_depth:
+            lines.append(f"{prefix}{connector}{label}/ ({count_entries(entry.path)})")
+        else:
+            lines.append(f"{prefix}{connector}{label}/")
+            render(entry.path, prefix + ("    " if last else "│   "), depth + 1)
+
+    def render(directory: str, prefix: str, depth: int) -> None:
+        nonlocal truncated
+        try:
+            groups = collapse_runs(visible(directory))
+        except OSError as e:
+            lines.append(f"{prefix}└── (unreadable: {e.strerror})")
+            return
+        shown = groups[:max_entries]
+        hidden = groups[max_entries:]
+        for i, (label, members) in enumerate(shown):
+            if len(lines) >= max_lines:
+                truncated = True
+                return
+            last = i == len(shown) - 1 and not hidden
+            connector = "└── " if last else "├── "
+            entry = members[0]
+            if len(members) > 1 and entry.is_dir:
+                render_directory(entry, entry.name, prefix, "├── ", False, depth)
+                if len(lines) >= max_lines:
+                    truncated = True
+                    return
+                lines.append(f"{prefix}{connector}{run_label(members[1:])}/ ({len(members) - 1} more directories)")
+            elif len(members) > 1:
+                size = format_size(sum(m.size for m in members))
+                marker = ", ignored" if entry.ignored else ""
+                lines.append(f"{prefix}{connector}{label} ({len(members)} files, {size}{marker})")
+            elif entry.is_dir:
+                render_directory(entry, label, prefix, connector, last, depth)
+            else:
+                marker = ", ignored" if entry.ignored else ""
+                lines.append(f"{prefix}{connector}{label} ({format_size(entry.size)}{marker})")
+        if hidden and len(lines) < max_lines:
+            files = [m for _, members in hidden for m in members if not m.is_dir]
+            directories = sum(1 for _, members in hidden for m in members if m.is_dir)
+            lines.append(
+                f"{prefix}└── ... {len(hidden)} more: {len(files)} files "
+                f"({format_size(sum(f.size for f in files))}) and {directories} directories"
+            )
+
+    render(root, "", 1)
+    if truncated:
+        lines.append(f"... stopped at {max_lines} lines: view a subdirectory or lower max_depth")
+    return "\n".join(lines)
@@ -15,7 +15,10 @@
 # limitations under the License.
 import os
 import re
+import queue
+import uuid
 import shutil
+import threading
 from typing import Optional
 
 from smolagents.agent_types import AgentAudio, AgentImage, AgentText
@@ -23,6 +26,8 @@ from smolagents.agents import MultiStepAgent, PlanningStep
 from smolagents.memory import ActionStep, FinalAnswerStep, MemoryStep
 from smolagents.utils import _is_package_available
 
+from utils.run_context import current_run_id
+
 
 def get_step_footnote_content(step_log: MemoryStep, step_name: str) -> str:
     """Get a footnote string for a step log with duration and token information"""
@@ -157,29 +162,104 @@ def pull_messages_from_step(
         raise ValueError(f"Unsupported step type: {type(step_log)}")
 
 
+def format_specialist_references(event: dict) -> str:
+    """Format the references event streamed by the NeuroConv specialist tool as markdown."""
+    lines = []
+    for r in event.get("search_results", []):
+        lines.append(f"- `{r.get('file') or r.get('id')}` (score: {r.get('score', 0):.3f})")
+    return "\n".join(lines) if lines else "No references found."
+
+
 def stream_to_gradio(
     agent,
     task: str,
     reset_agent_memory: bool = False,
     additional_args: Optional[dict] = None,
 ):
-    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages."""
-    total_input_tokens = 0
-    total_output_tokens = 0
+    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages.
+
+    The agent runs in a background thread so that events streamed by tools while a step is still
+    running (e.g. the NeuroConv specialist references and summary tokens) are shown right away.
+    The streamed summary is yielded as the same ChatMessage object with growing content.
+
+    Tools are shared by the sessions of the UI, so each run has its own id: tool events are tagged
+    with the id of the run that called the tool, and the listener of a run drops the others. When
+    the generator is closed (e.g. with the stop button), the agent is interrupted after its current step.
+    """
+    import gradio as gr
+
+    events = queue.Queue()
+    run_id = uuid.uuid4().hex
+
+    def on_tool_event(event: dict):
+        if event.get("run_id") == run_id:
+            events.put(("tool_event", event))
 
-    for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
-        # Track tokens if model provides them
-        if getattr(agent.model, "last_input_token_count", None) is not None:
-            total_input_tokens += agent.model.last_input_token_count
-            total_output_tokens += agent.model.last_output_token_count
-            if isinstance(step_log, (ActionStep, PlanningStep)):
-                step_log.input_token_count = agent.model.last_input_token_count
-                step_log.output_token_count = agent.model.last_output_token_count
+    streaming_tools = [tool for tool in agent.tools.values() if hasattr(tool, "add_stream_listener")]
+    for tool in streaming_tools:
+        tool.add_stream_listener(on_tool_event)
 
-        for message in pull_messages_from_step(
-            step_log,
-        ):
-            yield message
+    def run_agent():
+        current_run_id.set(run_id)
+        try:
+            for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
+                # Track tokens if model provides them
+                if getattr(agent.model, "last_input_token_count", None) is not None:
+                    if isinstance(step_log, (ActionStep, PlanningStep)):
+                        step_log.input_token_count = agent.model.last_input_token_count
+                        step_log.output_token_count = agent.model.last_output_token_count
+                events.put(("step", step_log))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            events.put(("end", None))
+
+    agent_thread = threading.Thread(target=run_agent, daemon=True)
+    agent_thread.start()
+
+    summary_message = None
+    try:
+        while True:
+            kind, payload = events.get()
+            if kind == "end":
+                break
+            if kind == "error":
+                raise payload
+            if kind == "step":
+                summary_message = None
+                for message in pull_messages_from_step(
+                    payload,
+                ):
+                    yield message
+                continue
+
+            # Streamed tool events
+            if payload["type"] == "references":
+                summary_message = None
+                yield gr.ChatMessage(
+                    role="assistant",
+                    content=format_specialist_references(payload),
+                    metadata={"title": "📚 NeuroConv specialist references", "status": "done"},
+                )
+            elif payload["type"] == "summary_delta":
+                if summary_message is None:
+                    summary_message = gr.ChatMessage(
+                        role="assistant",
+                        content="",
+                        metadata={"title": "🧠 NeuroConv specialist summary", "status": "pending"},
+                    )
+                summary_message.content += payload["content"]
+                yield summary_message
+            elif payload["type"] == "done" and summary_message is not None:
+                summary_message.metadata["status"] = "done"
+                yield summary_message
+                summary_message = None
+    finally:
+        for tool in streaming_tools:
+            tool.remove_stream_listener(on_tool_event)
+        if agent_thread.is_alive():
+            # Closed before the end of the run: stop the agent instead of letting it run unobserved
+            agent.interrupt()
 
 
 class GradioUI:
@@ -210,7 +290,9 @@ class GradioUI:
             yield messages
 
             for msg in stream_to_gradio(session_state["agent"], task=prompt, reset_agent_memory=False):
-                messages.append(msg)
+                # Streamed messages are yielded again with updated content, only append them once
+                if not messages or messages[-1] is not msg:
+                    messages.append(msg)
                 yield messages
 
             yield messages
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundEventLoop:
+    """An asyncio event loop running forever in a daemon thread.
+
+    Synchronous code (e.g. a smolagents Tool.forward) can submit coroutines to it with `run()`.
+    Because the loop outlives each call, async clients created on it (Qdrant, litellm/httpx
+    connection pools) keep their connections alive between calls.
+    """
+
+    def __init__(self, name: str = "background-event-loop"):
+        """
+        Start the event loop thread.
+
+        Args:
+            name: Name of the thread running the loop
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the background loop and block until it completes.
+
+        Args:
+            coro: Coroutine to run
+            timeout: Maximum number of seconds to wait for the result
+
+        Returns:
+            The coroutine result
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def submit(self, coro: Coroutine) -> "asyncio.Future":
+        """Schedule a coroutine on the background loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self) -> None:
+        """Stop the event loop and wait for its thread to finish."""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self.loop.close()
@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_EMBEDDING_CACHE_PATH = "/home/agent_workspace/cache/embeddings.sqlite3"
+
+
+class EmbeddingCache:
+    """On-disk LRU cache of embedding vectors, keyed by (model, text hash).
+
+    Vectors are stored as float32 blobs in a SQLite database so they survive process and
+    container restarts. When the number of entries exceeds `max_entries`, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_EMBEDDING_CACHE_PATH,
+        max_entries: int = 20000,
+    ):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            path: Path to the SQLite database file
+            max_entries: Maximum number of cached embeddings before LRU eviction
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Build the cache key for a (model, text) pair."""
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up cached embeddings for a list of texts.
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            Dictionary mapping each cached text to its embedding. Missing texts are omitted.
+        """
+        keys = {self.make_key(model, t): t for t in dict.fromkeys(texts)}
+        if not keys:
+            return {}
+
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, self.make_key(model, t)) for t in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]) -> None:
+        """
+        Store embeddings in the cache, evicting least recently used entries if needed.
+
+        Args:
+            model: Embedding model name
+            embeddings: Dictionary mapping texts to their embeddings
+        """
+        if not embeddings:
+            return
+
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), model, array("f", vector).tobytes(), now)
+            for text, vector in embeddings.items()
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._size += self._conn.total_changes - before
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Evict least recently used entries above `max_entries`. Caller must hold the lock."""
+        if self._size <= self.max_entries:
+            return
+        # INSERT OR REPLACE may have overcounted replaced rows, so recount before evicting
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._size - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,),
+        )
+        self._size -= excess
+        self.evictions += excess
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and the current number of entries."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self._size,
+        }
+
+    def clear(self) -> None:
+        """Remove all cached embeddings."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+# Set when the cache could not be opened: caching stays off for the rest of the process
+_embedding_cache_failed = False
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the process-wide embedding cache, creating it on first use.
+
+    Environment variables used:
+    - EMBEDDING_CACHE_ENABLED: set to 'false' to disable the cache (defaults to 'true')
+    - EMBEDDING_CACHE_PATH: path to the SQLite database file
+    - EMBEDDING_CACHE_MAX_ENTRIES: maximum number of cached embeddings (defaults to 20000)
+
+    Returns:
+        The shared EmbeddingCache, or None if caching is disabled or the cache could not be opened
+    """
+    global _embedding_cache, _embedding_cache_failed
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None and not _embedding_cache_failed:
+            path = os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_EMBEDDING_CACHE_PATH)
+            try:
+                _embedding_cache = EmbeddingCache(
+                    path=path,
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000")),
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding cache disabled, failed to open {path}: {str(e)}")
+                _embedding_cache_failed = True
+    return _embedding_cache
@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+
+DEFAULT_METRICS_PATH = "/home/agent_workspace/logs/search_metrics.jsonl"
+# Size above which the metrics file is rotated to `<path>.1`, replacing the previous rotated file
+DEFAULT_METRICS_MAX_BYTES = 50 * 1024 * 1024
+
+# ID and name of the stage currently running, so that nested stages of one search share a request ID
+_current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_request_id", default=None)
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_stage", default=None)
+# Record of the stream stage whose generator is running, see `stream_stage`
+_current_stream_record: contextvars.ContextVar[Optional["StageRecord"]] = contextvars.ContextVar(
+    "metrics_stream_record", default=None
+)
+
+
+class StageRecord:
+    """Counters and attributes of one stage run, filled in by the instrumented code."""
+
+    def __init__(self, name: str, request_id: str, parent: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.request_id = request_id
+        self.parent = parent
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.error: Optional[str] = None
+        self.duration_ms: float = 0.0
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Increment a counter, e.g. `remote_calls`, `cache_hits` or `completion_tokens`."""
+        self.counters[name] += value
+
+    def set(self, **attributes: Any) -> None:
+        """Set attributes of the stage, e.g. `results=10`."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": time.time(),
+            "request_id": self.request_id,
+            "stage": self.name,
+            "parent": self.parent,
+            "duration_ms": round(self.duration_ms, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+            "counters": dict(self.counters),
+        }
+
+
+class MetricsRecorder:
+    """Records per-stage latency and counters of the search pipeline.
+
+    Stages are sent as OpenTelemetry spans when `TELEMETRY_ENABLED` is set (the tracer provider
+    is configured by `utils.telemetry.set_telemetry`), and appended to a local JSONL file otherwise.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_METRICS_PATH,
+        enabled: bool = True,
+        use_opentelemetry: bool = False,
+        max_bytes: Optional[int] = DEFAULT_METRICS_MAX_BYTES,
+    ):
+        """
+        Args:
+            path: JSONL file the stage records are appended to, when not using OpenTelemetry
+            enabled: Whether to record anything
+            use_opentelemetry: Whether to send the stages as OpenTelemetry spans instead
+            max_bytes: Size above which the file is rotated to `<path>.1`, None to never rotate
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.use_opentelemetry = use_opentelemetry
+        self._lock = threading.Lock()
+        self._tracer = None
+        if enabled and use_opentelemetry:
+            from opentelemetry import trace
+
+            self._tracer = trace.get_tracer("semantic_search")
+        elif enabled:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name: str, **attributes: Any) -> Iterator[StageRecord]:
+        """
+        Time a pipeline stage.
+
+        The stage sets context variables until it exits, so it must not span the yields of a
+        generator: use `stream_stage` for async generators.
+
+        Args:
+            name: Stage name, e.g. "embedding" or "vector_search"
+            **attributes: Attributes known when the stage starts
+
+        Yields:
+            The stage record, to add counters and attributes to
+        """
+        request_id = _current_request_id.get() or uuid.uuid4().hex[:12]
+        record = StageRecord(name=name, request_id=request_id, parent=_current_stage.get(), attributes=attributes)
+        if not self.enabled:
+            yield record
+            return
+
+        request_token = _current_request_id.set(request_id)
+        stage_token = _current_stage.set(name)
+        span_cm = self._tracer.start_as_current_span(f"semantic_search.{name}") if self._tracer else None
+        span = span_cm.__enter__() if span_cm else None
+        start_time = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.duration_ms = (time.perf_counter() - start_time) * 1000
+            _current_stage.reset(stage_token)
+            _current_request_id.reset(request_token)
+            try:
+                if span is not None:
+                    self._set_span_attributes(span, record)
+                    span_cm.__exit__(None, None, None)
+                else:
+                    self._write(record)
+            except Exception:
+                # Metrics must never break a search
+                pass
+
+    async def stream_stage(self, name: str, events: AsyncIterator[Any], **attributes: Any) -> AsyncIterator[Any]:
+        """
+        Time a pipeline stage run by an async generator, e.g. a streamed search.
+
+        Only the time spent producing each item is timed, not the time the consumer takes
+        between items. The context variables of the stage are set while the generator runs and
+        reset before each item is yielded, so the generator can be closed from any context.
+        The generator gets the stage record with `current_stream_record()`.
+
+        Args:
+            name: Stage name, e.g. "search"
+            events: Async generator to run, not started yet
+            **attributes: Attributes known when the stage starts
+
+        Yields:
+            The items of the generator
+        """
+        request_id = _current_request_id.get() or uuid.uuid4().hex[:12]
+        record = StageRecord(name=name, request_id=request_id, parent=_current_stage.get(), attributes=attributes)
+        span = self._tracer.start_span(f"semantic_search.{name}") if self.enabled and self._tracer else None
+
+        @contextmanager
+        def running() -> Iterator[None]:
+            tokens = (
+                _current_request_id.set(request_id),
+                _current_stage.set(name),
+                _current_stream_record.set(record),
+            )
+            span_cm = None
+            if span is not None:
+                from opentelemetry import trace
+
+                span_cm = trace.use_span(span, end_on_exit=False)
+                span_cm.__enter__()
+            start_time = time.perf_counter()
+            try:
+                yield
+            finally:
+                record.duration_ms += (time.perf_counter() - start_time) * 1000
+                if span_cm is not None:
+                    span_cm.__exit__(None, None, None)
+                for var, token in zip((_current_request_id, _current_stage, _current_stream_record), tokens):
+                    var.reset(token)
+
+        try:
+            while True:
+                with running():
+                    try:
+                        item = await events.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield item
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            with running():
+                await events.aclose()
+            if self.enabled:
+                try:
+                    if span is not None:
+                        self._set_span_attributes(span, record)
+                        span.end()
+                    else:
+                        self._write(record)
+                except Exception:
+                    # Metrics must never break a search
+                    pass
+
+    @staticmethod
+    def _set_span_attributes(span: Any, record: StageRecord) -> None:
+        span.set_attribute("request_id", record.request_id)
+        span.set_attribute("duration_ms", record.duration_ms)
+        for key, value in {**record.attributes, **record.counters}.items():
+            if isinstance(value, (str, bool, int, float)):
+                span.set_attribute(key, value)
+            else:
+                span.set_attribute(key, json.dumps(value, default=str))
+        if record.error:
+            span.set_attribute("error", record.error)
+
+    def _write(self, record: StageRecord) -> None:
+        line = json.dumps(record.to_dict(), default=str)
+        with self._lock:
+            if self.max_bytes is not None and self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+                os.replace(self.path, rotated_path(self.path))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def rotated_path(path: Union[str, Path]) -> Path:
+    """Path the metrics file is rotated to when it reaches its maximum size."""
+    path = Path(path)
+    return path.with_name(path.name + ".1")
+
+
+_metrics: Optional[MetricsRecorder] = None
+
+
+def get_metrics() -> MetricsRecorder:
+    """Return the process-wide metrics recorder, configured from environment variables.
+
+    - TELEMETRY_ENABLED: "true" to send stages as OpenTelemetry spans
+    - SEARCH_METRICS_ENABLED: "false" to disable stage recording
+    - SEARCH_METRICS_PATH: JSONL file used when telemetry is disabled
+    - SEARCH_METRICS_MAX_BYTES: size above which the JSONL file is rotated (defaults to 50 MB, 0 to never rotate)
+    """
+    global _metrics
+    if _metrics is None:
+        enabled = os.getenv("SEARCH_METRICS_ENABLED", "true").lower() == "true"
+        use_opentelemetry = os.getenv("TELEMETRY_ENABLED", "false").lower() == "true"
+        try:
+            _metrics = MetricsRecorder(
+                path=os.getenv("SEARCH_METRICS_PATH", DEFAULT_METRICS_PATH),
+                enabled=enabled,
+                use_opentelemetry=use_opentelemetry,
+                max_bytes=int(os.getenv("SEARCH_METRICS_MAX_BYTES", str(DEFAULT_METRICS_MAX_BYTES))) or None,
+            )
+        except Exception:
+            _metrics = MetricsRecorder(enabled=False)
+    return _metrics
+
+
+def set_metrics(recorder: MetricsRecorder) -> None:
+    """Replace the process-wide metrics recorder, e.g. to collect the stages of a benchmark run."""
+    global _metrics
+    _metrics = recorder
+
+
+def stage(name: str, **attributes: Any):
+    """Time a pipeline stage with the process-wide metrics recorder. See `MetricsRecorder.stage`."""
+    return get_metrics().stage(name, **attributes)
+
+
+def stream_stage(name: str, attributes: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+    """
+    Decorate an async generator function to time it as a stage. See `MetricsRecorder.stream_stage`.
+
+    Args:
+        name: Stage name
+        attributes: Function returning the stage attributes from the bound arguments of the call
+
+    Returns:
+        The decorator
+    """
+    def decorator(function: Callable[..., AsyncIterator[Any]]) -> Callable[..., AsyncIterator[Any]]:
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+            stage_attributes = {}
+            if attributes is not None:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                stage_attributes = attributes(bound.arguments)
+            return get_metrics().stream_stage(name, function(*args, **kwargs), **stage_attributes)
+
+        return wrapper
+
+    return decorator
+
+
+def current_stream_record() -> StageRecord:
+    """Record of the stream stage running the calling generator, see `stream_stage`."""
+    record = _current_stream_record.get()
+    if record is None:
+        raise RuntimeError("current_stream_record() called outside of a stream stage")
+    return record
+
+
+def record_usage(record: StageRecord, usage: Any) -> None:
+    """Add the token counts of a litellm response `usage` to a stage record."""
+    if usage is None:
+        return
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, key, None)
+        if value is None and isinstance(usage, dict):
+            value = usage.get(key)
+        if value:
+            record.count(key, value)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the q-th percentile (0-100) of values, with linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Summarize stage records per stage.
+
+    Args:
+        records: Stage records, as written to the JSONL metrics file
+
+    Returns:
+        Dictionary of stage name to count, errors, p50/p95/mean latency (ms) and mean counters per run
+    """
+    by_stage: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for record in records:
+        by_stage[record["stage"]].append(record)
+
+    summary = {}
+    for name, stage_records in by_stage.items():
+        durations = [r["duration_ms"] for r in stage_records]
+        counters: Dict[str, float] = defaultdict(float)
+        for r in stage_records:
+            for key, value in r.get("counters", {}).items():
+                counters[key] += value
+        summary[name] = {
+            "count": len(stage_records),
+            "errors": sum(1 for r in stage_records if r.get("error")),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "mean_ms": sum(durations) / len(durations),
+            **{f"mean_{key}": value / len(stage_records) for key, value in sorted(counters.items())},
+        }
+    return summary
+
+
+def load_records(path: Union[str, Path] = DEFAULT_METRICS_PATH, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Load stage records from a JSONL metrics file and its rotated file, optionally only those recorded after `since` (epoch seconds).
+
+    Missing files (e.g. before the first search) are skipped.
+    """
+    records = []
+    for file_path in (rotated_path(path), Path(path)):
+        if not file_path.exists():
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if since is None or record["timestamp"] >= since:
+                    records.append(record)
+    return records
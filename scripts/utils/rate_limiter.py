@@ -0,0 +1,285 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from utils.metrics import StageRecord
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+# HTTP statuses worth retrying: request timeout, rate limit and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# litellm/openai exception classes without a status code that are worth retrying
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+    "InternalServerError",
+}
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter, shared by the threads and event loops of the process.
+
+    Callers reserve a token and sleep until it is available, so concurrent callers are served
+    in order without polling. Tokens can go negative: each reservation pushes back the next one.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            requests_per_minute: Sustained request rate
+            capacity: Maximum burst of requests, defaults to 10 seconds worth of requests
+        """
+        self.rate = requests_per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens, returning the number of seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Wait for tokens to be available, returning the number of seconds waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all callers for `seconds`, e.g. after the provider returned a rate limit error."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for a while, then lets a single probe call through.
+
+    - closed: calls go through, consecutive failures are counted
+    - open: calls are rejected until `recovery_time` has passed since the last failure
+    - half-open: one probe call goes through, closing the circuit on success and reopening it on failure
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0):
+        """
+        Args:
+            failure_threshold: Number of consecutive failed calls (after retries) opening the circuit
+            recovery_time: Seconds after which an open circuit lets a probe call through
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.recovery_time:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a call may go through now. In the half-open state, only one probe call is allowed."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.recovery_time:
+                return False
+            # A probe that never reported back (e.g. cancelled) does not block the circuit forever
+            if self._probe_started_at is not None and now - self._probe_started_at < self.recovery_time:
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_started_at = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+_limiters: Dict[Tuple[str, str, str], TokenBucket] = {}
+_breakers: Dict[Tuple[str, str, str], CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def _key(kind: str, model: str) -> Tuple[str, str, str]:
+    provider = model.split("/", 1)[0] if "/" in model else "default"
+    return kind, provider, model
+
+
+def get_rate_limiter(kind: str, model: str) -> Optional[TokenBucket]:
+    """Return the process-wide rate limiter of a call kind and model, None if rate limiting is disabled.
+
+    - LLM_RATE_LIMIT_RPM: completion requests per minute per provider and model (default 120, 0 disables)
+    - EMBEDDING_RATE_LIMIT_RPM: embedding requests per minute per provider and model (default 600, 0 disables)
+
+    Args:
+        kind: "completion" or "embedding"
+        model: litellm model name, e.g. "openrouter/openai/o3-mini"
+    """
+    env_var, default = ("EMBEDDING_RATE_LIMIT_RPM", "600") if kind == "embedding" else ("LLM_RATE_LIMIT_RPM", "120")
+    requests_per_minute = float(os.getenv(env_var, default))
+    if requests_per_minute <= 0:
+        return None
+    with _registry_lock:
+        key = _key(kind, model)
+        if key not in _limiters:
+            _limiters[key] = TokenBucket(requests_per_minute=requests_per_minute)
+        return _limiters[key]
+
+
+def get_circuit_breaker(kind: str, model: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker of a call kind and model.
+
+    - LLM_CIRCUIT_FAILURE_THRESHOLD: consecutive failed calls opening the circuit (default 5)
+    - LLM_CIRCUIT_RECOVERY_SECONDS: seconds before a probe call is let through (default 30)
+
+    Args:
+        kind: "completion" or "embedding"
+        model: litellm model name
+    """
+    with _registry_lock:
+        key = _key(kind, model)
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+                recovery_time=float(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", "30")),
+            )
+        return _breakers[key]
+
+
+def is_available(kind: str, model: str) -> bool:
+    """Whether calls of a kind to a model are currently let through by its circuit breaker."""
+    return get_circuit_breaker(kind, model).state != "open"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is transient: rate limit, timeout, connection or server error."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Delay requested by the provider in the `Retry-After` header of a rate limit error, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers and headers.get("retry-after") else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_with_limits(
+    kind: str,
+    model: str,
+    fn: Callable[..., Awaitable[T]],
+    /,
+    *args: Any,
+    record: Optional[StageRecord] = None,
+    max_retries: Optional[int] = None,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+    **kwargs: Any,
+) -> T:
+    """
+    Call a provider API through its rate limiter, retrying transient errors with jittered
+    exponential backoff, behind its circuit breaker.
+
+    Args:
+        kind: "completion" or "embedding"
+        model: litellm model name, selecting the rate limiter and circuit breaker
+        fn: Async function to call, e.g. `litellm.acompletion`
+        *args: Positional arguments of `fn`
+        record: Optional metrics stage record receiving the `throttle_ms`, `retries`, `backoff_ms`
+            and `circuit_open` counters
+        max_retries: Number of retries of transient errors, defaults to LLM_MAX_RETRIES (3)
+        base_delay: Backoff delay of the first retry, doubled at each retry
+        max_delay: Maximum backoff delay
+        **kwargs: Keyword arguments of `fn`, which may include `model`
+
+    Returns:
+        The result of `fn`
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the provider and model is open
+    """
+    if max_retries is None:
+        max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    limiter = get_rate_limiter(kind, model)
+    breaker = get_circuit_breaker(kind, model)
+    if not breaker.allow():
+        if record is not None:
+            record.count("circuit_open")
+        raise CircuitOpenError(f"Circuit breaker open for {kind} calls to {model}, not calling the provider")
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            waited = await limiter.acquire()
+            if waited and record is not None:
+                record.count("throttle_ms", waited * 1000)
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                # The provider answered, e.g. a bad request: not a sign of an unhealthy provider
+                breaker.record_success()
+                raise
+            if attempt == max_retries:
+                breaker.record_failure()
+                raise
+            # Full jitter keeps concurrent retries from hitting the provider in lockstep
+            delay = _retry_after(e) or random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if limiter is not None and getattr(e, "status_code", None) == 429:
+                limiter.pause(delay)
+            if record is not None:
+                record.count("retries")
+                record.count("backoff_ms", delay * 1000)
+            logger.warning(
+                f"{kind} call to {model} failed ({type(e).__name__}: {str(e)[:200]}), "
+                f"retry {attempt + 1}/{max_retries} in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
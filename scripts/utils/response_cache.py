@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+# Configure logging
+from utils.logger import set_logger
+logger = set_logger(__name__)
+
+
+DEFAULT_RESPONSE_CACHE_PATH = "/home/agent_workspace/cache/responses.sqlite3"
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+@dataclass
+class _CacheEntry:
+    id: int
+    scope: str
+    query: str
+    query_vector: np.ndarray
+    context_vector: np.ndarray
+    response: Dict[str, Any]
+    created_at: float
+
+
+@dataclass
+class _ScopeIndex:
+    """Entries of a scope, with their normalized vectors stacked in matrices for a vectorized lookup."""
+
+    entries: List[_CacheEntry] = field(default_factory=list)
+    _query_matrix: Optional[np.ndarray] = None
+    _context_matrix: Optional[np.ndarray] = None
+
+    def add(self, entry: _CacheEntry) -> None:
+        self.entries.append(entry)
+        self._query_matrix = self._context_matrix = None
+
+    def remove(self, ids: set) -> None:
+        self.entries = [e for e in self.entries if e.id not in ids]
+        self._query_matrix = self._context_matrix = None
+
+    def matrices(self) -> tuple:
+        """Query and context matrices of shape (n_entries, dim), rebuilt after changes."""
+        if self._query_matrix is None:
+            self._query_matrix = np.stack([e.query_vector for e in self.entries])
+            self._context_matrix = np.stack([e.context_vector for e in self.entries])
+        return self._query_matrix, self._context_matrix
+
+
+class SemanticResponseCache:
+    """Persistent cache of whole search responses, matched by embedding similarity.
+
+    A new (query, context) pair is served from the cache when a previous entry with the
+    same scope (collection and its version, model and search options) has a query embedding with cosine
+    similarity above `similarity_threshold` and a context embedding with cosine similarity
+    above `context_similarity_threshold`. Entries expire after `ttl` seconds, and the
+    oldest entries are evicted above `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_RESPONSE_CACHE_PATH,
+        similarity_threshold: float = 0.97,
+        context_similarity_threshold: float = 0.9,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        """
+        Initialize the response cache.
+
+        Args:
+            path: Path to the SQLite database file
+            similarity_threshold: Minimum cosine similarity between query embeddings for a hit
+            context_similarity_threshold: Minimum cosine similarity between context embeddings for a hit
+            ttl: Time to live of an entry, in seconds
+            max_entries: Maximum number of cached responses
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.similarity_threshold = similarity_threshold
+        self.context_similarity_threshold = context_similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scope TEXT NOT NULL,
+                query TEXT NOT NULL,
+                context TEXT NOT NULL,
+                query_vector BLOB NOT NULL,
+                context_vector BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope, created_at)")
+        self._conn.commit()
+        self._entries = self._load_entries()
+        self._scopes: Dict[str, _ScopeIndex] = {}
+        for entry in self._entries:
+            self._scopes.setdefault(entry.scope, _ScopeIndex()).add(entry)
+
+    def _load_entries(self) -> List[_CacheEntry]:
+        """Drop expired rows and load the remaining ones in memory, oldest first."""
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, scope, query, query_vector, context_vector, response, created_at "
+            "FROM responses ORDER BY created_at ASC"
+        ).fetchall()
+        return [
+            _CacheEntry(
+                id=row[0],
+                scope=row[1],
+                query=row[2],
+                query_vector=np.frombuffer(row[3], dtype=np.float32),
+                context_vector=np.frombuffer(row[4], dtype=np.float32),
+                response=json.loads(row[5]),
+                created_at=row[6],
+            )
+            for row in rows
+        ]
+
+    def lookup(
+        self,
+        scope: str,
+        query_embedding: List[float],
+        context_embedding: List[float],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find the most similar cached response for a query.
+
+        Only the entries of the scope are compared, with one matrix product per embedding.
+
+        Args:
+            scope: Key identifying the search options the response depends on
+            query_embedding: Embedding of the new query
+            context_embedding: Embedding of the new query context
+
+        Returns:
+            The cached response, or None if no entry is similar enough
+        """
+        query_vector = _normalize(query_embedding)
+        context_vector = _normalize(context_embedding)
+        min_created_at = time.time() - self.ttl
+
+        best_entry, best_score = None, 0.0
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is not None and index.entries:
+                query_matrix, context_matrix = index.matrices()
+                if query_matrix.shape[1] == query_vector.shape[0] and context_matrix.shape[1] == context_vector.shape[0]:
+                    scores = query_matrix @ query_vector
+                    created_at = np.fromiter((e.created_at for e in index.entries), dtype=np.float64, count=len(index.entries))
+                    valid = (
+                        (scores >= self.similarity_threshold)
+                        & (context_matrix @ context_vector >= self.context_similarity_threshold)
+                        & (created_at >= min_created_at)
+                    )
+                    if valid.any():
+                        best = int(np.argmax(np.where(valid, scores, -np.inf)))
+                        best_entry, best_score = index.entries[best], float(scores[best])
+
+            if best_entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return {**best_entry.response, "cache": {"matched_query": best_entry.query, "similarity": best_score}}
+
+    def store(
+        self,
+        scope: str,
+        query: str,
+        context: str,
+        query_embedding: List[float],
+        context_embedding: List[float],
+        response: Dict[str, Any],
+    ) -> None:
+        """
+        Store a response in the cache, evicting the oldest entries above `max_entries`.
+
+        Args:
+            scope: Key identifying the search options the response depends on
+            query: Original query
+            context: Original query context
+            query_embedding: Embedding of the query
+            context_embedding: Embedding of the query context
+            response: Search response to cache
+        """
+        query_vector = _normalize(query_embedding)
+        context_vector = _normalize(context_embedding)
+        created_at = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO responses (scope, query, context, query_vector, context_vector, response, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope,
+                    query,
+                    context,
+                    query_vector.tobytes(),
+                    context_vector.tobytes(),
+                    json.dumps(response),
+                    created_at,
+                ),
+            )
+            entry = _CacheEntry(
+                id=cursor.lastrowid,
+                scope=scope,
+                query=query,
+                query_vector=query_vector,
+                context_vector=context_vector,
+                response=response,
+                created_at=created_at,
+            )
+            self._entries.append(entry)
+            self._scopes.setdefault(scope, _ScopeIndex()).add(entry)
+
+            # Evict expired entries and the oldest ones above the entry cap
+            min_created_at = created_at - self.ttl
+            evicted = [e for e in self._entries if e.created_at < min_created_at]
+            kept = [e for e in self._entries if e.created_at >= min_created_at]
+            if len(kept) > self.max_entries:
+                evicted.extend(kept[:len(kept) - self.max_entries])
+                kept = kept[len(kept) - self.max_entries:]
+            if evicted:
+                self._conn.executemany("DELETE FROM responses WHERE id = ?", [(e.id,) for e in evicted])
+                for evicted_scope in {e.scope for e in evicted}:
+                    self._scopes[evicted_scope].remove({e.id for e in evicted})
+                    if not self._scopes[evicted_scope].entries:
+                        del self._scopes[evicted_scope]
+            self._entries = kept
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current number of entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries = []
+            self._scopes = {}
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+_response_cache_lock = threading.Lock()
+# Set when the cache could not be opened: caching stays off for the rest of the process
+_response_cache_failed = False
+
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """
+    Return the process-wide response cache, creating it on first use.
+
+    Environment variables used:
+    - RESPONSE_CACHE_ENABLED: set to 'false' to disable the cache (defaults to 'true')
+    - RESPONSE_CACHE_PATH: path to the SQLite database file
+    - RESPONSE_CACHE_THRESHOLD: minimum query cosine similarity for a hit (defaults to 0.97)
+    - RESPONSE_CACHE_TTL: time to live of an entry in seconds (defaults to one week)
+    - RESPONSE_CACHE_MAX_ENTRIES: maximum number of cached responses (defaults to 1000)
+
+    Returns:
+        The shared SemanticResponseCache, or None if caching is disabled or the cache could not be opened
+    """
+    global _response_cache, _response_cache_failed
+    if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    with _response_cache_lock:
+        if _response_cache is None and not _response_cache_failed:
+            path = os.getenv("RESPONSE_CACHE_PATH", DEFAULT_RESPONSE_CACHE_PATH)
+            try:
+                _response_cache = SemanticResponseCache(
+                    path=path,
+                    similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.97")),
+                    ttl=float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))),
+                    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Response cache disabled, failed to open {path}: {str(e)}")
+                _response_cache_failed = True
+    return _response_cache
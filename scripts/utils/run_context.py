@@ -0,0 +1,8 @@
+from contextvars import ContextVar
+from typing import Optional
+
+
+# Identifier of the agent run in progress, set by the caller in the thread running the agent. Tools
+# tag the events they stream with it, so that listeners shared by concurrent runs (e.g. one per
+# Gradio session) only handle the events of their own run
+current_run_id: ContextVar[Optional[str]] = ContextVar("current_run_id", default=None)